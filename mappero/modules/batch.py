@@ -0,0 +1,231 @@
+import asyncio
+import collections
+import glob
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mappero.utils.process import CommandRunner
+from mappero.utils.sampler import parse_size
+
+IMAGE_EXTENSIONS = ("jpg", "jpeg", "png")
+
+# margin over the peak memory of the previous run of a workspace
+MEMORY_MARGIN = 1.2
+
+# cpu threads per job when neither the number of jobs nor the threads per job are given
+DEFAULT_THREADS_PER_JOB = 8
+
+Job = collections.namedtuple("Job", ["workspace", "num_images", "memory"])
+
+
+def find_workspaces(patterns, list_path: Path = None) -> list:
+    """workspace directories matching glob patterns or listed in a file, without duplicates."""
+    patterns = list(patterns)
+    if list_path is not None:
+        with open(list_path) as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    workspaces = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(os.path.expanduser(pattern))) or [pattern]:
+            path = Path(path)
+            if not path.is_dir():
+                logger.warning(f"skipping {path}, not a directory")
+            elif path.resolve() not in {p.resolve() for p in workspaces}:
+                workspaces.append(path)
+    return workspaces
+
+
+def count_images(image_path: Path) -> int:
+    """number of images in a directory tree."""
+    return sum(1 for path in image_path.rglob("*") if path.suffix.lower().lstrip(".") in IMAGE_EXTENSIONS)
+
+
+def previous_peak_memory(workspace: Path):
+    """largest peak memory of a stage recorded in the metrics.json of a workspace, None if unknown."""
+    try:
+        with open(workspace / "metrics.json") as f:
+            runs = json.load(f)["runs"]
+    except (OSError, ValueError, KeyError):
+        return None
+    peaks = []
+    for run in runs:
+        for stage in run["stages"]:
+            peaks.append(stage.get("max_rss") or 0)
+            peaks.extend(stage.get("samples", {}).get("rss", []))
+    return max(peaks, default=0) or None
+
+
+def total_memory() -> int:
+    """physical memory of the machine."""
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def order_jobs(jobs: list, policy: str) -> list:
+    """jobs in the order they should start, by number of images for the size policies."""
+    if policy == "largest_first":
+        return sorted(jobs, key=lambda job: job.num_images, reverse=True)
+    if policy == "smallest_first":
+        return sorted(jobs, key=lambda job: job.num_images)
+    return list(jobs)
+
+
+async def run_jobs(jobs: list, commands: list, runner: CommandRunner, threads_per_job: int, timeout: float = None):
+    """run the job commands within the runner budget, returns a result or an exception per job.
+
+    each job is pinned to its own cpus, the processes it starts stay within its threads.
+    """
+    return await asyncio.gather(
+        *(
+            runner.run(
+                cmd,
+                threads=threads_per_job,
+                memory=job.memory,
+                timeout=timeout,
+                check=False,
+                name=job.workspace.name,
+                pin=True,
+            )
+            for job, cmd in zip(jobs, commands)
+        ),
+        return_exceptions=True,
+    )
+
+
+def summarize(jobs: list, outcomes: list) -> dict:
+    """summary of the timings and failures of the jobs."""
+    summary = {"jobs": [], "num_failed": 0}
+    for job, outcome in zip(jobs, outcomes):
+        entry = {"workspace": str(job.workspace), "num_images": job.num_images}
+        if isinstance(outcome, subprocess.TimeoutExpired):
+            entry["status"] = "timeout"
+        elif isinstance(outcome, BaseException):
+            entry["status"] = f"error: {outcome}"
+        else:
+            entry["status"] = "ok" if outcome.returncode == 0 else f"failed ({outcome.returncode})"
+            entry.update(
+                wall_time=outcome.wall_time,
+                cpu_time=outcome.user_time + outcome.system_time,
+                max_rss=outcome.max_rss,
+                start_time=outcome.start_time,
+            )
+        summary["num_failed"] += entry["status"] != "ok"
+        summary["jobs"].append(entry)
+
+    timed = [entry for entry in summary["jobs"] if "wall_time" in entry]
+    if timed:
+        start = min(entry["start_time"] for entry in timed)
+        summary["wall_time"] = max(entry["start_time"] + entry["wall_time"] for entry in timed) - start
+        summary["cpu_time"] = sum(entry["cpu_time"] for entry in timed)
+    return summary
+
+
+def log_summary(summary: dict) -> None:
+    logger.info(f"{'workspace':<32} {'images':>7} {'status':<12} {'wall':>9} {'cpu':>9} {'peak rss':>10}")
+    for entry in summary["jobs"]:
+        line = f"{Path(entry['workspace']).name:<32} {entry['num_images']:>7} {entry['status']:<12}"
+        if "wall_time" in entry:
+            line += f" {entry['wall_time']:>8.1f}s {entry['cpu_time']:>8.1f}s {entry['max_rss'] / 1024**2:>6.0f} MiB"
+        logger.info(line)
+    num_jobs = len(summary["jobs"])
+    message = f"{num_jobs - summary['num_failed']}/{num_jobs} workspaces succeeded"
+    if "wall_time" in summary:
+        message += f" in {summary['wall_time']:.1f}s, {summary['cpu_time']:.1f}s of cpu time"
+    (logger.error if summary["num_failed"] else logger.success)(message)
+
+
+@click.command("run_batch")
+@click.argument("workspaces", nargs=-1)
+@click.option("--list_path", type=click.Path(exists=True), help="file listing one workspace or glob per line.")
+@click.option("--pipeline", type=click.Choice(["colmap", "glomap"]), default="colmap", help="pipeline to run.")
+@click.option("--task", default="sfm", help="task to run in each workspace.")
+@click.option("--config_path", default=None, help="path to the config file, the pipeline default otherwise.")
+@click.option("--num_threads", type=int, default=None, help="total cpu threads, all cpus by default.")
+@click.option("--memory_budget", default=None, help="total memory such as 64G, the physical memory by default.")
+@click.option("--max_jobs", type=int, default=None, help="maximum number of workspaces processed at once.")
+@click.option("--threads_per_job", type=int, default=None, help="cpu threads per workspace.")
+@click.option("--memory_per_job", default=None, help="memory of a workspace without a previous run, such as 16G.")
+@click.option(
+    "--policy",
+    type=click.Choice(["largest_first", "smallest_first", "fifo"]),
+    default="largest_first",
+    help="order in which waiting workspaces start.",
+)
+@click.option("--timeout", type=float, default=None, help="seconds after which a workspace run is stopped.")
+@click.option("--summary_path", type=click.Path(), default=None, help="json file to write the summary to.")
+@click.help_option("--help", "-h")
+def run_batch(
+    workspaces,
+    list_path,
+    pipeline,
+    task,
+    config_path,
+    num_threads,
+    memory_budget,
+    max_jobs,
+    threads_per_job,
+    memory_per_job,
+    policy,
+    timeout,
+    summary_path,
+):
+    """
+    run the colmap or glomap pipeline on many workspaces within a cpu thread and memory budget.
+
+    example:
+    mappero-batch "/data/sites/*" --num_threads 64 --memory_budget 200G --policy largest_first
+    """
+    workspace_paths = find_workspaces(workspaces, list_path)
+    if len(workspace_paths) == 0:
+        logger.error("no workspaces found.")
+        sys.exit(1)
+
+    # budgets
+    num_threads = num_threads or os.cpu_count() or 1
+    memory_budget = parse_size(memory_budget) or total_memory()
+    if max_jobs is None:
+        max_jobs = max(1, num_threads // (threads_per_job or DEFAULT_THREADS_PER_JOB))
+    max_jobs = min(max_jobs, len(workspace_paths))
+    threads_per_job = threads_per_job or max(1, num_threads // max_jobs)
+    memory_per_job = parse_size(memory_per_job) or memory_budget // max_jobs
+
+    # jobs, sized by their images and the peak memory of their previous run
+    jobs = []
+    for workspace in workspace_paths:
+        peak_memory = previous_peak_memory(workspace)
+        memory = int(peak_memory * MEMORY_MARGIN) if peak_memory else memory_per_job
+        jobs.append(Job(workspace, count_images(workspace / "images"), memory))
+    jobs = order_jobs(jobs, policy)
+
+    commands = []
+    for job in jobs:
+        cmd = [sys.executable, "-m", f"mappero.modules.{pipeline}", str(job.workspace), "--task", task]
+        if config_path is not None:
+            cmd += ["--config_path", config_path]
+        cmd += ["--num_threads", str(threads_per_job)]
+        commands.append(cmd)
+
+    logger.info(
+        f"processing {len(jobs)} workspaces, {max_jobs} at once with {threads_per_job} of {num_threads} threads "
+        f"each and {memory_budget / 1024**3:.1f} GiB of memory, {policy}"
+    )
+    runner = CommandRunner(max_concurrency=max_jobs, num_threads=num_threads, memory_budget=memory_budget)
+    outcomes = asyncio.run(run_jobs(jobs, commands, runner, threads_per_job, timeout))
+
+    summary = summarize(jobs, outcomes)
+    log_summary(summary)
+    if summary_path is not None:
+        with open(summary_path, "w") as f:
+            json.dump(summary, f, indent=4)
+        logger.info(f"summary saved to {summary_path}")
+    if summary["num_failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_batch()
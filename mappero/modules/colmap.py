@@ -1,23 +1,63 @@
+import asyncio
+import os
+import shutil
+import sqlite3
+import tempfile
 from pathlib import Path
 
 import click
 from loguru import logger
 from omegaconf import OmegaConf
 
+from mappero.pipeline.pipeline import Pipeline
+from mappero.utils.colmap.database import COLMAPDatabase
 from mappero.utils.config import save_config
-from mappero.utils.process import run_command
+from mappero.utils.metrics import MetricsRecorder, save_metrics
+from mappero.utils.process import CommandRunner, run_command, run_until_terminated
 from mappero.utils.io import find_images
 
 
-def run_colmap_process(process_name: str, params: dict):
-    """run a colmap process."""
+# thread count option of the colmap processes, set when a number of threads is given
+NUM_THREADS_OPTIONS = {
+    "feature_extractor": "SiftExtraction.num_threads",
+    "exhaustive_matcher": "SiftMatching.num_threads",
+    "sequential_matcher": "SiftMatching.num_threads",
+    "vocab_tree_matcher": "SiftMatching.num_threads",
+    "matches_importer": "SiftMatching.num_threads",
+    "mapper": "Mapper.num_threads",
+    "point_triangulator": "Mapper.num_threads",
+    "stereo_fusion": "StereoFusion.num_threads",
+    "poisson_mesher": "PoissonMeshing.num_threads",
+    "delaunay_mesher": "DelaunayMeshing.num_threads",
+}
+
+
+def num_threads_budget(num_threads: int = None) -> int:
+    """cpu threads the colmap processes may use, `num_threads` or the number of cpus."""
+    return num_threads or os.cpu_count() or 1
+
+
+def run_colmap_process(process_name: str, params: dict, num_threads: int = None):
+    """run a colmap process, with `num_threads` cpu threads if given."""
+    option = NUM_THREADS_OPTIONS.get(process_name)
+    if num_threads and option is not None and option not in params:
+        params = {**params, option: num_threads}
     logger.info(f"starting {process_name}")
-    run_command(["colmap", process_name], params)
-    logger.success(f"{process_name.replace('_', ' ').title()} complete")
+    result = run_command(["colmap", process_name], params)
+    logger.success(f"{process_name.replace('_', ' ').title()} complete in {result.wall_time:.1f}s")
+    return result
 
 
-def feature_extraction(config, image_path: Path, database_path: Path):
+def feature_extraction(
+    config, image_path: Path, database_path: Path, image_list_path: Path = None, num_threads: int = None
+):
     """extract features from images."""
+    num_shards = config.feature_extraction.get("num_shards", 1)
+    if num_shards > 1 and image_list_path is not None:
+        return sharded_feature_extraction(
+            config, image_path, database_path, image_list_path, num_shards, num_threads=num_threads
+        )
+
     params = {
         "database_path": str(database_path),
         "image_path": str(image_path),
@@ -25,10 +65,76 @@ def feature_extraction(config, image_path: Path, database_path: Path):
         "SiftExtraction.max_image_size": config.feature_extraction.max_image_size,
         "SiftExtraction.max_num_features": config.feature_extraction.max_num_features,
     }
-    run_colmap_process("feature_extractor", params)
+    run_colmap_process("feature_extractor", params, num_threads)
+
 
+def sharded_feature_extraction(
+    config, image_path: Path, database_path: Path, image_list_path: Path, num_shards: int, num_threads: int = None
+):
+    """extract features of the listed images in parallel shards, then merge them into one database.
+
+    the shards share `num_threads` cpu threads, all cpus by default.
+    """
+    with open(image_list_path) as f:
+        names = [line.strip() for line in f if line.strip()]
+
+    # like the feature extractor, skip images already in the database
+    if database_path.exists():
+        db = sqlite3.connect(str(database_path))
+        existing = {name for (name,) in db.execute("SELECT name FROM images")}
+        db.close()
+        names = [name for name in names if name not in existing]
+    if len(names) == 0:
+        logger.info("all images already have features")
+        return
 
-def matcher(config, database_path: Path, method="exhaustive", block_size=50):
+    num_shards = min(num_shards, len(names))
+    shard_size = -(-len(names) // num_shards)
+    num_threads = num_threads_budget(num_threads)
+    shard_threads = max(1, num_threads // num_shards)
+
+    with tempfile.TemporaryDirectory(prefix="shards_", dir=database_path.parent) as shards_dir:
+        shards = []
+        for shard in range(num_shards):
+            shard_list_path = Path(shards_dir) / f"shard_{shard}.txt"
+            shard_list_path.write_text("\n".join(names[shard * shard_size : (shard + 1) * shard_size]) + "\n")
+            params = {
+                "database_path": str(Path(shards_dir) / f"shard_{shard}.db"),
+                "image_path": str(image_path),
+                "image_list_path": str(shard_list_path),
+                "ImageReader.single_camera": config.feature_extraction.single_camera,
+                "SiftExtraction.max_image_size": config.feature_extraction.max_image_size,
+                "SiftExtraction.max_num_features": config.feature_extraction.max_num_features,
+                "SiftExtraction.num_threads": shard_threads,
+            }
+            shards.append(params)
+
+        logger.info(f"extracting features of {len(names)} images in {num_shards} shards")
+        runner = CommandRunner(max_concurrency=num_shards, num_threads=num_threads)
+        commands = [(["colmap", "feature_extractor"], params) for params in shards]
+        results = asyncio.run(run_until_terminated(runner.run_all(commands, threads=shard_threads)))
+        logger.success(f"Feature Extractor complete in {max(result.wall_time for result in results):.1f}s")
+
+        # the first shard seeds a new database so that its schema matches the colmap version
+        shard_paths = [Path(params["database_path"]) for params in shards]
+        if not database_path.exists():
+            shutil.move(str(shard_paths.pop(0)), str(database_path))
+
+        # with a single camera, each shard estimated its own, the images of all shards use the first one
+        single_camera = bool(config.feature_extraction.single_camera)
+        db = COLMAPDatabase.connect(database_path, fast=True)
+        try:
+            for shard_path in shard_paths:
+                camera_id = db.execute("SELECT MIN(camera_id) FROM cameras").fetchone()[0] if single_camera else None
+                image_ids = db.merge_database(shard_path, camera_id=camera_id)
+                logger.info(f"merged {len(image_ids)} images from {shard_path.name}")
+            # leave the database in the default rollback journal mode for colmap
+            db.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            db.close()
+
+
+def matcher(config, database_path: Path, method="exhaustive", block_size=50, num_threads: int = None):
     """perform image matching."""
     params = {"database_path": str(database_path)}
     if method == "exhaustive":
@@ -37,17 +143,27 @@ def matcher(config, database_path: Path, method="exhaustive", block_size=50):
         params["SequentialMatching.overlap"] = config.matcher.sequential.overlap
     elif method == "vocab_tree":
         params["VocabTreeMatching.vocab_tree_path"] = config.matcher.vocab_tree_path
-    run_colmap_process(f"{method}_matcher", params)
+    run_colmap_process(f"{method}_matcher", params, num_threads)
+
+
+def pairs_matcher(database_path: Path, match_list_path: Path, num_threads: int = None):
+    """match the image pairs listed by name in a text file."""
+    params = {
+        "database_path": str(database_path),
+        "match_list_path": str(match_list_path),
+        "match_type": "pairs",
+    }
+    run_colmap_process("matches_importer", params, num_threads)
 
 
-def mapper(database_path: Path, image_path: Path, output_path: Path):
+def mapper(database_path: Path, image_path: Path, output_path: Path, num_threads: int = None):
     """run sparse mapping."""
     params = {
         "database_path": str(database_path),
         "image_path": str(image_path),
         "output_path": str(output_path),
     }
-    run_colmap_process("mapper", params)
+    run_colmap_process("mapper", params, num_threads)
 
 
 def bundle_adjustment(input_path: Path, output_path: Path):
@@ -59,7 +175,9 @@ def bundle_adjustment(input_path: Path, output_path: Path):
     run_colmap_process("bundle_adjuster", params)
 
 
-def point_triangulator(database_path: Path, image_path: Path, input_path: Path, output_path: Path):
+def point_triangulator(
+    database_path: Path, image_path: Path, input_path: Path, output_path: Path, num_threads: int = None
+):
     """triangulate points."""
     params = {
         "database_path": str(database_path),
@@ -67,7 +185,7 @@ def point_triangulator(database_path: Path, image_path: Path, input_path: Path,
         "input_path": str(input_path),
         "output_path": str(output_path),
     }
-    run_colmap_process("point_triangulator", params)
+    run_colmap_process("point_triangulator", params, num_threads)
 
 
 def patch_match_stereo(workspace_path: Path):
@@ -80,7 +198,7 @@ def patch_match_stereo(workspace_path: Path):
     run_colmap_process("patch_match_stereo", params)
 
 
-def stereo_fusion(workspace_path: Path, output_path: Path):
+def stereo_fusion(workspace_path: Path, output_path: Path, num_threads: int = None):
     """fuse stereo results."""
     params = {
         "workspace_path": str(workspace_path),
@@ -88,38 +206,103 @@ def stereo_fusion(workspace_path: Path, output_path: Path):
         "input_type": "geometric",
         "output_path": str(output_path),
     }
-    run_colmap_process("stereo_fusion", params)
+    run_colmap_process("stereo_fusion", params, num_threads)
 
 
-def poisson_mesher(input_path: Path, output_path: Path):
+def poisson_mesher(input_path: Path, output_path: Path, num_threads: int = None):
     """perform poisson meshing."""
     params = {
         "input_path": str(input_path),
         "output_path": str(output_path),
     }
-    run_colmap_process("poisson_mesher", params)
+    run_colmap_process("poisson_mesher", params, num_threads)
 
 
-def delaunay_mesher(input_path: Path, output_path: Path):
+def delaunay_mesher(input_path: Path, output_path: Path, num_threads: int = None):
     """perform delaunay meshing."""
     params = {
         "input_path": str(input_path),
         "output_path": str(output_path),
     }
-    run_colmap_process("delaunay_mesher", params)
+    run_colmap_process("delaunay_mesher", params, num_threads)
 
 
-def run_sfm(config, image_path: Path, database_path: Path, output_path: Path):
-    """run the structure-from-motion pipeline."""
-    feature_extraction(config, image_path, database_path)
-    matcher(config, database_path)
-    mapper(database_path, image_path, output_path)
+def clear_database(database_path: Path):
+    """delete a database with its journal files, the feature extractor skips the images it already has."""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(f"{database_path}{suffix}").unlink(missing_ok=True)
 
 
-def run_mvs(workspace_path: Path, output_path: Path):
+def clear_matches(database_path: Path):
+    """delete the matches and two-view geometries of a database, the matchers skip the pairs it already has."""
+    if not database_path.exists():
+        return
+    db = COLMAPDatabase.connect(database_path)
+    try:
+        logger.info(f"deleted {db.delete_matches()} match rows")
+        db.commit()
+    finally:
+        db.close()
+
+
+def clear_directory(path: Path):
+    """delete the content of a directory."""
+    if path.is_dir():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+
+def run_sfm(
+    config,
+    image_path: Path,
+    database_path: Path,
+    output_path: Path,
+    image_list_path: Path = None,
+    state_path: Path = None,
+    force=False,
+    num_threads: int = None,
+):
+    """run the structure-from-motion pipeline, skipping the stages that are up to date.
+
+    :param state_path: pipeline state file, pipeline_state.json next to the database by default.
+    :param force: True to rerun all stages, or names of the stages to rerun with their dependents.
+    :param num_threads: cpu threads of each colmap process, all by default.
+    """
+    image_inputs = [image_path] if image_list_path is None else [image_path, image_list_path]
+    # sharding does not change the extracted features
+    extraction_config = OmegaConf.to_container(config.feature_extraction, resolve=True)
+    extraction_config.pop("num_shards", None)
+    pipeline = Pipeline(state_path or database_path.parent / "pipeline_state.json")
+    pipeline.add(
+        "feature_extraction",
+        lambda: feature_extraction(config, image_path, database_path, image_list_path, num_threads),
+        inputs=image_inputs,
+        outputs=[database_path],
+        config=extraction_config,
+        clear=lambda: clear_database(database_path),
+    )
+    pipeline.add(
+        "matcher",
+        lambda: matcher(config, database_path, num_threads=num_threads),
+        inputs=[database_path],
+        outputs=[database_path],
+        config={"method": "exhaustive", "block_size": 50},
+        clear=lambda: clear_matches(database_path),
+    )
+    pipeline.add(
+        "mapper",
+        lambda: mapper(database_path, image_path, output_path, num_threads),
+        inputs=[database_path, image_path],
+        outputs=[output_path],
+        clear=lambda: clear_directory(output_path),
+    )
+    return pipeline.run(force)
+
+
+def run_mvs(workspace_path: Path, output_path: Path, num_threads: int = None):
     """run the multi-view stereo pipeline."""
     patch_match_stereo(workspace_path)
-    stereo_fusion(workspace_path, output_path)
+    stereo_fusion(workspace_path, output_path, num_threads)
 
 
 @click.command("run_colmap")
@@ -140,8 +323,14 @@ def run_mvs(workspace_path: Path, output_path: Path):
     type=click.Choice(["exhaustive", "sequential", "vocab_tree"]),
     help="matcher type to use.",
 )
+@click.option("--num_shards", type=int, default=None, help="number of parallel feature extraction shards.")
+@click.option("--trace", is_flag=True, help="write a chrome trace of the stages to trace.json.")
+@click.option("--force", is_flag=True, help="rerun the sfm stages that are up to date.")
+@click.option("--num_threads", type=int, default=None, help="cpu threads of each colmap process, all by default.")
 @click.help_option("--help", "-h")
-def run_colmap(workspace_path, config_path, image_path, task, max_image_size, vis, matcher):
+def run_colmap(
+    workspace_path, config_path, image_path, task, max_image_size, vis, matcher, num_shards, trace, force, num_threads
+):
     """
     run the colmap pipeline using the specified workspace and configuration.
     """
@@ -160,9 +349,12 @@ def run_colmap(workspace_path, config_path, image_path, task, max_image_size, vi
 
     # load configuration
     config = OmegaConf.load(config_path)
+    if num_shards is not None:
+        config.feature_extraction.num_shards = num_shards
 
     # find images and save configuration
-    images_paths = find_images(image_path, workspace_path / "images_paths.txt")
+    image_list_path = workspace_path / "images_paths.txt"
+    images_paths = find_images(image_path, image_list_path)
 
     if len(images_paths) == 0:
         logger.error("no images found in the specified path.")
@@ -173,21 +365,34 @@ def run_colmap(workspace_path, config_path, image_path, task, max_image_size, vi
     # update configuration
     save_config(config, workspace_path)
 
-    # exe
-    if task == "sfm":
-        sparse_path.mkdir(exist_ok=True, parents=True)
-        run_sfm(config, image_path, database_path, sparse_path)
-    elif task == "mvs":
-        dense_path.mkdir(exist_ok=True, parents=True)
-        run_mvs(dense_path, fusion_path)
-    elif task == "fusion":
-        stereo_fusion(dense_path, fusion_path)
-    elif task == "mesh":
-        poisson_mesher(fusion_path, dense_path / "meshed-poisson.ply")
-    elif task == "bundle_adjustment":
-        raise NotImplementedError("bundle adjustment is not yet implemented")
-    elif task == "triangulation":
-        raise NotImplementedError("triangulation is not yet implemented")
+    # exe, recording the resource usage of each stage
+    metrics = MetricsRecorder(f"colmap {task}")
+    try:
+        with metrics:
+            if task == "sfm":
+                sparse_path.mkdir(exist_ok=True, parents=True)
+                run_sfm(
+                    config,
+                    image_path,
+                    database_path,
+                    sparse_path,
+                    image_list_path,
+                    force=force,
+                    num_threads=num_threads,
+                )
+            elif task == "mvs":
+                dense_path.mkdir(exist_ok=True, parents=True)
+                run_mvs(dense_path, fusion_path, num_threads)
+            elif task == "fusion":
+                stereo_fusion(dense_path, fusion_path, num_threads)
+            elif task == "mesh":
+                poisson_mesher(fusion_path, dense_path / "meshed-poisson.ply", num_threads)
+            elif task == "bundle_adjustment":
+                raise NotImplementedError("bundle adjustment is not yet implemented")
+            elif task == "triangulation":
+                raise NotImplementedError("triangulation is not yet implemented")
+    finally:
+        save_metrics(metrics, workspace_path, trace)
 
     logger.success("colmap pipeline complete")
 
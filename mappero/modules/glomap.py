@@ -5,18 +5,22 @@ from loguru import logger
 from omegaconf import OmegaConf
 
 from mappero.utils.config import save_config
+from mappero.utils.metrics import MetricsRecorder, save_metrics
 from mappero.utils.process import run_command
 from mappero.utils.io import find_images
 
 
-def run_sfm(config, image_path, database_path, output_path):
-    """run structure from motion."""
+def run_sfm(config, image_path, database_path, output_path, num_threads=None):
+    """run structure from motion.
+
+    glomap has no thread count option, with `num_threads` it is bound to that many cpus.
+    """
     params = {
         "database_path": str(database_path),
         "image_path": str(image_path),
         "output_path": str(output_path),
     }
-    run_command(["glomap", "mapper"], params)
+    run_command(["glomap", "mapper"], params, pin_threads=num_threads)
 
 
 @click.command()
@@ -30,8 +34,10 @@ def run_sfm(config, image_path, database_path, output_path):
     help="task to run in the pipeline.",
 )
 @click.option("--vis", is_flag=True, help="enable visualization of results.")
+@click.option("--trace", is_flag=True, help="write a chrome trace of the stages to trace.json.")
+@click.option("--num_threads", type=int, default=None, help="cpus the glomap process is bound to, all by default.")
 @click.help_option("--help", "-h")
-def run_glomap(workspace_path, config_path, image_path, task, vis):
+def run_glomap(workspace_path, config_path, image_path, task, vis, trace, num_threads):
     """
     run the glomap pipeline.
     
@@ -66,11 +72,16 @@ def run_glomap(workspace_path, config_path, image_path, task, vis):
     # update configuration
     save_config(config, workspace_path)
 
-    # exe
-    if task == "sfm":
-        run_sfm(config, image_path, database_path, glomap_path)
-    else:
-        raise
+    # exe, recording the resource usage of each stage
+    metrics = MetricsRecorder(f"glomap {task}")
+    try:
+        with metrics:
+            if task == "sfm":
+                run_sfm(config, image_path, database_path, glomap_path, num_threads)
+            else:
+                raise
+    finally:
+        save_metrics(metrics, workspace_path, trace)
 
     logger.success("glomap pipeline complete")
 
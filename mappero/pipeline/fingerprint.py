@@ -0,0 +1,51 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from omegaconf import DictConfig, ListConfig, OmegaConf
+
+from mappero.utils.io import hash_file
+
+
+class FileHasher:
+    """content hashes of files and directories, reusing known hashes of files whose size and mtime are unchanged.
+
+    files are hashed in full, an edit that keeps the size changes the mtime, so only new or modified
+    files are read. the hashes of the files seen are kept in `hashes`, a json-serializable dict to
+    pass as the known hashes of the next run.
+    """
+
+    def __init__(self, known_hashes: dict = None):
+        self.known_hashes = known_hashes or {}
+        self.hashes = {}
+
+    def hash_file(self, path: Path) -> str:
+        stat = os.stat(path)
+        key = str(Path(path).resolve())
+        known = self.hashes.get(key) or self.known_hashes.get(key)
+        if known is None or known[0] != stat.st_size or known[1] != stat.st_mtime_ns:
+            known = [stat.st_size, stat.st_mtime_ns, hash_file(path)]
+        self.hashes[key] = known
+        return known[2]
+
+    def hash_path(self, path: Path) -> str:
+        """hash of a file, of the relative names and contents of the files in a directory, or of a missing path."""
+        path = Path(path)
+        hasher = hashlib.sha256()
+        if path.is_dir():
+            for file_path in sorted(p for p in path.rglob("*") if p.is_file()):
+                hasher.update(str(file_path.relative_to(path)).encode("utf-8"))
+                hasher.update(self.hash_file(file_path).encode("utf-8"))
+        elif path.is_file():
+            hasher.update(self.hash_file(path).encode("utf-8"))
+        else:
+            hasher.update(b"missing")
+        return hasher.hexdigest()
+
+
+def hash_config(config) -> str:
+    """hash of a config subtree, a plain or omegaconf container, independent of the key order."""
+    if isinstance(config, (DictConfig, ListConfig)):
+        config = OmegaConf.to_container(config, resolve=True)
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode("utf-8")).hexdigest()
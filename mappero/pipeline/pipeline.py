@@ -0,0 +1,180 @@
+import collections
+import hashlib
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from .fingerprint import FileHasher, hash_config
+
+# version 2 hashes input files in full, the sampled hashes of version 1 are discarded,
+# version 3 records the outputs of each stage
+STATE_VERSION = 3
+
+Stage = collections.namedtuple("Stage", ["name", "run", "inputs", "outputs", "config", "clear"])
+
+
+def _exists(path: Path) -> bool:
+    """whether an output was produced, a file or a non-empty directory."""
+    path = Path(path)
+    return path.is_file() or (path.is_dir() and any(path.iterdir()))
+
+
+def _signature(path: Path) -> list:
+    """size and modification time of an output file and its sqlite write-ahead log, or of the files of a directory."""
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path, Path(f"{path}-wal")]
+    signature = []
+    for file in files:
+        if file.is_file():
+            stat = file.stat()
+            signature.append([str(file), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+class Pipeline:
+    """stages with declared inputs and outputs, run in dependency order and skipped when up to date.
+
+    a stage depends on the last stage declared before it that outputs one of its inputs. its
+    fingerprint hashes its config subtree, the fingerprints of the stages it depends on and the
+    content of its other inputs. completed stages are recorded in a json state file, so a stage
+    is skipped when its fingerprint is unchanged, its outputs exist and none of its dependencies
+    ran, and an interrupted run resumes after the last completed stage. the size and modification
+    time of the outputs are recorded too, by the last stage writing each of them, so that outputs
+    edited outside of the pipeline run the stage that wrote them again.
+
+    a stage that runs again for another reason than an interruption first calls its `clear`
+    callable, if any, to delete its previous outputs that would otherwise be kept or skipped.
+
+    example:
+    pipeline = Pipeline(workspace_path / "pipeline_state.json")
+    pipeline.add("feature_extraction", extract, inputs=[image_path], outputs=[database_path], config=cfg, clear=reset)
+    pipeline.add("matcher", match, inputs=[database_path], outputs=[database_path], clear=delete_matches)
+    pipeline.run()
+    """
+
+    def __init__(self, state_path: Path):
+        self.state_path = Path(state_path)
+        self.stages = []
+
+    def add(self, name: str, run, inputs=(), outputs=(), config=None, clear=None) -> Stage:
+        """declare a stage, `run` and `clear` are called without arguments."""
+        if any(stage.name == name for stage in self.stages):
+            raise ValueError(f"duplicate stage name: {name}")
+        stage = Stage(name, run, [Path(p) for p in inputs], [Path(p) for p in outputs], config, clear)
+        self.stages.append(stage)
+        return stage
+
+    def _resolve(self):
+        """names of the stages each stage depends on, its inputs produced by no earlier stage and
+        its outputs written by no later stage."""
+        producers = {}
+        dependencies = {}
+        external_inputs = {}
+        for stage in self.stages:
+            dependencies[stage.name] = sorted(
+                {producers[path.resolve()] for path in stage.inputs if path.resolve() in producers}
+            )
+            external_inputs[stage.name] = [path for path in stage.inputs if path.resolve() not in producers]
+            for path in stage.outputs:
+                producers[path.resolve()] = stage.name
+        final_outputs = {
+            stage.name: [path for path in stage.outputs if producers[path.resolve()] == stage.name]
+            for stage in self.stages
+        }
+        return dependencies, external_inputs, final_outputs
+
+    def dependencies(self) -> dict:
+        """names of the stages each stage depends on."""
+        return self._resolve()[0]
+
+    def _load_state(self) -> dict:
+        if self.state_path.exists():
+            try:
+                with open(self.state_path) as f:
+                    state = json.load(f)
+                if state.get("version") == STATE_VERSION:
+                    return state
+            except (OSError, ValueError):
+                pass
+            logger.warning(f"ignoring unreadable pipeline state {self.state_path}")
+        return {"version": STATE_VERSION, "stages": {}, "files": {}}
+
+    def _save_state(self, state: dict) -> None:
+        # replace the file at once, an interrupted write leaves the previous state
+        tmp_path = self.state_path.with_name(f"{self.state_path.name}.tmp-{os.getpid()}")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    @staticmethod
+    def fingerprint(stage: Stage, dependency_fingerprints: list, external_inputs: list, hasher: FileHasher) -> str:
+        """fingerprint of a stage given those of its dependencies."""
+        inputs = [[str(path), hasher.hash_path(path)] for path in external_inputs]
+        payload = [stage.name, hash_config(stage.config), dependency_fingerprints, inputs]
+        return hashlib.sha256(json.dumps(payload).encode("utf-8")).hexdigest()
+
+    def run(self, force=False) -> dict:
+        """run the stages that are not up to date.
+
+        :param force: True to run all stages, or names of stages to run, their dependents run too.
+        :return: "ran" or "skipped" for each stage.
+        """
+        forced = {stage.name for stage in self.stages} if force is True else set(force or ())
+        unknown = forced - {stage.name for stage in self.stages}
+        if unknown:
+            raise ValueError(f"unknown stages: {sorted(unknown)}")
+
+        state = self._load_state()
+        hasher = FileHasher(state["files"])
+        dependencies, external_inputs, final_outputs = self._resolve()
+        fingerprints = {}
+        statuses = {}
+        for stage in self.stages:
+            dependency_fingerprints = [fingerprints[name] for name in dependencies[stage.name]]
+            fingerprint = self.fingerprint(stage, dependency_fingerprints, external_inputs[stage.name], hasher)
+            fingerprints[stage.name] = fingerprint
+            recorded = state["stages"].get(stage.name, {})
+            if stage.name in forced:
+                reason = "forced"
+            elif any(statuses[name] == "ran" for name in dependencies[stage.name]):
+                reason = "a dependency ran"
+            elif recorded.get("fingerprint") != fingerprint:
+                reason = "inputs or config changed" if recorded else "not run yet"
+            elif recorded.get("running"):
+                reason = "interrupted"
+            elif not all(_exists(path) for path in stage.outputs):
+                reason = "outputs missing"
+            elif recorded.get("outputs") != [_signature(path) for path in final_outputs[stage.name]]:
+                reason = "outputs changed"
+            else:
+                logger.info(f"skipping {stage.name}, up to date")
+                statuses[stage.name] = "skipped"
+                continue
+
+            logger.info(f"running {stage.name}: {reason}")
+            # an interrupted stage resumes from its partial outputs, otherwise they are stale
+            if stage.clear is not None and recorded and reason != "interrupted":
+                logger.info(f"clearing the outputs of {stage.name}")
+                stage.clear()
+            # mark the stage first, a stage interrupted midway must run again
+            state["stages"][stage.name] = {"fingerprint": fingerprint, "running": True}
+            self._save_state(state)
+            start = time.perf_counter()
+            stage.run()
+            state["stages"][stage.name] = {
+                "fingerprint": fingerprint,
+                "outputs": [_signature(path) for path in final_outputs[stage.name]],
+                "completed": datetime.now().isoformat(timespec="seconds"),
+                "wall_time": time.perf_counter() - start,
+            }
+            state["files"] = hasher.hashes
+            self._save_state(state)
+            statuses[stage.name] = "ran"
+
+        state["files"] = hasher.hashes
+        self._save_state(state)
+        return statuses
@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mappero.utils.colmap.colmap_nvm import write_nvm_model
+
+
+@click.command()
+@click.option("--model", required=True, type=click.Path(exists=True), help="path to input model folder.")
+@click.option("--output", required=True, type=click.Path(), help="path to output NVM file.")
+@click.option("--format", type=click.Choice(["", ".bin", ".txt"]), default="", help="input model format.")
+@click.option("--intrinsics", type=click.Path(), default=None, help="optional output file for the camera intrinsics.")
+@click.option("--batch_size", type=int, default=1 << 18, help="number of points formatted at once.")
+@click.help_option("--help", "-h")
+def run_export_nvm(model, output, format, intrinsics, batch_size):
+    """
+    export a colmap model to the NVM format.
+
+    example:
+    mappero-export-nvm --model ./sparse/0 --output ./model.nvm --intrinsics ./intrinsics.txt
+    """
+    Path(output).parent.mkdir(exist_ok=True, parents=True)
+    num_images, num_points = write_nvm_model(
+        model, output, ext=format, intrinsics_path=intrinsics, batch_size=batch_size
+    )
+    logger.success(f"exported {num_images} images and {num_points} points to {output}")
+
+
+if __name__ == "__main__":
+    run_export_nvm()
@@ -0,0 +1,49 @@
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mappero.utils.colmap.filter import filter_mask, filter_points3D
+from mappero.utils.colmap.reconstruction import Reconstruction
+
+
+@click.command()
+@click.option("--model", required=True, type=click.Path(exists=True), help="path to input model folder.")
+@click.option("--output", required=True, type=click.Path(), help="path to output model folder.")
+@click.option("--format", type=click.Choice(["", ".bin", ".txt"]), default="", help="input model format.")
+@click.option("--output_format", type=click.Choice([".bin", ".txt"]), default=".bin", help="output model format.")
+@click.option("--min_track_len", type=int, default=None, help="minimum track length for 3d points.")
+@click.option("--max_error", type=float, default=None, help="maximum reprojection error in pixels.")
+@click.option("--min_tri_angle", type=float, default=None, help="minimum triangulation angle in degrees.")
+@click.option("--bbox_min", type=float, nargs=3, default=None, help="lower corner of the bounding box.")
+@click.option("--bbox_max", type=float, nargs=3, default=None, help="upper corner of the bounding box.")
+@click.option("--num_workers", type=int, default=None, help="number of processes used to read the model.")
+@click.help_option("--help", "-h")
+def run_filter(
+    model, output, format, output_format, min_track_len, max_error, min_tri_angle, bbox_min, bbox_max, num_workers
+):
+    """
+    filter the 3d points of a colmap model.
+
+    example:
+    mappero-filter --model ./sparse/0 --output ./sparse/filtered --min_track_len 3 --max_error 2.0
+    """
+    reconstruction = Reconstruction.read(model, ext=format, num_workers=num_workers)
+
+    keep = filter_mask(
+        reconstruction,
+        min_track_len=min_track_len,
+        max_error=max_error,
+        min_tri_angle=min_tri_angle,
+        bbox_min=bbox_min or None,
+        bbox_max=bbox_max or None,
+    )
+    logger.info(f"keeping {keep.sum()} of {reconstruction.num_points3D} points3D")
+
+    output = Path(output)
+    output.mkdir(exist_ok=True, parents=True)
+    filter_points3D(reconstruction, keep).write(str(output), ext=output_format)
+
+
+if __name__ == "__main__":
+    run_filter()
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mappero.modules.colmap import pairs_matcher
+from mappero.utils.colmap.database import COLMAPDatabase
+
+
+def write_pairs(db: COLMAPDatabase, image_ids, pairs_path: Path) -> int:
+    """write the incremental pairs of `image_ids` by image name, returns the number of pairs."""
+    names = dict(db.execute("SELECT image_id, name FROM images"))
+    num_pairs = 0
+    with open(pairs_path, "w") as f:
+        for image_ids1, image_ids2 in db.incremental_pairs(image_ids):
+            f.writelines(f"{names[id1]} {names[id2]}\n" for id1, id2 in zip(image_ids1.tolist(), image_ids2.tolist()))
+            num_pairs += len(image_ids1)
+    return num_pairs
+
+
+@click.command()
+@click.argument("database_path", type=click.Path(exists=True))
+@click.argument("source_path", type=click.Path(exists=True))
+@click.option("--share_cameras", is_flag=True, help="reuse cameras identical to existing ones.")
+@click.option(
+    "--on_duplicate",
+    type=click.Choice(["skip", "error"]),
+    default="skip",
+    help="how to handle images whose name is already in the database.",
+)
+@click.option("--name_prefix", default="", help="prefix added to the names of the appended images.")
+@click.option("--pairs_path", type=click.Path(), help="output pair list, defaults to next to the database.")
+@click.option("--match", is_flag=True, help="match the new pairs with colmap once merged.")
+@click.help_option("--help", "-h")
+def run_merge(database_path, source_path, share_cameras, on_duplicate, name_prefix, pairs_path, match):
+    """
+    append a capture session database to an existing colmap database.
+
+    only the pairs between the appended images and all images need matching afterwards.
+
+    example:
+    mappero-merge-db ./site/database.db ./session/database.db --share_cameras --match
+    """
+    database_path = Path(database_path)
+    pairs_path = Path(pairs_path) if pairs_path else database_path.parent / "incremental_pairs.txt"
+
+    db = COLMAPDatabase.connect(database_path, fast=True)
+    try:
+        image_ids = db.merge_database(
+            source_path, share_cameras=share_cameras, on_duplicate=on_duplicate, name_prefix=name_prefix
+        )
+        logger.info(f"appended {len(image_ids)} images from {source_path}")
+
+        num_pairs = write_pairs(db, list(image_ids.values()), pairs_path)
+        logger.info(f"wrote {num_pairs} pairs to match to {pairs_path}")
+
+        # leave the database in the default rollback journal mode for colmap
+        db.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        db.close()
+
+    if match and num_pairs > 0:
+        pairs_matcher(database_path, pairs_path)
+
+
+if __name__ == "__main__":
+    run_merge()
@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+import click
+from loguru import logger
+
+from mappero.utils.colmap.database import COLMAPDatabase
+
+
+def database_size(database_path: Path) -> int:
+    """bytes used by a database and its WAL files."""
+    paths = [Path(f"{database_path}{suffix}") for suffix in ("", "-wal", "-shm")]
+    return sum(os.path.getsize(path) for path in paths if path.exists())
+
+
+@click.command()
+@click.argument("database_path", type=click.Path(exists=True))
+@click.option("--keep_unverified", is_flag=True, help="keep the raw matches of pairs failing verification.")
+@click.option("--drop_descriptors", is_flag=True, help="delete all descriptors, once matching is done.")
+@click.option("--image_list", type=click.Path(exists=True), help="file with the names of the images to keep.")
+@click.option("--no_vacuum", is_flag=True, help="skip rebuilding the database file.")
+@click.help_option("--help", "-h")
+def run_prune(database_path, keep_unverified, drop_descriptors, image_list, no_vacuum):
+    """
+    prune a colmap database and reclaim its disk space.
+
+    example:
+    mappero-prune-db ./workspace/database.db --drop_descriptors --image_list ./workspace/images_paths.txt
+    """
+    database_path = Path(database_path)
+    size_before = database_size(database_path)
+
+    db = COLMAPDatabase.connect(database_path)
+    try:
+        if image_list:
+            with open(image_list) as f:
+                names = [line.strip() for line in f if line.strip()]
+            logger.info(f"deleted {db.delete_images_not_in(names)} images not in {image_list}")
+        if not keep_unverified:
+            logger.info(f"deleted {db.delete_unverified_matches()} unverified matches")
+        if drop_descriptors:
+            logger.info(f"deleted {db.delete_descriptors()} descriptors")
+        db.commit()
+        if not no_vacuum:
+            db.vacuum()
+    finally:
+        db.close()
+
+    size_after = database_size(database_path)
+    logger.success(f"reclaimed {(size_before - size_after) / 1024**2:.1f} MiB ({size_before} -> {size_after} bytes)")
+
+
+if __name__ == "__main__":
+    run_prune()
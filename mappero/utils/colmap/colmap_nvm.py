@@ -1,13 +1,36 @@
 import argparse
+import itertools
+import os
 import sqlite3
-from collections import defaultdict
+from contextlib import nullcontext
 from pathlib import Path
 
 import numpy as np
 from loguru import logger
-from tqdm import tqdm
 
-from .read_write_model import CAMERA_MODEL_NAMES, Camera, Image, Point3D, write_model
+from .lazy_model import LazyModel
+from .read_write_model import (
+    CAMERA_MODEL_NAMES,
+    POINTS3D_BATCH_SIZE,
+    Camera,
+    ImagesArrays,
+    Points3DArrays,
+    _parse_float_tokens,
+    _parse_int_tokens,
+    _tokenize_text_block,
+    camera_centers,
+    detect_model_format,
+    iter_images,
+    iter_points3D,
+    qvecs2rotmats,
+    read_cameras_binary,
+    read_cameras_text,
+    write_model,
+)
+from .reconstruction import IdIndex
+
+# camera models with a single focal length, followed by the principal point
+SINGLE_FOCAL_CAMERA_MODELS = {"SIMPLE_PINHOLE", "SIMPLE_RADIAL", "RADIAL", "SIMPLE_RADIAL_FISHEYE", "RADIAL_FISHEYE"}
 
 
 def recover_database_images_and_ids(database_path):
@@ -26,24 +49,51 @@ def recover_database_images_and_ids(database_path):
 
 
 def quaternion_to_rotation_matrix(qvec):
-    qvec = qvec / np.linalg.norm(qvec)
-    w, x, y, z = qvec
-    R = np.array(
-        [
-            [1 - 2 * y * y - 2 * z * z, 2 * x * y - 2 * z * w, 2 * x * z + 2 * y * w],
-            [2 * x * y + 2 * z * w, 1 - 2 * x * x - 2 * z * z, 2 * y * z - 2 * x * w],
-            [2 * x * z - 2 * y * w, 2 * y * z + 2 * x * w, 1 - 2 * x * x - 2 * y * y],
-        ]
-    )
-    return R
+    qvec = np.asarray(qvec, float)
+    return qvecs2rotmats(qvec / np.linalg.norm(qvec, axis=-1, keepdims=True))
 
 
 def camera_center_to_translation(c, qvec):
     R = quaternion_to_rotation_matrix(qvec)
-    return (-1) * np.matmul(R, c)
+    return (-1) * np.einsum("...ij,...j->...i", R, np.asarray(c, float))
+
+
+def _next_line(nvm_f):
+    line = nvm_f.readline()
+    while line.strip() == b"":
+        if not line:
+            raise ValueError("unexpected end of NVM file")
+        line = nvm_f.readline()
+    return line
+
+
+def _parse_nvm_points_block(block, point_offset):
+    """parse a block of NVM point lines into points and their observations."""
+    tokens = _tokenize_text_block(block)
+    counts = tokens.counts[tokens.counts > 0]
+    starts = np.zeros(len(counts), np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    track_lengths = _parse_int_tokens(tokens, starts + 6)
+    if np.any(counts != 7 + 4 * track_lengths):
+        raise ValueError("malformed NVM point line")
+    track_offsets = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    # position of the first value of each observation
+    positions = np.repeat(starts + 7 - 4 * track_offsets[:-1], track_lengths)
+    positions += 4 * np.arange(track_offsets[-1], dtype=np.int64)
+    return (
+        _parse_float_tokens(tokens, (starts[:, None] + np.arange(3)).ravel()).reshape(-1, 3),
+        _parse_int_tokens(tokens, (starts[:, None] + np.arange(3, 6)).ravel()).reshape(-1, 3).astype(np.uint8),
+        track_lengths,
+        _parse_int_tokens(tokens, positions),
+        _parse_int_tokens(tokens, positions + 1),
+        _parse_float_tokens(tokens, (positions[:, None] + np.arange(2, 4)).ravel()).reshape(-1, 2),
+        np.repeat(np.arange(point_offset, point_offset + len(counts)), track_lengths),
+    )
 
 
 def read_nvm_model(nvm_path, intrinsics_path, image_ids, camera_ids, skip_points=False):
+    """read the first model of an NVM file as cameras, `ImagesArrays` and `Points3DArrays`."""
     logger.info("reading the NVM model...")
 
     with open(intrinsics_path, "r") as f:
@@ -51,119 +101,220 @@ def read_nvm_model(nvm_path, intrinsics_path, image_ids, camera_ids, skip_points
 
     logger.info(f"reading {len(raw_intrinsics)} cameras")
 
+    # the intrinsics are listed per image, images sharing a camera repeat its parameters
     cameras = {}
+    intrinsics_names = set()
     for intrinsics in raw_intrinsics:
         intrinsics = intrinsics.strip("\n").split(" ")
         name, camera_model, width, height = intrinsics[:4]
         params = [float(p) for p in intrinsics[4:]]
         camera_model = CAMERA_MODEL_NAMES[camera_model]
         assert len(params) == camera_model.num_params
+        intrinsics_names.add(name)
         camera_id = camera_ids[name]
         camera = Camera(
             id=camera_id, model=camera_model.model_name, width=int(width), height=int(height), params=params
         )
         cameras[camera_id] = camera
 
-    nvm_f = open(nvm_path, "r")
-    line = nvm_f.readline()
-    while line == "\n" or line.startswith("NVM_V3"):
-        line = nvm_f.readline()
+    nvm_f = open(nvm_path, "rb")
+    line = _next_line(nvm_f)
+    while line.startswith(b"NVM_V3"):
+        line = _next_line(nvm_f)
     num_images = int(line)
-    assert num_images == len(cameras)
 
     logger.info(f"reading {num_images} images...")
 
-    image_idx_to_db_image_id = []
-    image_data = []
-    i = 0
-    while i < num_images:
-        line = nvm_f.readline()
-        if line == "\n":
-            continue
-        data = line.strip("\n").split(" ")
-        image_data.append(data)
-        image_idx_to_db_image_id.append(image_ids[data[0]])
-        i += 1
-
-    line = nvm_f.readline()
-    while line == "\n":
-        line = nvm_f.readline()
-    num_points = int(line)
+    image_data = [_next_line(nvm_f).decode("utf-8").split() for _ in range(num_images)]
+    names = [data[0] for data in image_data]
+    missing = [name for name in names if name not in intrinsics_names]
+    if missing:
+        raise ValueError(f"no intrinsics for {len(missing)} images, such as {missing[0]}")
+    image_idx_to_db_image_id = np.array([image_ids[name] for name in names], np.int64)
 
+    num_points = int(_next_line(nvm_f))
     if skip_points:
+        # the point section is never read
         logger.info(f"Skipping {num_points} points.")
         num_points = 0
     else:
         logger.info(f"reading {num_points} points...")
 
-    points3D = {}
-    image_idx_to_keypoints = defaultdict(list)
-    i = 0
-    pbar = tqdm(total=num_points, unit="pts")
-    while i < num_points:
-        line = nvm_f.readline()
-        if line == "\n":
-            continue
-
-        data = line.strip("\n").split(" ")
-        x, y, z, r, g, b, num_observations = data[:7]
-        obs_image_ids, point2D_idxs = [], []
-        for j in range(int(num_observations)):
-            s = 7 + 4 * j
-            img_index, kp_index, kx, ky = data[s : s + 4]
-            image_idx_to_keypoints[int(img_index)].append((int(kp_index), float(kx), float(ky), i))
-            db_image_id = image_idx_to_db_image_id[int(img_index)]
-            obs_image_ids.append(db_image_id)
-            point2D_idxs.append(kp_index)
-
-        point = Point3D(
-            id=i,
-            xyz=np.array([x, y, z], float),
-            rgb=np.array([r, g, b], int),
-            error=1.0,  # fake
-            image_ids=np.array(obs_image_ids, int),
-            point2D_idxs=np.array(point2D_idxs, int),
+    chunks = []
+    num_read = 0
+    lines = (line for line in nvm_f if line.strip())
+    while num_read < num_points:
+        block = b"".join(itertools.islice(lines, min(POINTS3D_BATCH_SIZE, num_points - num_read)))
+        if not block:
+            raise ValueError(f"NVM file ended after {num_read} of {num_points} points")
+        chunks.append(_parse_nvm_points_block(block, num_read))
+        num_read += len(chunks[-1][0])
+        logger.info(f"read {num_read}/{num_points} points")
+    nvm_f.close()
+
+    if chunks:
+        xyz, rgb, track_lengths, obs_image_idxs, obs_point2D_idxs, obs_xys, obs_point3D_ids = map(
+            np.concatenate, zip(*chunks)
         )
-        points3D[i] = point
-
-        i += 1
-        pbar.update(1)
-    pbar.close()
+    else:
+        xyz, rgb = np.zeros((0, 3)), np.zeros((0, 3), np.uint8)
+        track_lengths, obs_image_idxs, obs_point2D_idxs = (np.zeros(0, np.int64),) * 3
+        obs_xys, obs_point3D_ids = np.zeros((0, 2)), np.zeros(0, np.int64)
+
+    track_offsets = np.zeros(len(xyz) + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    points3D = Points3DArrays(
+        ids=np.arange(len(xyz), dtype=np.int64),
+        xyz=xyz,
+        rgb=rgb,
+        error=np.ones(len(xyz)),  # fake
+        track_offsets=track_offsets,
+        track_image_ids=image_idx_to_db_image_id[obs_image_idxs].astype(np.int32),
+        track_point2D_idxs=obs_point2D_idxs.astype(np.int32),
+    )
 
     # parsing
     logger.info("parsing image data")
 
-    images = {}
-    for i, data in enumerate(image_data):
-        # Skip the focal length. Skip the distortion and terminal 0.
-        name, _, qw, qx, qy, qz, cx, cy, cz, _, _ = data
-        qvec = np.array([qw, qx, qy, qz], float)
-        c = np.array([cx, cy, cz], float)
-        t = camera_center_to_translation(c, qvec)
-
-        if i in image_idx_to_keypoints:
-            # NVM only stores triangulated 2D keypoints: add dummy ones
-            keypoints = image_idx_to_keypoints[i]
-            point2D_idxs = np.array([d[0] for d in keypoints])
-            tri_xys = np.array([[x, y] for _, x, y, _ in keypoints])
-            tri_ids = np.array([i for _, _, _, i in keypoints])
-
-            num_2Dpoints = max(point2D_idxs) + 1
-            xys = np.zeros((num_2Dpoints, 2), float)
-            point3D_ids = np.full(num_2Dpoints, -1, int)
-            xys[point2D_idxs] = tri_xys
-            point3D_ids[point2D_idxs] = tri_ids
-        else:
-            xys = np.zeros((0, 2), float)
-            point3D_ids = np.full(0, -1, int)
+    # NVM only stores triangulated 2D keypoints: add dummy ones up to the largest keypoint index
+    num_points2D = np.zeros(num_images, np.int64)
+    # the largest index of each image is the last of its run once the observations are sorted
+    stride = int(obs_point2D_idxs.max(initial=0)) + 1
+    keys = np.sort(obs_image_idxs * stride + obs_point2D_idxs)
+    last = np.flatnonzero(np.diff(keys // stride, append=num_images))
+    num_points2D[keys[last] // stride] = keys[last] % stride + 1
+    point2D_offsets = np.zeros(num_images + 1, np.int64)
+    np.cumsum(num_points2D, out=point2D_offsets[1:])
+    positions = point2D_offsets[obs_image_idxs] + obs_point2D_idxs
+    # the measurements are relative to the principal point
+    principal_points = np.array([_focal_and_principal_point(cameras[camera_ids[name]])[1] for name in names])
+    xys = np.zeros((point2D_offsets[-1], 2))
+    xys[positions] = obs_xys + principal_points.reshape(-1, 2)[obs_image_idxs]
+    point3D_ids = np.full(point2D_offsets[-1], -1, np.int64)
+    point3D_ids[positions] = obs_point3D_ids
+
+    # Skip the focal length. Skip the distortion and terminal 0.
+    qvecs = np.array([data[2:6] for data in image_data], float).reshape(-1, 4)
+    tvecs = camera_center_to_translation(np.array([data[6:9] for data in image_data], float).reshape(-1, 3), qvecs)
+
+    images = ImagesArrays(
+        ids=image_idx_to_db_image_id.astype(np.int32),
+        qvecs=qvecs,
+        tvecs=tvecs,
+        camera_ids=np.array([camera_ids[name] for name in names], np.int32),
+        names=np.array(names, dtype=str),
+        point2D_offsets=point2D_offsets,
+        xys=xys,
+        point3D_ids=point3D_ids,
+    )
 
-        image_id = image_ids[name]
-        image = Image(
-            id=image_id, qvec=qvec, tvec=t, camera_id=camera_ids[name], name=name, xys=xys, point3D_ids=point3D_ids
+    return cameras, images, points3D
+
+
+def _focal_and_principal_point(camera):
+    params = np.asarray(camera.params, float)
+    if camera.model in SINGLE_FOCAL_CAMERA_MODELS:
+        return params[0], params[1:3]
+    return params[:2].mean(), params[2:4]
+
+
+def _format_nvm_points(points3D, image_idxs, xys):
+    """format points with their observations (NVM image index, 2D point index, xy) as NVM point lines."""
+    offsets = points3D.track_offsets.tolist()
+    observations = list(
+        map(
+            " ".join,
+            zip(
+                map(str, image_idxs.tolist()),
+                map(str, points3D.track_point2D_idxs.tolist()),
+                map(str, xys[:, 0].tolist()),
+                map(str, xys[:, 1].tolist()),
+            ),
         )
-        images[image_id] = image
+    )
+    lines = []
+    for row, (xyz, rgb) in enumerate(zip(points3D.xyz.tolist(), points3D.rgb.tolist())):
+        point_header = " ".join(map(str, [*xyz, *rgb, offsets[row + 1] - offsets[row]]))
+        lines.append(" ".join([point_header, *observations[offsets[row] : offsets[row + 1]]]))
+    return "".join(line + "\n" for line in lines)
+
+
+def write_nvm_model(model_path, nvm_path, ext="", intrinsics_path=None, batch_size=POINTS3D_BATCH_SIZE):
+    """stream a colmap model to an NVM file.
+
+    measurements are written relative to the principal point, without distortion. the full colmap
+    intrinsics can be written to `intrinsics_path` in the format read by `read_nvm_model`.
+    points are streamed in batches; binary models gather the 2D points from the memory-mapped
+    images.bin, text models keep the 2D points of images.txt in memory.
+
+    :return: number of images and points written.
+    """
+    if ext == "":
+        ext = ".bin" if detect_model_format(model_path, ".bin") else ".txt"
+    read_cameras = read_cameras_binary if ext == ".bin" else read_cameras_text
+    cameras = read_cameras(os.path.join(model_path, "cameras" + ext))
+
+    # image headers, keeping the 2D points only for text models
+    batches = [
+        batch if ext == ".txt" else batch._replace(xys=None, point3D_ids=None)
+        for batch in iter_images(os.path.join(model_path, "images" + ext))
+    ]
+    image_ids = np.concatenate([np.zeros(0, np.int32)] + [batch.ids for batch in batches])
+    qvecs = np.concatenate([np.zeros((0, 4))] + [batch.qvecs for batch in batches])
+    tvecs = np.concatenate([np.zeros((0, 3))] + [batch.tvecs for batch in batches])
+    names = [name for batch in batches for name in batch.names.tolist()]
+    camera_ids = np.concatenate([np.zeros(0, np.int32)] + [batch.camera_ids for batch in batches]).tolist()
+    image_index = IdIndex(image_ids)
+
+    focals, principal_points = zip(*[_focal_and_principal_point(cameras[camera_id]) for camera_id in camera_ids])
+    principal_points = np.array(principal_points).reshape(-1, 2)
+    centers = camera_centers(qvecs, tvecs)
+
+    num_points = 0
+    with LazyModel(model_path) if ext == ".bin" else nullcontext() as lazy_model, open(nvm_path, "wb") as fid:
+        if ext == ".bin":
+            # nvm image index to record row of the mapped images.bin
+            records = lazy_model.image_rows(image_ids)
+
+            def points2D_xys(rows, point2D_idxs):
+                return lazy_model.points2D_xys(records[rows], point2D_idxs)
 
-    return cameras, images, points3D
+        else:
+            num_points2D = np.concatenate(
+                [np.zeros(0, np.int64)] + [np.diff(batch.point2D_offsets) for batch in batches]
+            )
+            point2D_offsets = np.concatenate([[0], np.cumsum(num_points2D)])
+            all_xys = np.concatenate([np.zeros((0, 2))] + [batch.xys for batch in batches])
+
+            def points2D_xys(rows, point2D_idxs):
+                return all_xys[point2D_offsets[rows] + point2D_idxs]
+
+        fid.write(f"NVM_V3\n\n{len(names)}\n".encode("utf-8"))
+        camera_lines = (
+            " ".join(map(str, [name, focal, *qvec, *center, 0, 0]))
+            for name, focal, qvec, center in zip(names, focals, qvecs.tolist(), centers.tolist())
+        )
+        fid.write("".join(line + "\n" for line in camera_lines).encode("utf-8"))
+
+        # the point count is patched once all points are written
+        count_offset = fid.tell()
+        fid.write(b"\n" + b" " * 20 + b"\n")
+        for points3D in iter_points3D(os.path.join(model_path, "points3D" + ext), batch_size):
+            rows = image_index.rows(points3D.track_image_ids)
+            xys = points2D_xys(rows, points3D.track_point2D_idxs) - principal_points[rows]
+            fid.write(_format_nvm_points(points3D, rows, xys).encode("utf-8"))
+            num_points += len(points3D.ids)
+        fid.write(b"\n0\n")
+        fid.seek(count_offset + 1)
+        fid.write(str(num_points).encode("utf-8"))
+
+    if intrinsics_path is not None:
+        with open(intrinsics_path, "w") as f:
+            for name, camera_id in zip(names, camera_ids):
+                camera = cameras[camera_id]
+                f.write(" ".join(map(str, [name, camera.model, camera.width, camera.height, *camera.params])) + "\n")
+
+    return len(names), num_points
 
 
 def main(nvm, intrinsics, database, output, skip_points=False):
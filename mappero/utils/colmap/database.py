@@ -31,8 +31,14 @@
 
 # This script is based on an original implementation by True Price.
 
+import collections
 import sys
 import sqlite3
+import time
+from contextlib import nullcontext
+from itertools import islice
+from operator import itemgetter
+
 import numpy as np
 
 
@@ -40,6 +46,20 @@ IS_PYTHON3 = sys.version_info[0] >= 3
 
 MAX_IMAGE_ID = 2**31 - 1
 
+# rows sorted and inserted per executemany call by the add_*_many methods
+INSERT_BATCH_SIZE = 1 << 12
+# keys bound per SELECT ... IN (...) query, below the default sqlite variable limit
+SELECT_BATCH_SIZE = 900
+
+# concatenated blobs of all rows, rows of entry i are data[offsets[i] : offsets[i + 1]]
+KeypointsArrays = collections.namedtuple("KeypointsArrays", ["image_ids", "offsets", "data"])
+DescriptorsArrays = collections.namedtuple("DescriptorsArrays", ["image_ids", "offsets", "data"])
+MatchesArrays = collections.namedtuple("MatchesArrays", ["pair_ids", "image_ids1", "image_ids2", "offsets", "matches"])
+TwoViewGeometriesArrays = collections.namedtuple(
+    "TwoViewGeometriesArrays",
+    ["pair_ids", "image_ids1", "image_ids2", "offsets", "matches", "configs", "F", "E", "H", "qvecs", "tvecs"],
+)
+
 CREATE_CAMERAS_TABLE = """CREATE TABLE IF NOT EXISTS cameras (
     camera_id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
     model INTEGER NOT NULL,
@@ -100,6 +120,15 @@ CREATE_MATCHES_TABLE = """CREATE TABLE IF NOT EXISTS matches (
 
 CREATE_NAME_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS index_name ON images(name)"
 
+# pragmas trading durability for import throughput, see COLMAPDatabase.enable_fast_mode
+FAST_MODE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA mmap_size = 1073741824",
+    "PRAGMA temp_store = MEMORY",
+)
+
 CREATE_ALL = "; ".join(
     [
         CREATE_CAMERAS_TABLE,
@@ -121,10 +150,21 @@ def image_ids_to_pair_id(image_id1, image_id2):
 
 def pair_id_to_image_ids(pair_id):
     image_id2 = pair_id % MAX_IMAGE_ID
-    image_id1 = (pair_id - image_id2) / MAX_IMAGE_ID
+    image_id1 = (pair_id - image_id2) // MAX_IMAGE_ID
     return image_id1, image_id2
 
 
+def image_ids_to_pair_ids(image_ids1, image_ids2):
+    image_ids1 = np.asarray(image_ids1, np.int64)
+    image_ids2 = np.asarray(image_ids2, np.int64)
+    return np.minimum(image_ids1, image_ids2) * MAX_IMAGE_ID + np.maximum(image_ids1, image_ids2)
+
+
+def pair_ids_to_image_ids(pair_ids):
+    pair_ids = np.asarray(pair_ids, np.int64)
+    return pair_ids // MAX_IMAGE_ID, pair_ids % MAX_IMAGE_ID
+
+
 def array_to_blob(array):
     if IS_PYTHON3:
         return array.tobytes()
@@ -133,16 +173,154 @@ def array_to_blob(array):
 
 
 def blob_to_array(blob, dtype, shape=(-1,)):
-    if IS_PYTHON3:
-        return np.fromstring(blob, dtype=dtype).reshape(*shape)
-    else:
-        return np.frombuffer(blob, dtype=dtype).reshape(*shape)
+    # a writable copy, frombuffer alone gives a read-only view of the blob
+    return np.frombuffer(blob, dtype=dtype).reshape(*shape).copy()
+
+
+def keypoints_row(image_id, keypoints):
+    assert len(keypoints.shape) == 2
+    assert keypoints.shape[1] in [2, 4, 6]
+
+    keypoints = np.asarray(keypoints, np.float32)
+    return (int(image_id),) + keypoints.shape + (array_to_blob(keypoints),)
+
+
+def descriptors_row(image_id, descriptors):
+    descriptors = np.ascontiguousarray(descriptors, np.uint8)
+    return (int(image_id),) + descriptors.shape + (array_to_blob(descriptors),)
+
+
+def matches_row(image_id1, image_id2, matches):
+    assert len(matches.shape) == 2
+    assert matches.shape[1] == 2
+
+    if image_id1 > image_id2:
+        matches = matches[:, ::-1]
+
+    pair_id = image_ids_to_pair_id(int(image_id1), int(image_id2))
+    matches = np.asarray(matches, np.uint32)
+    return (pair_id,) + matches.shape + (array_to_blob(matches),)
+
+
+def two_view_geometry_row(
+    image_id1,
+    image_id2,
+    matches,
+    F=np.eye(3),
+    E=np.eye(3),
+    H=np.eye(3),
+    qvec=np.array([1.0, 0.0, 0.0, 0.0]),
+    tvec=np.zeros(3),
+    config=2,
+):
+    F = np.asarray(F, dtype=np.float64)
+    E = np.asarray(E, dtype=np.float64)
+    H = np.asarray(H, dtype=np.float64)
+
+    qvec = np.asarray(qvec, dtype=np.float64)
+    tvec = np.asarray(tvec, dtype=np.float64)
+    return matches_row(image_id1, image_id2, matches) + (
+        int(config),
+        array_to_blob(F),
+        array_to_blob(E),
+        array_to_blob(H),
+        array_to_blob(qvec),
+        array_to_blob(tvec),
+    )
+
+
+def _offsets(num_rows):
+    offsets = np.zeros(len(num_rows) + 1, np.int64)
+    np.cumsum(num_rows, out=offsets[1:])
+    return offsets
+
+
+def _blobs_to_rows(num_rows, num_cols, blobs, dtype, default_cols):
+    """concatenate variable-size (rows, cols) blobs into one (sum(rows), cols) array."""
+    cols = {c for r, c in zip(num_rows, num_cols) if r > 0}
+    if len(cols) > 1:
+        raise ValueError(f"blobs with different numbers of columns {sorted(cols)}")
+    cols = cols.pop() if cols else default_cols
+    # joined into a bytearray, so that the array is writable without another copy
+    data = np.frombuffer(bytearray().join(blob for blob in blobs if blob is not None), dtype)
+    return data.reshape(-1, cols)
+
+
+def _blobs_to_fixed(blobs, dtype, shape):
+    """stack fixed-size blobs, NaN where a blob is missing."""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if all(blob is not None and len(blob) == size for blob in blobs):
+        return np.frombuffer(bytearray().join(blobs), dtype).reshape((-1,) + shape)
+    data = np.full((len(blobs),) + shape, np.nan, dtype)
+    for i, blob in enumerate(blobs):
+        if blob is not None and len(blob) == size:
+            data[i] = np.frombuffer(blob, dtype).reshape(shape)
+    return data
+
+
+def _keypoints_arrays(rows):
+    image_ids, num_rows, num_cols, blobs = zip(*rows) if rows else ((), (), (), ())
+    return KeypointsArrays(
+        np.array(image_ids, np.int64), _offsets(num_rows), _blobs_to_rows(num_rows, num_cols, blobs, np.float32, 2)
+    )
+
+
+def _descriptors_arrays(rows):
+    image_ids, num_rows, num_cols, blobs = zip(*rows) if rows else ((), (), (), ())
+    return DescriptorsArrays(
+        np.array(image_ids, np.int64), _offsets(num_rows), _blobs_to_rows(num_rows, num_cols, blobs, np.uint8, 128)
+    )
+
+
+def _matches_arrays(rows):
+    pair_ids, num_rows, num_cols, blobs = zip(*rows) if rows else ((), (), (), ())
+    pair_ids = np.array(pair_ids, np.int64)
+    return MatchesArrays(
+        pair_ids,
+        *pair_ids_to_image_ids(pair_ids),
+        _offsets(num_rows),
+        _blobs_to_rows(num_rows, num_cols, blobs, np.uint32, 2),
+    )
+
+
+def _two_view_geometries_arrays(rows):
+    pair_ids, num_rows, num_cols, blobs, configs, F, E, H, qvecs, tvecs = zip(*rows) if rows else ((),) * 10
+    pair_ids = np.array(pair_ids, np.int64)
+    return TwoViewGeometriesArrays(
+        pair_ids,
+        *pair_ids_to_image_ids(pair_ids),
+        _offsets(num_rows),
+        _blobs_to_rows(num_rows, num_cols, blobs, np.uint32, 2),
+        np.array(configs, np.int64),
+        _blobs_to_fixed(F, np.float64, (3, 3)),
+        _blobs_to_fixed(E, np.float64, (3, 3)),
+        _blobs_to_fixed(H, np.float64, (3, 3)),
+        _blobs_to_fixed(qvecs, np.float64, (4,)),
+        _blobs_to_fixed(tvecs, np.float64, (3,)),
+    )
+
+
+KEYPOINTS_COLUMNS = ("image_id", "rows", "cols", "data")
+DESCRIPTORS_COLUMNS = ("image_id", "rows", "cols", "data")
+MATCHES_COLUMNS = ("pair_id", "rows", "cols", "data")
+TWO_VIEW_GEOMETRIES_COLUMNS = ("pair_id", "rows", "cols", "data", "config", "F", "E", "H", "qvec", "tvec")
 
 
 class COLMAPDatabase(sqlite3.Connection):
     @staticmethod
-    def connect(database_path):
-        return sqlite3.connect(str(database_path), factory=COLMAPDatabase)
+    def connect(database_path, fast=False):
+        db = sqlite3.connect(str(database_path), factory=COLMAPDatabase)
+        if fast:
+            db.enable_fast_mode()
+        return db
+
+    def enable_fast_mode(self):
+        """WAL journal, no fsync, 256 MiB page cache and memory-mapped reads for bulk imports.
+
+        the database may be corrupted by a power loss or OS crash while in this mode.
+        """
+        for pragma in FAST_MODE_PRAGMAS:
+            self.execute(pragma)
 
     def __init__(self, *args, **kwargs):
         super(COLMAPDatabase, self).__init__(*args, **kwargs)
@@ -183,73 +361,324 @@ class COLMAPDatabase(sqlite3.Connection):
         return cursor.lastrowid
 
     def add_keypoints(self, image_id, keypoints):
-        assert len(keypoints.shape) == 2
-        assert keypoints.shape[1] in [2, 4, 6]
-
-        keypoints = np.asarray(keypoints, np.float32)
-        self.execute(
-            "INSERT INTO keypoints VALUES (?, ?, ?, ?)", (image_id,) + keypoints.shape + (array_to_blob(keypoints),)
-        )
+        self.execute("INSERT INTO keypoints VALUES (?, ?, ?, ?)", keypoints_row(image_id, keypoints))
 
     def add_descriptors(self, image_id, descriptors):
-        descriptors = np.ascontiguousarray(descriptors, np.uint8)
-        self.execute(
-            "INSERT INTO descriptors VALUES (?, ?, ?, ?)",
-            (image_id,) + descriptors.shape + (array_to_blob(descriptors),),
-        )
+        self.execute("INSERT INTO descriptors VALUES (?, ?, ?, ?)", descriptors_row(image_id, descriptors))
 
     def add_matches(self, image_id1, image_id2, matches):
-        assert len(matches.shape) == 2
-        assert matches.shape[1] == 2
-
-        if image_id1 > image_id2:
-            matches = matches[:, ::-1]
-
-        pair_id = image_ids_to_pair_id(image_id1, image_id2)
-        matches = np.asarray(matches, np.uint32)
-        self.execute("INSERT INTO matches VALUES (?, ?, ?, ?)", (pair_id,) + matches.shape + (array_to_blob(matches),))
-
-    def add_two_view_geometry(
-        self,
-        image_id1,
-        image_id2,
-        matches,
-        F=np.eye(3),
-        E=np.eye(3),
-        H=np.eye(3),
-        qvec=np.array([1.0, 0.0, 0.0, 0.0]),
-        tvec=np.zeros(3),
-        config=2,
-    ):
-        assert len(matches.shape) == 2
-        assert matches.shape[1] == 2
-
-        if image_id1 > image_id2:
-            matches = matches[:, ::-1]
+        self.execute("INSERT INTO matches VALUES (?, ?, ?, ?)", matches_row(image_id1, image_id2, matches))
 
-        pair_id = image_ids_to_pair_id(image_id1, image_id2)
-        matches = np.asarray(matches, np.uint32)
+    def add_two_view_geometry(self, image_id1, image_id2, matches, *args, **kwargs):
+        self.execute(
+            "INSERT INTO two_view_geometries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            two_view_geometry_row(image_id1, image_id2, matches, *args, **kwargs),
+        )
 
-        F = np.asarray(F, dtype=np.float64)
-        E = np.asarray(E, dtype=np.float64)
-        H = np.asarray(H, dtype=np.float64)
+    def _insert_many(self, table, num_columns, rows, commit=True):
+        """insert rows in one transaction, committed on success unless `commit` is False.
+
+        rows are sorted by primary key in batches so that sqlite appends to its b-tree pages. with
+        `commit` False the rows join the open transaction, which the caller commits or rolls back.
+        """
+        query = f"INSERT INTO {table} VALUES ({', '.join('?' * num_columns)})"
+        rows = iter(rows)
+        with self if commit else nullcontext():
+            while True:
+                batch = list(islice(rows, INSERT_BATCH_SIZE))
+                if not batch:
+                    break
+                self.executemany(query, sorted(batch, key=itemgetter(0)))
+
+    def add_keypoints_many(self, items, commit=True):
+        """insert (image_id, keypoints) items in one transaction."""
+        self._insert_many("keypoints", 4, (keypoints_row(*item) for item in items), commit)
+
+    def add_descriptors_many(self, items, commit=True):
+        """insert (image_id, descriptors) items in one transaction."""
+        self._insert_many("descriptors", 4, (descriptors_row(*item) for item in items), commit)
+
+    def add_matches_many(self, items, commit=True):
+        """insert (image_id1, image_id2, matches) items in one transaction."""
+        self._insert_many("matches", 4, (matches_row(*item) for item in items), commit)
+
+    def add_two_view_geometries_many(self, items, commit=True):
+        """insert items with the arguments of `add_two_view_geometry` in one transaction."""
+        self._insert_many("two_view_geometries", 10, (two_view_geometry_row(*item) for item in items), commit)
+
+    def _select(self, table, columns, keys=None):
+        """rows of `table` ordered by their key, the first column, restricted to `keys` if given."""
+        query = f"SELECT {', '.join(columns)} FROM {table}"
+        if keys is None:
+            return self.execute(f"{query} ORDER BY {columns[0]}").fetchall()
+        keys = np.unique(np.asarray(keys, np.int64)).tolist()
+        rows = []
+        for begin in range(0, len(keys), SELECT_BATCH_SIZE):
+            batch = keys[begin : begin + SELECT_BATCH_SIZE]
+            where = f"WHERE {columns[0]} IN ({', '.join('?' * len(batch))})"
+            rows += self.execute(f"{query} {where} ORDER BY {columns[0]}", batch).fetchall()
+        return rows
+
+    def _iter_select(self, table, columns, batch_size):
+        """batches of at most `batch_size` rows of `table` ordered by their key."""
+        cursor = self.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+    def read_keypoints(self, image_ids=None):
+        """`KeypointsArrays` of all images or of `image_ids`."""
+        return _keypoints_arrays(self._select("keypoints", KEYPOINTS_COLUMNS, image_ids))
+
+    def read_descriptors(self, image_ids=None):
+        """`DescriptorsArrays` of all images or of `image_ids`."""
+        return _descriptors_arrays(self._select("descriptors", DESCRIPTORS_COLUMNS, image_ids))
+
+    def read_matches(self, pair_ids=None):
+        """`MatchesArrays` of all pairs or of `pair_ids`."""
+        return _matches_arrays(self._select("matches", MATCHES_COLUMNS, pair_ids))
+
+    def read_two_view_geometries(self, pair_ids=None):
+        """`TwoViewGeometriesArrays` of all verified pairs or of `pair_ids`."""
+        return _two_view_geometries_arrays(self._select("two_view_geometries", TWO_VIEW_GEOMETRIES_COLUMNS, pair_ids))
+
+    def iter_keypoints(self, batch_size=1 << 10):
+        """stream `KeypointsArrays` batches of `batch_size` images."""
+        return map(_keypoints_arrays, self._iter_select("keypoints", KEYPOINTS_COLUMNS, batch_size))
+
+    def iter_descriptors(self, batch_size=1 << 10):
+        """stream `DescriptorsArrays` batches of `batch_size` images."""
+        return map(_descriptors_arrays, self._iter_select("descriptors", DESCRIPTORS_COLUMNS, batch_size))
+
+    def iter_matches(self, batch_size=1 << 14):
+        """stream `MatchesArrays` batches of `batch_size` pairs."""
+        return map(_matches_arrays, self._iter_select("matches", MATCHES_COLUMNS, batch_size))
+
+    def iter_two_view_geometries(self, batch_size=1 << 14):
+        """stream `TwoViewGeometriesArrays` batches of `batch_size` pairs."""
+        return map(
+            _two_view_geometries_arrays,
+            self._iter_select("two_view_geometries", TWO_VIEW_GEOMETRIES_COLUMNS, batch_size),
+        )
 
-        qvec = np.asarray(qvec, dtype=np.float64)
-        tvec = np.asarray(tvec, dtype=np.float64)
+    def merge_database(
+        self, database_path, share_cameras=False, on_duplicate="skip", name_prefix="", camera_id: int = None
+    ):
+        """append the cameras, images, features, matches and two-view geometries of another database.
+
+        cameras and images get new ids in this database. with `share_cameras`, cameras identical to
+        an existing one are reused. with `camera_id`, all appended images use this existing camera and
+        no camera is appended, as when merging shards extracted with a single camera. images whose
+        name, after adding `name_prefix`, already exists are skipped with their pairs when
+        `on_duplicate` is "skip" and raise a ValueError when it is "error".
+        everything is appended in one transaction, so a failure leaves this database unchanged.
+        returns the mapping from the other image ids to the ids of the appended images.
+        """
+        if on_duplicate not in ("skip", "error"):
+            raise ValueError(f"unknown duplicate policy: {on_duplicate}")
+
+        other = COLMAPDatabase.connect(database_path)
+        try:
+            with self:
+                existing_names = {name for (name,) in self.execute("SELECT name FROM images")}
+                other_images = [
+                    (row[0], name_prefix + row[1]) + row[2:]
+                    for row in other.execute("SELECT * FROM images ORDER BY image_id").fetchall()
+                ]
+                duplicates = [row[1] for row in other_images if row[1] in existing_names]
+                if duplicates and on_duplicate == "error":
+                    raise ValueError(f"{len(duplicates)} images already in the database, e.g. {duplicates[0]}")
+                other_images = [row for row in other_images if row[1] not in existing_names]
+                used_cameras = {row[2] for row in other_images}
+
+                camera_ids = {}
+                if camera_id is not None:
+                    if self.execute("SELECT 1 FROM cameras WHERE camera_id=?", (camera_id,)).fetchone() is None:
+                        raise ValueError(f"unknown camera id: {camera_id}")
+                    camera_ids = dict.fromkeys(used_cameras, camera_id)
+                    used_cameras = set()
+                existing = {tuple(row[1:]): row[0] for row in self.execute("SELECT * FROM cameras")}
+                for row in other.execute("SELECT * FROM cameras ORDER BY camera_id"):
+                    if row[0] not in used_cameras:
+                        continue
+                    if share_cameras and tuple(row[1:]) in existing:
+                        camera_ids[row[0]] = existing[tuple(row[1:])]
+                        continue
+                    query = f"INSERT INTO cameras VALUES ({', '.join('?' * len(row))})"
+                    camera_ids[row[0]] = self.execute(query, (None,) + row[1:]).lastrowid
+                    existing.setdefault(tuple(row[1:]), camera_ids[row[0]])
+
+                # images are appended in id order, so the order of the ids within every pair is kept
+                image_ids = {}
+                for row in other_images:
+                    query = f"INSERT INTO images VALUES ({', '.join('?' * len(row))})"
+                    image_ids[row[0]] = self.execute(query, (None, row[1], camera_ids[row[2]]) + row[3:]).lastrowid
+                if not image_ids:
+                    return image_ids
+
+                old_ids = np.array(sorted(image_ids), np.int64)
+                new_ids = np.array([image_ids[image_id] for image_id in old_ids.tolist()], np.int64)
+
+                def remap(ids):
+                    """new ids, and whether each image was appended."""
+                    rows = np.minimum(np.searchsorted(old_ids, ids), len(old_ids) - 1)
+                    return old_ids[rows] == ids, new_ids[rows]
+
+                for batch in other.iter_keypoints():
+                    found, ids = remap(batch.image_ids)
+                    keypoints = np.split(batch.data, batch.offsets[1:-1])
+                    self.add_keypoints_many(
+                        ((ids[i], keypoints[i]) for i in np.flatnonzero(found).tolist()), commit=False
+                    )
+                for batch in other.iter_descriptors():
+                    found, ids = remap(batch.image_ids)
+                    descriptors = np.split(batch.data, batch.offsets[1:-1])
+                    self.add_descriptors_many(
+                        ((ids[i], descriptors[i]) for i in np.flatnonzero(found).tolist()), commit=False
+                    )
+                for batch in other.iter_matches():
+                    found1, ids1 = remap(batch.image_ids1)
+                    found2, ids2 = remap(batch.image_ids2)
+                    matches = np.split(batch.matches, batch.offsets[1:-1])
+                    self.add_matches_many(
+                        ((ids1[i], ids2[i], matches[i]) for i in np.flatnonzero(found1 & found2).tolist()),
+                        commit=False,
+                    )
+                for batch in other.iter_two_view_geometries():
+                    found1, ids1 = remap(batch.image_ids1)
+                    found2, ids2 = remap(batch.image_ids2)
+                    matches = np.split(batch.matches, batch.offsets[1:-1])
+                    self.add_two_view_geometries_many(
+                        (
+                            (
+                                ids1[i],
+                                ids2[i],
+                                matches[i],
+                                batch.F[i],
+                                batch.E[i],
+                                batch.H[i],
+                                batch.qvecs[i],
+                                batch.tvecs[i],
+                                batch.configs[i],
+                            )
+                            for i in np.flatnonzero(found1 & found2).tolist()
+                        ),
+                        commit=False,
+                    )
+        finally:
+            other.close()
+        return image_ids
+
+    def incremental_pairs(self, image_ids):
+        """pairs of each of `image_ids` with every image, except pairs already matched or verified.
+
+        pairs whose raw matches were deleted by `delete_unverified_matches` are still in
+        two_view_geometries, so they are not matched again.
+
+        yields (image_ids1, image_ids2) arrays, one batch per image.
+        """
+        image_ids = np.unique(np.asarray(image_ids, np.int64))
+        all_ids = np.array(self.execute("SELECT image_id FROM images ORDER BY image_id").fetchall(), np.int64)
+        all_ids = all_ids.reshape(-1)
+        matched = np.array(
+            self.execute("SELECT pair_id FROM matches UNION SELECT pair_id FROM two_view_geometries").fetchall(),
+            np.int64,
+        ).reshape(-1)
+        # sorted once, the pairs of each image are then looked up in O(n log M)
+        matched = np.append(np.sort(matched), -1)
+        is_new = np.isin(all_ids, image_ids)
+        for image_id in image_ids.tolist():
+            # pairs between two of the images are generated once, from the smaller id
+            others = all_ids[(all_ids != image_id) & (~is_new | (all_ids > image_id))]
+            pair_ids = image_ids_to_pair_ids(image_id, others)
+            # the -1 sentinel is never a pair id, so positions past the last match compare unequal
+            others = others[matched[np.searchsorted(matched[:-1], pair_ids)] != pair_ids]
+            yield np.full(len(others), image_id), others
+
+    def delete_unverified_matches(self):
+        """delete the raw matches of pairs without inliers in two_view_geometries, returns the number of rows."""
+        cursor = self.execute(
+            "DELETE FROM matches WHERE pair_id NOT IN (SELECT pair_id FROM two_view_geometries WHERE rows > 0)"
+        )
+        return cursor.rowcount
+
+    def delete_matches(self):
+        """delete all matches and two-view geometries, returns the number of rows."""
+        return sum(self.execute(f"DELETE FROM {table}").rowcount for table in ("matches", "two_view_geometries"))
+
+    def delete_descriptors(self):
+        """delete all descriptors, returns the number of rows."""
+        return self.execute("DELETE FROM descriptors").rowcount
+
+    def delete_images_not_in(self, names):
+        """delete the images not named in `names` with their features, pairs and unused cameras.
+
+        returns the number of deleted images.
+        """
+        self.execute("CREATE TEMP TABLE IF NOT EXISTS kept_names (name TEXT PRIMARY KEY)")
+        self.execute("DELETE FROM kept_names")
+        self.executemany("INSERT OR IGNORE INTO kept_names VALUES (?)", ((name,) for name in names))
+        self.execute("CREATE TEMP TABLE IF NOT EXISTS deleted_images (image_id INTEGER PRIMARY KEY)")
+        self.execute("DELETE FROM deleted_images")
         self.execute(
-            "INSERT INTO two_view_geometries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (pair_id,)
-            + matches.shape
-            + (
-                array_to_blob(matches),
-                config,
-                array_to_blob(F),
-                array_to_blob(E),
-                array_to_blob(H),
-                array_to_blob(qvec),
-                array_to_blob(tvec),
-            ),
+            "INSERT INTO deleted_images SELECT image_id FROM images WHERE name NOT IN (SELECT name FROM kept_names)"
         )
+        for table in ("keypoints", "descriptors", "images"):
+            self.execute(f"DELETE FROM {table} WHERE image_id IN (SELECT image_id FROM deleted_images)")
+        for table in ("matches", "two_view_geometries"):
+            self.execute(
+                f"DELETE FROM {table} WHERE pair_id / {MAX_IMAGE_ID} IN (SELECT image_id FROM deleted_images) "
+                f"OR pair_id % {MAX_IMAGE_ID} IN (SELECT image_id FROM deleted_images)"
+            )
+        self.execute("DELETE FROM cameras WHERE camera_id NOT IN (SELECT camera_id FROM images)")
+        num_deleted = self.execute("SELECT COUNT(*) FROM deleted_images").fetchone()[0]
+        self.execute("DROP TABLE kept_names")
+        self.execute("DROP TABLE deleted_images")
+        return num_deleted
+
+    def vacuum(self):
+        """commit and rebuild the database file to release the space of deleted rows."""
+        self.commit()
+        self.execute("VACUUM")
+
+
+def benchmark_bulk_insert(database_dir, num_images=1000, num_pairs=100000, num_matches=100):
+    """rows/s importing matches and two-view geometries row by row or in bulk, each without and with fast mode."""
+    import os
+
+    rng = np.random.default_rng(0)
+    pairs = rng.integers(1, num_images + 1, size=(4 * num_pairs, 2))
+    pairs = np.unique(np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1), axis=0)
+    pairs = pairs[rng.permutation(len(pairs))[:num_pairs]].tolist()
+    matches = rng.integers(0, 8192, size=(num_matches, 2), dtype=np.uint32)
+
+    results = {}
+    for mode in ("row", "row_fast", "bulk", "bulk_fast"):
+        database_path = os.path.join(database_dir, f"benchmark_{mode}.db")
+        if os.path.exists(database_path):
+            os.remove(database_path)
+        db = COLMAPDatabase.connect(database_path, fast=mode.endswith("_fast"))
+        db.create_tables()
+
+        start = time.perf_counter()
+        if mode.startswith("row"):
+            for image_id1, image_id2 in pairs:
+                db.add_matches(image_id1, image_id2, matches)
+                db.add_two_view_geometry(image_id1, image_id2, matches)
+            db.commit()
+        else:
+            db.add_matches_many((image_id1, image_id2, matches) for image_id1, image_id2 in pairs)
+            db.add_two_view_geometries_many((image_id1, image_id2, matches) for image_id1, image_id2 in pairs)
+        elapsed = time.perf_counter() - start
+
+        db.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(database_path + suffix):
+                os.remove(database_path + suffix)
+        results[mode] = 2 * len(pairs) / elapsed
+    return results
 
 
 def example_usage():
@@ -258,8 +687,15 @@ def example_usage():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--database_path", default="database.db")
+    parser.add_argument("--benchmark", action="store_true", help="benchmark bulk inserts next to the database path")
     args = parser.parse_args()
 
+    if args.benchmark:
+        results = benchmark_bulk_insert(os.path.dirname(os.path.abspath(args.database_path)))
+        for mode, rows_per_second in results.items():
+            print(f"{mode}: {rows_per_second:.0f} rows/s")
+        return
+
     if os.path.exists(args.database_path):
         print("ERROR: database path already exists -- will not modify it.")
         return
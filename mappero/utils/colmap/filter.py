@@ -0,0 +1,121 @@
+import numpy as np
+
+from .read_write_model import ImagesArrays, camera_centers
+from .reconstruction import Reconstruction
+
+# observation pairs processed at once when measuring triangulation angles
+PAIRS_BATCH_SIZE = 1 << 22
+
+
+def track_length_mask(points3D, min_track_len: int) -> np.ndarray:
+    """points observed in at least `min_track_len` images."""
+    return np.diff(points3D.track_offsets) >= min_track_len
+
+
+def error_mask(points3D, max_error: float) -> np.ndarray:
+    """points with a mean reprojection error of at most `max_error` pixels."""
+    return points3D.error <= max_error
+
+
+def bbox_mask(points3D, bbox_min, bbox_max) -> np.ndarray:
+    """points inside the axis-aligned box [bbox_min, bbox_max]."""
+    xyz = points3D.xyz
+    return np.all((xyz >= np.asarray(bbox_min)) & (xyz <= np.asarray(bbox_max)), axis=1)
+
+
+def _track_pairs(track_offsets, begin: int, end: int):
+    """observation index pairs (i < j) within the tracks of points [begin, end)."""
+    track_lengths = np.diff(track_offsets[begin : end + 1])
+    observations = np.arange(track_offsets[begin], track_offsets[end])
+    # each observation pairs with the ones after it in its track
+    positions = observations - np.repeat(track_offsets[begin:end], track_lengths)
+    num_partners = np.repeat(track_lengths, track_lengths) - positions - 1
+    first = np.repeat(observations, num_partners)
+    starts = np.cumsum(num_partners) - num_partners
+    second = first + 1 + np.arange(len(first)) - np.repeat(starts, num_partners)
+    return first, second
+
+
+def triangulation_angles(reconstruction: Reconstruction, selection=None) -> np.ndarray:
+    """largest angle in degrees between the viewing rays of each point, 0 for single-view tracks.
+
+    :param selection: integer rows or boolean mask of the points to measure, all points by default.
+    """
+    points3D = reconstruction.points3D
+    if selection is not None:
+        points3D = reconstruction.select_points3D(selection)
+    track_offsets = points3D.track_offsets
+    track_lengths = np.diff(track_offsets)
+
+    # unit viewing ray of every observation, zero for images missing from the model
+    image_rows = reconstruction.image_index.lookup(points3D.track_image_ids)
+    centers = camera_centers(reconstruction.images.qvecs, reconstruction.images.tvecs)
+    rays = np.repeat(points3D.xyz, track_lengths, axis=0) - centers[image_rows]
+    norms = np.linalg.norm(rays, axis=1, keepdims=True)
+    rays = np.divide(rays, norms, out=np.zeros_like(rays), where=norms > 0)
+    rays[image_rows < 0] = 0
+
+    # split the points into batches of about PAIRS_BATCH_SIZE pairs
+    num_pairs = track_lengths * (track_lengths - 1) // 2
+    pair_offsets = np.concatenate([[0], np.cumsum(num_pairs)])
+    bounds = np.searchsorted(pair_offsets, np.arange(PAIRS_BATCH_SIZE, pair_offsets[-1], PAIRS_BATCH_SIZE))
+    bounds = np.unique(np.concatenate([[0], bounds, [len(points3D.ids)]]))
+
+    min_cosines = np.ones(len(points3D.ids))
+    for begin, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+        first, second = _track_pairs(track_offsets, begin, end)
+        if len(first) == 0:
+            continue
+        cosines = np.einsum("ij,ij->i", rays[first], rays[second])
+        counts = num_pairs[begin:end]
+        has_pairs = np.flatnonzero(counts > 0)
+        min_cosines[begin + has_pairs] = np.minimum.reduceat(cosines, (np.cumsum(counts) - counts)[has_pairs])
+    return np.degrees(np.arccos(np.clip(min_cosines, -1.0, 1.0)))
+
+
+def filter_points3D(reconstruction: Reconstruction, keep) -> Reconstruction:
+    """sub-model with the points where `keep` is set, dropped points are unlinked from the images."""
+    keep = np.asarray(keep, bool)
+    images = reconstruction.images
+
+    rows = reconstruction.point3D_index.lookup(images.point3D_ids)
+    linked = rows >= 0
+    linked[linked] = keep[rows[linked]]
+    point3D_ids = np.where(linked, images.point3D_ids, -1)
+
+    return Reconstruction(
+        reconstruction.cameras,
+        ImagesArrays(*images[:-1], point3D_ids),
+        reconstruction.select_points3D(keep),
+    )
+
+
+def filter_mask(
+    reconstruction: Reconstruction,
+    min_track_len: int = None,
+    max_error: float = None,
+    min_tri_angle: float = None,
+    bbox_min=None,
+    bbox_max=None,
+) -> np.ndarray:
+    """points passing all the given predicates."""
+    points3D = reconstruction.points3D
+    keep = np.ones(len(points3D.ids), bool)
+    if min_track_len is not None:
+        keep &= track_length_mask(points3D, min_track_len)
+    if max_error is not None:
+        keep &= error_mask(points3D, max_error)
+    if bbox_min is not None or bbox_max is not None:
+        bbox_min = np.full(3, -np.inf) if bbox_min is None else bbox_min
+        bbox_max = np.full(3, np.inf) if bbox_max is None else bbox_max
+        keep &= bbox_mask(points3D, bbox_min, bbox_max)
+    if min_tri_angle is not None:
+        # only measure the points still kept
+        candidates = np.flatnonzero(keep)
+        keep[candidates[triangulation_angles(reconstruction, candidates) < min_tri_angle]] = False
+    return keep
+
+
+def filter_model(reconstruction: Reconstruction, **predicates) -> Reconstruction:
+    """sub-model with the points passing all the predicates of `filter_mask`."""
+    return filter_points3D(reconstruction, filter_mask(reconstruction, **predicates))
@@ -0,0 +1,172 @@
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from .read_write_model import (
+    _decode_images_binary,
+    _decode_points3D_binary,
+    _gather_values,
+    _scan_images_binary,
+    _scan_points3D_binary,
+    images_arrays_to_dict,
+    points3D_arrays_to_dict,
+    read_cameras_binary,
+)
+
+
+def _map_file(path):
+    """memory-map a file read-only."""
+    with open(path, "rb") as fid:
+        return mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LazyModel:
+    """memory-mapped binary colmap model that decodes images and points3D on access.
+
+    opening only scans the record length prefixes of images.bin to build an offset index, the
+    points3D.bin index is built on the first access to the points; records are decoded from the
+    mapped files when they are requested.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cameras = read_cameras_binary(os.path.join(path, "cameras.bin"))
+
+        # images index
+        self._images_buffer = _map_file(os.path.join(path, "images.bin"))
+        num_images = struct.unpack_from("<Q", self._images_buffer, 0)[0]
+        self._image_starts, self._image_name_ends, self._num_points2D, _ = _scan_images_binary(
+            self._images_buffer, 8, num_images
+        )
+        self.image_ids = _gather_values(self._images_buffer, self._image_starts, np.int32)
+        self._image_order = np.argsort(self.image_ids, kind="stable")
+        self._sorted_image_ids = self.image_ids[self._image_order]
+        self._image_name_rows = None
+
+        # points3D index, scanned on first use
+        self._points3D_buffer = _map_file(os.path.join(path, "points3D.bin"))
+        self._num_points3D = struct.unpack_from("<Q", self._points3D_buffer, 0)[0]
+        self._point3D_starts = None
+        self._xyz = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """unmap the model files."""
+        self._images_buffer.close()
+        self._points3D_buffer.close()
+
+    @property
+    def num_images(self) -> int:
+        return len(self.image_ids)
+
+    @property
+    def num_points3D(self) -> int:
+        return self._num_points3D
+
+    def _index_points3D(self) -> None:
+        if self._point3D_starts is None:
+            self._point3D_starts, self._track_lengths, _ = _scan_points3D_binary(
+                self._points3D_buffer, 8, self._num_points3D
+            )
+            self._point3D_ids = _gather_values(self._points3D_buffer, self._point3D_starts, np.int64)
+            self._point3D_order = np.argsort(self._point3D_ids, kind="stable")
+            self._sorted_point3D_ids = self._point3D_ids[self._point3D_order]
+
+    @property
+    def point3D_ids(self) -> np.ndarray:
+        """ids of all points3D, in record order."""
+        self._index_points3D()
+        return self._point3D_ids
+
+    @property
+    def xyz(self) -> np.ndarray:
+        """positions of all points3D, gathered from the mapped file on first use."""
+        if self._xyz is None:
+            self._index_points3D()
+            starts = self._point3D_starts
+            self._xyz = np.stack(
+                [_gather_values(self._points3D_buffer, starts + 8 + 8 * k, np.float64) for k in range(3)], axis=1
+            )
+        return self._xyz
+
+    @staticmethod
+    def _rows(sorted_ids, order, ids) -> np.ndarray:
+        ids = np.atleast_1d(np.asarray(ids, sorted_ids.dtype))
+        index = np.searchsorted(sorted_ids, ids)
+        found = index < len(sorted_ids)
+        found[found] = sorted_ids[index[found]] == ids[found]
+        if not np.all(found):
+            raise KeyError(ids[~found].tolist())
+        return order[index]
+
+    def image_rows(self, image_ids) -> np.ndarray:
+        """record index of each image id, raises KeyError for unknown ids."""
+        return self._rows(self._sorted_image_ids, self._image_order, image_ids)
+
+    def point3D_rows(self, point3D_ids) -> np.ndarray:
+        """record index of each point3D id, raises KeyError for unknown ids."""
+        self._index_points3D()
+        return self._rows(self._sorted_point3D_ids, self._point3D_order, point3D_ids)
+
+    def points2D_xys(self, rows, point2D_idxs) -> np.ndarray:
+        """positions of the 2D points `point2D_idxs` of the images at `rows`, gathered from the mapped file."""
+        rows = np.asarray(rows, np.int64)
+        point2D_idxs = np.asarray(point2D_idxs, np.int64)
+        if np.any(point2D_idxs >= self._num_points2D[rows]):
+            raise IndexError("2D point index out of range")
+        # records continue after the name with the point count and (x, y, point3D_id) triplets
+        positions = self._image_name_ends[rows] + 1 + 8 + 24 * point2D_idxs
+        return np.stack([_gather_values(self._images_buffer, positions + 8 * k, np.float64) for k in range(2)], axis=1)
+
+    def images_arrays(self, rows):
+        """decode the image records at `rows` into `ImagesArrays`."""
+        rows = np.atleast_1d(np.asarray(rows, np.int64))
+        return _decode_images_binary(
+            self._images_buffer, self._image_starts[rows], self._image_name_ends[rows], self._num_points2D[rows]
+        )
+
+    def points3D_arrays(self, rows):
+        """decode the point records at `rows` into `Points3DArrays`."""
+        rows = np.atleast_1d(np.asarray(rows, np.int64))
+        self._index_points3D()
+        return _decode_points3D_binary(self._points3D_buffer, self._point3D_starts[rows], self._track_lengths[rows])
+
+    def image(self, image_id):
+        """decode a single `Image`."""
+        return images_arrays_to_dict(self.images_arrays(self.image_rows(image_id)))[image_id]
+
+    def image_by_name(self, name):
+        """decode a single `Image` from its name."""
+        if self._image_name_rows is None:
+            buffer = self._images_buffer
+            spans = zip(self._image_starts.tolist(), self._image_name_ends.tolist())
+            self._image_name_rows = {
+                bytes(buffer[start + 64 : name_end]).decode("utf-8"): row for row, (start, name_end) in enumerate(spans)
+            }
+        row = self._image_name_rows[name]
+        return images_arrays_to_dict(self.images_arrays(row))[int(self.image_ids[row])]
+
+    def images(self, image_ids):
+        """decode several images into a dict of `Image`."""
+        return images_arrays_to_dict(self.images_arrays(self.image_rows(image_ids)))
+
+    def point3D(self, point3D_id):
+        """decode a single `Point3D`."""
+        return points3D_arrays_to_dict(self.points3D_arrays(self.point3D_rows(point3D_id)))[point3D_id]
+
+    def points3D(self, point3D_ids):
+        """decode several points into a dict of `Point3D`."""
+        return points3D_arrays_to_dict(self.points3D_arrays(self.point3D_rows(point3D_ids)))
+
+    def points3D_in_bbox(self, bbox_min, bbox_max):
+        """decode the points inside the axis-aligned box [bbox_min, bbox_max] into `Points3DArrays`."""
+        xyz = self.xyz
+        inside = np.all((xyz >= np.asarray(bbox_min)) & (xyz <= np.asarray(bbox_max)), axis=1)
+        return self.points3D_arrays(np.flatnonzero(inside))
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from mappero.pipeline.fingerprint import FileHasher
+
+from .read_write_model import Camera, ImagesArrays, Points3DArrays
+
+# version 2 hashes the model files in full
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = Path(os.environ.get("MAPPERO_CACHE_DIR", Path.home() / ".cache" / "mappero" / "models"))
+DEFAULT_CACHE_SIZE = 20 * 1024**3
+
+
+class ModelCache:
+    """columnar .npy sidecar cache of decoded colmap models.
+
+    entries are keyed by the size, mtime and full content hash of the model files, so a changed
+    model misses the cache, and the least recently used entries are evicted once the cache grows
+    beyond `max_bytes`. the content hashes are kept in hashes.json and reused while the size and
+    mtime of a file are unchanged, so an unchanged model is not read again.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_SIZE):
+        """
+        :param cache_dir: directory holding one sub-directory per cached model.
+        :param max_bytes: size above which least recently used entries are evicted.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def _load_hashes(self) -> dict:
+        try:
+            with open(self.cache_dir / "hashes.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_hashes(self, hashes: dict) -> None:
+        # replace the file at once, concurrent readers see the previous hashes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_dir / f"hashes.json.tmp-{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(hashes, f)
+        os.replace(tmp_path, self.cache_dir / "hashes.json")
+
+    def key(self, path, ext: str) -> str:
+        """cache key of the model files at `path`."""
+        known_hashes = self._load_hashes()
+        hasher = FileHasher(known_hashes)
+        fingerprints = [CACHE_VERSION]
+        for name in ("cameras", "images", "points3D"):
+            file_path = os.path.join(path, name + ext)
+            stat = os.stat(file_path)
+            fingerprints.append([name, stat.st_size, stat.st_mtime_ns, hasher.hash_file(file_path)])
+        if any(known_hashes.get(file_key) != known for file_key, known in hasher.hashes.items()):
+            self._save_hashes({**known_hashes, **hasher.hashes})
+        return hashlib.sha256(json.dumps(fingerprints).encode("utf-8")).hexdigest()
+
+    def load(self, key: str):
+        """memory-map a cached model, or return None on a miss."""
+        entry = self.cache_dir / key
+        if not entry.is_dir():
+            return None
+        try:
+            with open(entry / "cameras.json") as f:
+                cameras = {
+                    int(camera_id): Camera(
+                        id=int(camera_id), model=model, width=width, height=height, params=np.array(params)
+                    )
+                    for camera_id, (model, width, height, params) in json.load(f).items()
+                }
+            # plain ndarray views of the maps, every slice of a np.memmap runs python code
+            images = ImagesArrays(
+                *(
+                    np.load(entry / f"images.{field}.npy", mmap_mode="r").view(np.ndarray)
+                    for field in ImagesArrays._fields
+                )
+            )
+            points3D = Points3DArrays(
+                *(
+                    np.load(entry / f"points3D.{field}.npy", mmap_mode="r").view(np.ndarray)
+                    for field in Points3DArrays._fields
+                )
+            )
+        except (OSError, ValueError) as e:
+            logger.warning(f"dropping unreadable model cache entry {entry}: {e}")
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        # mark as recently used
+        os.utime(entry)
+        return cameras, images, points3D
+
+    def store(self, key: str, cameras, images, points3D) -> None:
+        """write a decoded model to the cache and evict old entries."""
+        entry = self.cache_dir / key
+        tmp_entry = self.cache_dir / f"{key}.tmp-{os.getpid()}"
+        tmp_entry.mkdir(parents=True, exist_ok=True)
+        with open(tmp_entry / "cameras.json", "w") as f:
+            json.dump(
+                {cam.id: [cam.model, cam.width, cam.height, list(map(float, cam.params))] for cam in cameras.values()},
+                f,
+            )
+        for field, array in zip(ImagesArrays._fields, images):
+            np.save(tmp_entry / f"images.{field}.npy", np.ascontiguousarray(array))
+        for field, array in zip(Points3DArrays._fields, points3D):
+            np.save(tmp_entry / f"points3D.{field}.npy", np.ascontiguousarray(array))
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process stored the same entry meanwhile
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    def evict(self) -> None:
+        """remove the least recently used entries until the cache fits in `max_bytes`."""
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            if entry.is_dir() and ".tmp-" not in entry.name:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            logger.info(f"evicting model cache entry {entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
@@ -30,10 +30,14 @@
 # Author: Johannes L. Schoenberger (jsch-at-demuc-dot-de)
 
 import os
+import array
 import collections
+import itertools
+import mmap
 import numpy as np
 import struct
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
 # logger
@@ -47,11 +51,28 @@ BaseImage = collections.namedtuple("Image", ["id", "qvec", "tvec", "camera_id",
 Point3D = collections.namedtuple("Point3D", ["id", "xyz", "rgb", "error", "image_ids", "point2D_idxs"])
 
 
+Points3DArrays = collections.namedtuple(
+    "Points3DArrays", ["ids", "xyz", "rgb", "error", "track_offsets", "track_image_ids", "track_point2D_idxs"]
+)
+
+ImagesArrays = collections.namedtuple(
+    "ImagesArrays", ["ids", "qvecs", "tvecs", "camera_ids", "names", "point2D_offsets", "xys", "point3D_ids"]
+)
+
+POINT2D_DTYPE = np.dtype([("xy", "<f8", (2,)), ("point3D_id", "<i8")])
+
+
 class Image(BaseImage):
     def qvec2rotmat(self):
         return qvec2rotmat(self.qvec)
 
 
+IMAGES_BATCH_SIZE = 1 << 10
+POINTS3D_BATCH_SIZE = 1 << 18
+
+# bytes of points3D.bin searched at once for record starts
+SCAN_WINDOW_SIZE = 1 << 20
+
 CAMERA_MODELS = {
     CameraModel(model_id=0, model_name="SIMPLE_PINHOLE", num_params=3),
     CameraModel(model_id=1, model_name="PINHOLE", num_params=4),
@@ -97,6 +118,704 @@ def write_next_bytes(fid, data, format_char_sequence, endian_character="<"):
     fid.write(bytes)
 
 
+def _value_view(buffer, dtype):
+    """view of a buffer as one little-endian value of `dtype` starting at every byte."""
+    dtype = np.dtype(dtype).newbyteorder("<")
+    return np.ndarray(max(len(buffer) - dtype.itemsize + 1, 0), dtype, buffer, 0, (1,))
+
+
+def _gather_values(buffer, positions, dtype):
+    """gather little-endian values of `dtype` stored at arbitrary byte positions of `buffer`."""
+    return _value_view(buffer, dtype)[np.asarray(positions, np.int64)]
+
+
+def _scatter_values(buffer, positions, values, dtype):
+    """store `values` as little-endian `dtype` at arbitrary byte positions of a writable `buffer`."""
+    _value_view(buffer, dtype)[np.asarray(positions, np.int64)] = values
+
+
+def _follow_links(links, count):
+    """the first `count` nodes of the chain 0, links[0], links[links[0]], ... of nodes linked to the next.
+
+    a link to len(links) ends the chain. the chain is followed by pointer doubling, so it takes
+    log2(count) vectorized steps instead of one step per node.
+    """
+    # past the first node, nodes that no node links to are not on the chain
+    num_links_to = np.bincount(links, minlength=len(links) + 1)[: len(links)]
+    num_links_to[0] = 1
+    nodes = np.flatnonzero(num_links_to)
+    renumber = np.full(len(links) + 1, len(nodes), links.dtype)
+    renumber[nodes] = np.arange(len(nodes), dtype=links.dtype)
+    end = len(nodes)
+    jumps = np.append(renumber[links[nodes]], np.asarray(end, links.dtype))
+    chain = np.zeros(1, links.dtype)
+    while len(chain) < count and chain[-1] != end:
+        # jumps links every node to the one 2^k nodes further, the chain doubles
+        chain = np.concatenate([chain, jumps[chain]])
+        jumps = jumps[jumps]
+    chain = chain[:count]
+    return nodes[chain[: np.searchsorted(chain, end)]]
+
+
+def _scan_points3D_binary(buffer, offset, num_points, window_size=SCAN_WINDOW_SIZE):
+    """locate `num_points` point records starting at byte `offset`.
+
+    a record takes 51 bytes and 8 per track element, with its track length at byte 43. the buffer is
+    searched `window_size` bytes at a time: every byte of a window whose track length would fit in
+    the buffer is a candidate start linked to the candidate past its record, and the records are the
+    chain of links from the first one.
+
+    :return: record start offsets, track lengths and the offset past the last record.
+    """
+    chars = np.frombuffer(buffer, np.uint8)
+    track_lengths_view = _value_view(buffer, np.uint64)
+    max_track_length = max(len(buffer) - offset - 51, 0) // 8
+    # high bytes of the track length that are zero in any record that fits in the buffer
+    num_zero_bytes = 8 - (max_track_length.bit_length() + 7) // 8
+    starts, track_lengths = [], []
+    while num_points > 0:
+        size = max(min(window_size, len(buffer) - 50 - offset), 0)
+        zeros = chars[offset + 51 - num_zero_bytes : offset + 51 + size] == 0
+        candidates = np.ones(size, bool)
+        for k in range(num_zero_bytes):
+            candidates &= zeros[k : k + size]
+        candidates = np.flatnonzero(candidates)
+        lengths = track_lengths_view[offset + 43 + candidates]
+        fits = lengths <= max_track_length
+        candidates, lengths = candidates[fits], lengths[fits].astype(np.int64)
+        if len(candidates) == 0 or candidates[0] != 0:
+            raise ValueError(f"truncated points3D record at byte {offset}")
+        successors = np.minimum(candidates + 51 + 8 * lengths, size)
+        # index of every candidate in the window, successors past the window end the chain
+        index = np.full(size + 1, len(candidates), np.int32)
+        index[candidates] = np.arange(len(candidates), dtype=np.int32)
+        chain = _follow_links(index[successors], num_points)
+        starts.append(offset + candidates[chain])
+        track_lengths.append(lengths[chain])
+        num_points -= len(chain)
+        offset += int(candidates[chain[-1]] + 51 + 8 * lengths[chain[-1]])
+    starts = np.concatenate(starts) if starts else np.zeros(0, np.int64)
+    track_lengths = np.concatenate(track_lengths) if track_lengths else np.zeros(0, np.int64)
+    return starts, track_lengths, offset
+
+
+def _decode_points3D_binary(buffer, starts, track_lengths):
+    """decode the point records located at `starts` into columnar arrays."""
+    track_offsets = np.zeros(len(starts) + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    # byte position of every (image_id, point2D_idx) track element
+    track_positions = np.repeat(starts + 51 - 8 * track_offsets[:-1], track_lengths)
+    track_positions += 8 * np.arange(track_offsets[-1], dtype=np.int64)
+    track = _gather_values(buffer, track_positions, (np.int32, 2))
+    return Points3DArrays(
+        ids=_gather_values(buffer, starts, np.int64),
+        xyz=_gather_values(buffer, starts + 8, (np.float64, 3)),
+        rgb=_gather_values(buffer, starts + 32, (np.uint8, 3)),
+        error=_gather_values(buffer, starts + 35, np.float64),
+        track_offsets=track_offsets,
+        track_image_ids=track[:, 0].copy(),
+        track_point2D_idxs=track[:, 1].copy(),
+    )
+
+
+def points3D_arrays_to_dict(points3D):
+    """convert columnar points to the dict of `Point3D` used by `read_model`.
+
+    the fields keep the types of the per-point readers: int64 colors and track ids, and float errors.
+    """
+    if len(points3D.ids) == 0:
+        return {}
+    ids = points3D.ids.tolist()
+    offsets = points3D.track_offsets.tolist()
+    track_image_ids = points3D.track_image_ids.astype(np.int64)
+    track_point2D_idxs = points3D.track_point2D_idxs.astype(np.int64)
+    # slicing is cheaper than np.split, and the records are built from positional fields
+    return dict(
+        zip(
+            ids,
+            map(
+                Point3D._make,
+                zip(
+                    ids,
+                    points3D.xyz,
+                    points3D.rgb.astype(np.int64),
+                    points3D.error.tolist(),
+                    map(track_image_ids.__getitem__, map(slice, offsets[:-1], offsets[1:])),
+                    map(track_point2D_idxs.__getitem__, map(slice, offsets[:-1], offsets[1:])),
+                ),
+            ),
+        )
+    )
+
+
+def _scan_images_binary(buffer, offset, num_images):
+    """walk `num_images` image records starting at byte `offset`.
+
+    unlike points, the records are walked one at a time, each step skips the 2D points of an image
+    without reading them, which is far less than searching all the bytes of the points for records.
+
+    :return: record start offsets, name end offsets (position of the null terminator),
+        number of 2D points per image and the offset past the last record.
+    """
+    read_num_points2D = struct.Struct("<Q").unpack_from
+    starts = array.array("q")
+    name_ends = array.array("q")
+    num_points2D = array.array("q")
+    for _ in range(num_images):
+        name_end = buffer.find(b"\x00", offset + 64)
+        num = read_num_points2D(buffer, name_end + 1)[0]
+        starts.append(offset)
+        name_ends.append(name_end)
+        num_points2D.append(num)
+        offset = name_end + 9 + 24 * num
+    return (
+        np.frombuffer(starts, np.int64),
+        np.frombuffer(name_ends, np.int64),
+        np.frombuffer(num_points2D, np.int64),
+        offset,
+    )
+
+
+def _gather_strings(buffer, begins, ends):
+    """decode the utf-8 strings stored in the byte ranges [begins, ends) of `buffer`."""
+    width = int(np.max(ends - begins, initial=1))
+    columns = np.arange(width)
+    chars = _gather_values(buffer, np.minimum(begins[:, None] + columns, len(buffer) - 1), np.uint8)
+    chars[columns >= (ends - begins)[:, None]] = 0
+    strings = chars.view(f"S{width}").ravel()
+    # bytes decode to str directly when they are all ascii
+    return strings.astype(str) if (chars < 128).all() else np.char.decode(strings, "utf-8")
+
+
+def _decode_images_binary(buffer, starts, name_ends, num_points2D):
+    """decode the image records located at `starts` into columnar arrays."""
+    point2D_offsets = np.zeros(len(starts) + 1, np.int64)
+    np.cumsum(num_points2D, out=point2D_offsets[1:])
+    # byte position of every (x, y, point3D_id) 2D point
+    point2D_positions = np.repeat(name_ends + 9 - 24 * point2D_offsets[:-1], num_points2D)
+    point2D_positions += 24 * np.arange(point2D_offsets[-1], dtype=np.int64)
+    return ImagesArrays(
+        ids=_gather_values(buffer, starts, np.int32),
+        qvecs=_gather_values(buffer, starts + 4, (np.float64, 4)),
+        tvecs=_gather_values(buffer, starts + 36, (np.float64, 3)),
+        camera_ids=_gather_values(buffer, starts + 60, np.int32),
+        names=_gather_strings(buffer, starts + 64, name_ends),
+        point2D_offsets=point2D_offsets,
+        # x and y are gathered together as one complex value
+        xys=_gather_values(buffer, point2D_positions, np.complex128).view(np.float64).reshape(-1, 2),
+        point3D_ids=_gather_values(buffer, point2D_positions + 16, np.int64),
+    )
+
+
+def images_arrays_to_dict(images):
+    """convert columnar images to the dict of `Image` used by `read_model`."""
+    if len(images.ids) == 0:
+        return {}
+    ids = images.ids.tolist()
+    offsets = images.point2D_offsets.tolist()
+    return dict(
+        zip(
+            ids,
+            map(
+                Image._make,
+                zip(
+                    ids,
+                    images.qvecs,
+                    images.tvecs,
+                    images.camera_ids.tolist(),
+                    images.names.tolist(),
+                    map(images.xys.__getitem__, map(slice, offsets[:-1], offsets[1:])),
+                    map(images.point3D_ids.__getitem__, map(slice, offsets[:-1], offsets[1:])),
+                ),
+            ),
+        )
+    )
+
+
+def points3D_dict_to_arrays(points3D):
+    """convert a dict of `Point3D` to columnar `Points3DArrays`."""
+    points = list(points3D.values())
+    track_offsets = np.zeros(len(points) + 1, np.int64)
+    np.cumsum([len(pt.image_ids) for pt in points], out=track_offsets[1:])
+    return Points3DArrays(
+        ids=np.array([pt.id for pt in points], np.int64),
+        xyz=np.array([pt.xyz for pt in points], np.float64).reshape(-1, 3),
+        rgb=np.array([pt.rgb for pt in points], np.uint8).reshape(-1, 3),
+        error=np.array([pt.error for pt in points], np.float64),
+        track_offsets=track_offsets,
+        track_image_ids=np.concatenate([np.zeros(0, np.int32)] + [pt.image_ids for pt in points]).astype(np.int32),
+        track_point2D_idxs=np.concatenate([np.zeros(0, np.int32)] + [pt.point2D_idxs for pt in points]).astype(
+            np.int32
+        ),
+    )
+
+
+def images_dict_to_arrays(images):
+    """convert a dict of `Image` to columnar `ImagesArrays`."""
+    images = list(images.values())
+    point2D_offsets = np.zeros(len(images) + 1, np.int64)
+    np.cumsum([len(img.point3D_ids) for img in images], out=point2D_offsets[1:])
+    return ImagesArrays(
+        ids=np.array([img.id for img in images], np.int32),
+        qvecs=np.array([img.qvec for img in images], np.float64).reshape(-1, 4),
+        tvecs=np.array([img.tvec for img in images], np.float64).reshape(-1, 3),
+        camera_ids=np.array([img.camera_id for img in images], np.int32),
+        names=np.array([img.name for img in images], dtype=str),
+        point2D_offsets=point2D_offsets,
+        xys=np.concatenate([np.zeros((0, 2))] + [np.reshape(img.xys, (-1, 2)) for img in images]).astype(np.float64),
+        point3D_ids=np.concatenate([np.zeros(0, np.int64)] + [img.point3D_ids for img in images]).astype(np.int64),
+    )
+
+
+def concatenate_points3D_arrays(batches):
+    """concatenate several `Points3DArrays` into one, shifting the track offsets."""
+    batches = list(batches)
+    if len(batches) == 1:
+        return batches[0]
+    track_offsets = [np.zeros(1, np.int64)]
+    for batch in batches:
+        track_offsets.append(batch.track_offsets[1:] + track_offsets[-1][-1])
+    return Points3DArrays(
+        ids=np.concatenate([np.zeros(0, np.int64)] + [batch.ids for batch in batches]),
+        xyz=np.concatenate([np.zeros((0, 3))] + [batch.xyz for batch in batches]),
+        rgb=np.concatenate([np.zeros((0, 3), np.uint8)] + [batch.rgb for batch in batches]),
+        error=np.concatenate([np.zeros(0)] + [batch.error for batch in batches]),
+        track_offsets=np.concatenate(track_offsets),
+        track_image_ids=np.concatenate([np.zeros(0, np.int32)] + [batch.track_image_ids for batch in batches]),
+        track_point2D_idxs=np.concatenate([np.zeros(0, np.int32)] + [batch.track_point2D_idxs for batch in batches]),
+    )
+
+
+def concatenate_images_arrays(batches):
+    """concatenate several `ImagesArrays` into one, shifting the 2D point offsets."""
+    batches = list(batches)
+    if len(batches) == 1:
+        return batches[0]
+    point2D_offsets = [np.zeros(1, np.int64)]
+    for batch in batches:
+        point2D_offsets.append(batch.point2D_offsets[1:] + point2D_offsets[-1][-1])
+    return ImagesArrays(
+        ids=np.concatenate([np.zeros(0, np.int32)] + [batch.ids for batch in batches]),
+        qvecs=np.concatenate([np.zeros((0, 4))] + [batch.qvecs for batch in batches]),
+        tvecs=np.concatenate([np.zeros((0, 3))] + [batch.tvecs for batch in batches]),
+        camera_ids=np.concatenate([np.zeros(0, np.int32)] + [batch.camera_ids for batch in batches]),
+        names=np.concatenate([np.zeros(0, str)] + [batch.names for batch in batches]),
+        point2D_offsets=np.concatenate(point2D_offsets),
+        xys=np.concatenate([np.zeros((0, 2))] + [batch.xys for batch in batches]),
+        point3D_ids=np.concatenate([np.zeros(0, np.int64)] + [batch.point3D_ids for batch in batches]),
+    )
+
+
+def _iter_text_chunks(path, num_lines, read_size=1 << 24):
+    """yield blocks of at most `num_lines` whole lines past the comment header of a text model.
+
+    the file is read `read_size` bytes at a time and cut at line ends, without splitting it into lines.
+    """
+    with open(path, "rb") as fid:
+        line = fid.readline()
+        while line.startswith(b"#"):
+            line = fid.readline()
+        parts, num_newlines = [line], line.count(b"\n")
+        if num_newlines == num_lines:
+            yield line
+            parts, num_newlines = [], 0
+        while True:
+            data = fid.read(read_size)
+            if not data:
+                break
+            begin, data_newlines = 0, data.count(b"\n")
+            if num_newlines + data_newlines >= num_lines:
+                newlines = np.flatnonzero(np.frombuffer(data, np.uint8) == 10)
+                # the ends of the blocks completed by this read
+                for index in range(num_lines - num_newlines - 1, data_newlines, num_lines):
+                    end = int(newlines[index]) + 1
+                    yield b"".join(parts + [memoryview(data)[begin:end]])
+                    parts, begin = [], end
+                num_newlines = (num_newlines + data_newlines) % num_lines
+            else:
+                num_newlines += data_newlines
+            parts.append(memoryview(data)[begin:])
+        block = b"".join(parts)
+        if block:
+            yield block
+
+
+def slice_images_arrays(images, begin, end):
+    """view the images `begin:end` of `ImagesArrays`, with 2D point offsets starting at 0."""
+    point2D_begin, point2D_end = images.point2D_offsets[begin], images.point2D_offsets[end]
+    return ImagesArrays(
+        ids=images.ids[begin:end],
+        qvecs=images.qvecs[begin:end],
+        tvecs=images.tvecs[begin:end],
+        camera_ids=images.camera_ids[begin:end],
+        names=images.names[begin:end],
+        point2D_offsets=images.point2D_offsets[begin : end + 1] - point2D_begin,
+        xys=images.xys[point2D_begin:point2D_end],
+        point3D_ids=images.point3D_ids[point2D_begin:point2D_end],
+    )
+
+
+def slice_points3D_arrays(points3D, begin, end):
+    """view the points `begin:end` of `Points3DArrays`, with track offsets starting at 0."""
+    track_begin, track_end = points3D.track_offsets[begin], points3D.track_offsets[end]
+    return Points3DArrays(
+        ids=points3D.ids[begin:end],
+        xyz=points3D.xyz[begin:end],
+        rgb=points3D.rgb[begin:end],
+        error=points3D.error[begin:end],
+        track_offsets=points3D.track_offsets[begin : end + 1] - track_begin,
+        track_image_ids=points3D.track_image_ids[track_begin:track_end],
+        track_point2D_idxs=points3D.track_point2D_idxs[track_begin:track_end],
+    )
+
+
+def _take_csr(offsets, rows):
+    """offsets and element indices of the CSR rows `rows`."""
+    lengths = offsets[rows + 1] - offsets[rows]
+    new_offsets = np.zeros(len(rows) + 1, np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    elements = np.repeat(offsets[rows] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1], dtype=np.int64)
+    return new_offsets, elements
+
+
+def take_images_arrays(images, rows):
+    """select the images at integer `rows` or where a boolean mask is set."""
+    rows = np.asarray(rows)
+    rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+    point2D_offsets, elements = _take_csr(images.point2D_offsets, rows)
+    return ImagesArrays(
+        ids=images.ids[rows],
+        qvecs=images.qvecs[rows],
+        tvecs=images.tvecs[rows],
+        camera_ids=images.camera_ids[rows],
+        names=images.names[rows],
+        point2D_offsets=point2D_offsets,
+        xys=images.xys[elements],
+        point3D_ids=images.point3D_ids[elements],
+    )
+
+
+def take_points3D_arrays(points3D, rows):
+    """select the points at integer `rows` or where a boolean mask is set."""
+    rows = np.asarray(rows)
+    rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+    track_offsets, elements = _take_csr(points3D.track_offsets, rows)
+    return Points3DArrays(
+        ids=points3D.ids[rows],
+        xyz=points3D.xyz[rows],
+        rgb=points3D.rgb[rows],
+        error=points3D.error[rows],
+        track_offsets=track_offsets,
+        track_image_ids=points3D.track_image_ids[elements],
+        track_point2D_idxs=points3D.track_point2D_idxs[elements],
+    )
+
+
+def _format_images_text(images):
+    """format `ImagesArrays` as the two lines per image of images.txt."""
+    offsets = images.point2D_offsets.tolist()
+    xs, ys = images.xys[:, 0].tolist(), images.xys[:, 1].tolist()
+    point3D_ids = images.point3D_ids.tolist()
+    lines = []
+    for row, image_header in enumerate(
+        zip(
+            images.ids.tolist(),
+            images.qvecs.tolist(),
+            images.tvecs.tolist(),
+            images.camera_ids.tolist(),
+            images.names.tolist(),
+        )
+    ):
+        image_id, qvec, tvec, camera_id, name = image_header
+        lines.append(" ".join(map(str, [image_id, *qvec, *tvec, camera_id, name])))
+        begin, end = offsets[row], offsets[row + 1]
+        points2D = itertools.chain.from_iterable(zip(xs[begin:end], ys[begin:end], point3D_ids[begin:end]))
+        lines.append(" ".join(map(str, points2D)))
+    return "".join(line + "\n" for line in lines)
+
+
+def _format_points3D_text(points3D):
+    """format `Points3DArrays` as the lines of points3D.txt."""
+    offsets = points3D.track_offsets.tolist()
+    tracks = np.column_stack([points3D.track_image_ids, points3D.track_point2D_idxs]).ravel().tolist()
+    lines = []
+    for row, (point3D_id, xyz, rgb, error) in enumerate(
+        zip(points3D.ids.tolist(), points3D.xyz.tolist(), points3D.rgb.tolist(), points3D.error.tolist())
+    ):
+        point_header = " ".join(map(str, [point3D_id, *xyz, *rgb, error]))
+        lines.append(point_header + " " + " ".join(map(str, tracks[2 * offsets[row] : 2 * offsets[row + 1]])))
+    return "".join(line + "\n" for line in lines)
+
+
+TextTokens = collections.namedtuple("TextTokens", ["chars", "words", "begins", "ends", "counts"])
+
+# bytes of text parsed at once, small enough for the intermediate arrays to stay in cache
+TEXT_PARSE_SIZE = 1 << 20
+
+# digits are parsed from little-endian words of 8 bytes, see `_parse_word`
+_DIGIT_SHIFTS = np.array([64 - 8 * n for n in range(9)], np.uint64)
+_ZERO_BYTES = np.uint64(0x3030303030303030)
+_POINT_BYTES = np.uint64(0x2E2E2E2E2E2E2E2E)
+_LOW_BITS = np.uint64(0x0101010101010101)
+_HIGH_BITS = np.uint64(0x8080808080808080)
+_SWAR_STEPS = [
+    (np.uint64(0x00FF00FF00FF00FF), np.uint64(100 * (1 << 16) + 1), np.uint64(16)),
+    (np.uint64(0x0000FFFF0000FFFF), np.uint64(10000 * (1 << 32) + 1), np.uint64(32)),
+]
+
+# powers of ten up to 1e19, exact as doubles, with their halves of 26 bits for exact products
+_POWERS_OF_TEN = 10 ** np.arange(20, dtype=np.uint64)
+_FLOAT_POWERS_OF_TEN = _POWERS_OF_TEN.astype(np.float64)
+_FLOAT_POWERS_OF_TEN_HIGH = 134217729.0 * _FLOAT_POWERS_OF_TEN
+_FLOAT_POWERS_OF_TEN_HIGH -= _FLOAT_POWERS_OF_TEN_HIGH - _FLOAT_POWERS_OF_TEN
+_FLOAT_POWERS_OF_TEN_LOW = _FLOAT_POWERS_OF_TEN - _FLOAT_POWERS_OF_TEN_HIGH
+
+
+def _split_text_block(block, size=TEXT_PARSE_SIZE, even_lines=False):
+    """cut a block of lines into parts of about `size` bytes, between lines or pairs of lines."""
+    parts = []
+    begin = 0
+    while begin < len(block):
+        end = block.find(b"\n", begin + size) + 1 or len(block)
+        if even_lines and end < len(block) and block.count(b"\n", begin, end) % 2:
+            end = block.find(b"\n", end) + 1 or len(block)
+        parts.append(memoryview(block)[begin:end])
+        begin = end
+    return parts or [block]
+
+
+def _tokenize_text_block(block):
+    """locate the whitespace separated tokens of a block of lines, without splitting or converting them.
+
+    :return: `TextTokens` with the bytes of the block, a view of them as little-endian 8-byte words
+        starting at every byte, the begin and end offsets of every token and the number of tokens on
+        each line.
+    """
+    # zero padded, so that tokens start and end within the padding and the word of the last byte is readable
+    padded = np.zeros(len(block) + 9, np.uint8)
+    padded[1 : len(block) + 1] = np.frombuffer(block, np.uint8)
+    chars = padded[1 : len(block) + 1]
+    words = np.ndarray(len(block) + 1, "<u8", padded, 1, (1,))
+    is_space = padded[: len(block) + 2] <= 32
+    edges = np.flatnonzero(is_space[1:] != is_space[:-1])
+    begins, ends = edges[0::2], edges[1::2]
+    line_begins = np.concatenate([[0], np.flatnonzero(chars == 10) + 1])
+    if len(chars) == 0 or chars[-1] == 10:
+        line_begins = line_begins[:-1]
+    counts = np.diff(np.searchsorted(begins, line_begins), append=len(begins))
+    return TextTokens(chars, words, begins, ends, counts)
+
+
+def _parse_word(words, offsets, lengths):
+    """parse the first `lengths` (at most 8) bytes of the words at `offsets` as decimal digits.
+
+    :return: the values as uint64 and whether the bytes are all digits.
+    """
+    digits = words[offsets]
+    digits ^= _ZERO_BYTES
+    # the last digit to the top byte, which drops the bytes past it and leaves leading zeros
+    digits <<= _DIGIT_SHIFTS[lengths]
+    # digit bytes are at most 9 once xor-ed with "0", adding 0x76 sets the top bit of larger ones
+    check = digits + np.uint64(0x7676767676767676)
+    check |= digits
+    check &= _HIGH_BITS
+    # digits are combined in pairs, quads and octets
+    digits *= np.uint64(10 * (1 << 8) + 1)
+    digits >>= np.uint64(8)
+    for mask, multiplier, shift in _SWAR_STEPS:
+        digits &= mask
+        digits *= multiplier
+        digits >>= shift
+    return digits, check == 0
+
+
+def _parse_digits(words, begins, lengths):
+    """parse runs of up to 19 decimal digits, 8 at a time.
+
+    :return: the values as uint64 and whether each run holds only digits.
+    """
+    if lengths.max(initial=0) <= 8:
+        return _parse_word(words, begins, lengths)
+    # up to three words, the last two with 8 digits each
+    last_lengths = np.minimum(lengths, 8)
+    middle_lengths = np.clip(lengths - 8, 0, 8)
+    first_lengths = np.clip(lengths - 16, 0, 8)
+    values, valid = _parse_word(words, begins, first_lengths)
+    for word_begins, word_lengths in [
+        (begins + first_lengths, middle_lengths),
+        (begins + first_lengths + middle_lengths, last_lengths),
+    ]:
+        digits, digits_valid = _parse_word(words, word_begins, word_lengths)
+        values *= _POWERS_OF_TEN[word_lengths]
+        values += digits
+        valid &= digits_valid
+    valid &= lengths <= 19
+    return values, valid
+
+
+def _parse_int_tokens(tokens, index):
+    """parse the tokens at `index` as int64, raising a ValueError if one is not an integer."""
+    begins, ends = tokens.begins[index], tokens.ends[index]
+    negative = tokens.chars[begins] == ord("-")
+    begins = begins + negative
+    values, valid = _parse_digits(tokens.words, begins, ends - begins)
+    if not np.all(valid & (ends > begins)):
+        raise ValueError("could not parse integer values in text model")
+    values = values.view(np.int64)
+    np.negative(values, out=values, where=negative)
+    return values
+
+
+def _parse_float_tokens(tokens, index):
+    """parse the tokens at `index` as float64, rounded as `float` does.
+
+    plain decimals are parsed in bulk, exactly when their digits fit in 53 bits and else by correcting
+    the quotient by its residual in double-double arithmetic. exponents, special values and decimals
+    too close to a rounding tie are left to `float`.
+    """
+    chars, words = tokens.chars, tokens.words
+    begins, ends = tokens.begins[index], tokens.ends[index]
+    negative = chars[begins] == ord("-")
+    digit_begins = begins + negative
+    lengths = ends - digit_begins
+
+    # the decimal point within 8 bytes of the first digit: the lowest zero byte of the word xor-ed
+    # with "." is the lowest top bit set in (x - 0x01..01) & ~x
+    points = words[digit_begins] ^ _POINT_BYTES
+    points = (points - _LOW_BITS) & ~points & _HIGH_BITS
+    points &= ~points + np.uint64(1)
+    point_offsets = np.frexp(points.astype(np.float64))[1] // 8 - 1
+    has_point = (points != 0) & (point_offsets < lengths)
+    integer_lengths = np.where(has_point, point_offsets, lengths)
+    fraction_lengths = np.where(has_point, lengths - integer_lengths - 1, 0)
+    integers, valid = _parse_digits(words, digit_begins, integer_lengths)
+    fractions, fraction_valid = _parse_digits(words, digit_begins + integer_lengths + has_point, fraction_lengths)
+    num_digits = integer_lengths + fraction_lengths
+    valid &= fraction_valid & (num_digits > 0) & (num_digits <= 19)
+
+    # the digits as an integer mantissa over a power of ten
+    fraction_lengths = np.minimum(fraction_lengths, 19)
+    mantissas = integers * _POWERS_OF_TEN[fraction_lengths] + fractions
+    values = mantissas.astype(np.float64)
+    values /= _FLOAT_POWERS_OF_TEN[fraction_lengths]
+
+    # above 2**53 the mantissa is split into its high 53 and low 11 bits, and the quotient of the high
+    # part is corrected by the exact residual mantissa - quotient * scale
+    rows = np.flatnonzero(valid & (mantissas > np.uint64(1 << 53)))
+    if len(rows):
+        scales = fraction_lengths[rows]
+        scale = _FLOAT_POWERS_OF_TEN[scales]
+        high = (mantissas[rows] & np.uint64(0xFFFFFFFFFFFFF800)).astype(np.float64)
+        low = (mantissas[rows] & np.uint64(0x7FF)).astype(np.float64)
+        quotients = high / scale
+        split = 134217729.0 * quotients
+        quotients_high = split - (split - quotients)
+        quotients_low = quotients - quotients_high
+        product = quotients * scale
+        product_error = quotients_high * _FLOAT_POWERS_OF_TEN_HIGH[scales] - product
+        product_error += quotients_high * _FLOAT_POWERS_OF_TEN_LOW[scales]
+        product_error += quotients_low * _FLOAT_POWERS_OF_TEN_HIGH[scales]
+        product_error += quotients_low * _FLOAT_POWERS_OF_TEN_LOW[scales]
+        corrections = ((high - product) - product_error + low) / scale
+        corrected = quotients + corrections
+        # the rounding error of the sum, the result is only certain away from ties
+        rounded = corrected - quotients
+        error = (quotients - (corrected - rounded)) + (corrections - rounded)
+        ulp = np.spacing(corrected)
+        valid[rows] &= (np.abs(np.abs(error) - ulp / 2) > ulp * 2.0**-20) & (np.frexp(corrected)[0] != 0.5)
+        values[rows] = corrected
+    np.negative(values, out=values, where=negative)
+
+    rows = np.flatnonzero(~valid)
+    if len(rows):
+        try:
+            values[rows] = [
+                float(chars[begin:end].tobytes()) for begin, end in zip(begins[rows].tolist(), ends[rows].tolist())
+            ]
+        except ValueError:
+            raise ValueError("could not parse numeric values in text model") from None
+    return values
+
+
+def _parse_points3D_text_block(block):
+    """parse a block of points3D.txt lines into `Points3DArrays`."""
+    parts = [_parse_points3D_text_lines(part) for part in _split_text_block(block)]
+    return parts[0] if len(parts) == 1 else concatenate_points3D_arrays(parts)
+
+
+def _parse_points3D_text_lines(block):
+    tokens = _tokenize_text_block(block)
+    counts = tokens.counts[tokens.counts > 0]
+    if np.any((counts < 8) | (counts % 2 == 1)):
+        raise ValueError("malformed line in points3D text model")
+    starts = np.zeros(len(counts), np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    track_lengths = (counts - 8) // 2
+    track_offsets = np.zeros(len(counts) + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+
+    # xyz and the error are floats, the other values of a line are integers
+    float_index = starts[:, None] + np.array([1, 2, 3, 7])
+    floats = _parse_float_tokens(tokens, float_index.ravel()).reshape(-1, 4)
+    is_int = np.ones(len(tokens.begins), bool)
+    is_int[float_index] = False
+    ints = _parse_int_tokens(tokens, np.flatnonzero(is_int))
+    int_starts = starts - 4 * np.arange(len(counts))
+    track_positions = np.repeat(int_starts + 4 - 2 * track_offsets[:-1], track_lengths)
+    track_positions += 2 * np.arange(track_offsets[-1], dtype=np.int64)
+    return Points3DArrays(
+        ids=ints[int_starts],
+        xyz=np.ascontiguousarray(floats[:, :3]),
+        rgb=ints[int_starts[:, None] + np.arange(1, 4)].astype(np.uint8),
+        error=floats[:, 3].copy(),
+        track_offsets=track_offsets,
+        track_image_ids=ints[track_positions].astype(np.int32),
+        track_point2D_idxs=ints[track_positions + 1].astype(np.int32),
+    )
+
+
+def _parse_images_text_block(block):
+    """parse a block of images.txt line pairs into `ImagesArrays`."""
+    parts = [_parse_images_text_lines(part) for part in _split_text_block(block, even_lines=True)]
+    return parts[0] if len(parts) == 1 else concatenate_images_arrays(parts)
+
+
+def _parse_images_text_lines(block):
+    tokens = _tokenize_text_block(block)
+    counts = tokens.counts
+    if len(counts) % 2:
+        # the empty points line of the last image may be missing
+        counts = np.append(counts, 0)
+    header_counts, point_counts = counts[0::2], counts[1::2]
+    if np.any(header_counts < 10) or np.any(point_counts % 3):
+        raise ValueError("malformed line in images text model")
+    line_starts = np.zeros(len(counts), np.int64)
+    np.cumsum(counts[:-1], out=line_starts[1:])
+    header_starts = line_starts[0::2]
+    point2D_offsets = np.zeros(len(header_starts) + 1, np.int64)
+    np.cumsum(point_counts // 3, out=point2D_offsets[1:])
+    # token of the first value of each 2D point
+    positions = np.repeat(line_starts[1::2] - 3 * point2D_offsets[:-1], point_counts // 3)
+    positions += 3 * np.arange(point2D_offsets[-1], dtype=np.int64)
+
+    poses = _parse_float_tokens(tokens, (header_starts[:, None] + np.arange(1, 8)).ravel()).reshape(-1, 7)
+    xys = _parse_float_tokens(tokens, (positions[:, None] + np.arange(2)).ravel()).reshape(-1, 2)
+    names = [
+        tokens.chars[begin:end].tobytes().decode("utf-8")
+        for begin, end in zip(tokens.begins[header_starts + 9].tolist(), tokens.ends[header_starts + 9].tolist())
+    ]
+    return ImagesArrays(
+        ids=_parse_int_tokens(tokens, header_starts).astype(np.int32),
+        qvecs=poses[:, :4].copy(),
+        tvecs=poses[:, 4:].copy(),
+        camera_ids=_parse_int_tokens(tokens, header_starts + 8).astype(np.int32),
+        names=np.array(names, dtype=str),
+        point2D_offsets=point2D_offsets,
+        xys=xys,
+        point3D_ids=_parse_int_tokens(tokens, positions + 2),
+    )
+
+
 def read_cameras_text(path):
     """
     see: src/base/reconstruction.cc
@@ -182,75 +901,59 @@ def write_cameras_binary(cameras, path_to_model_file):
     return cameras
 
 
+def read_images_text_arrays(path, batch_size=IMAGES_BATCH_SIZE):
+    """
+    read images.txt into columnar `ImagesArrays`, parsing `batch_size` images at a time.
+
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadImagesText(const std::string& path)
+        void Reconstruction::WriteImagesText(const std::string& path)
+    """
+    return concatenate_images_arrays(list(iter_images(path, batch_size)) or [images_dict_to_arrays({})])
+
+
 def read_images_text(path):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesText(const std::string& path)
         void Reconstruction::WriteImagesText(const std::string& path)
     """
-    images = {}
-    with open(path, "r") as fid:
-        while True:
-            line = fid.readline()
-            if not line:
-                break
-            line = line.strip()
-            if len(line) > 0 and line[0] != "#":
-                elems = line.split()
-                image_id = int(elems[0])
-                qvec = np.array(tuple(map(float, elems[1:5])))
-                tvec = np.array(tuple(map(float, elems[5:8])))
-                camera_id = int(elems[8])
-                image_name = elems[9]
-                elems = fid.readline().split()
-                xys = np.column_stack([tuple(map(float, elems[0::3])), tuple(map(float, elems[1::3]))])
-                point3D_ids = np.array(tuple(map(int, elems[2::3])))
-                images[image_id] = Image(
-                    id=image_id,
-                    qvec=qvec,
-                    tvec=tvec,
-                    camera_id=camera_id,
-                    name=image_name,
-                    xys=xys,
-                    point3D_ids=point3D_ids,
-                )
-    return images
+    return images_arrays_to_dict(read_images_text_arrays(path))
 
 
-def read_images_binary(path_to_model_file):
+def read_images_binary_arrays(path_to_model_file):
     """
+    read images.bin into columnar `ImagesArrays`, the 2D points of image `i` being
+    `xys[point2D_offsets[i]:point2D_offsets[i + 1]]`.
+
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    images = {}
     with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(fid, num_bytes=64, format_char_sequence="idddddddi")
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            image_name = ""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":  # look for the ASCII 0 entry
-                image_name += current_char.decode("utf-8")
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            num_points2D = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
-            x_y_id_s = read_next_bytes(fid, num_bytes=24 * num_points2D, format_char_sequence="ddq" * num_points2D)
-            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])), tuple(map(float, x_y_id_s[1::3]))])
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id,
-                qvec=qvec,
-                tvec=tvec,
-                camera_id=camera_id,
-                name=image_name,
-                xys=xys,
-                point3D_ids=point3D_ids,
-            )
-    return images
+        buffer = fid.read()
+    num_reg_images = struct.unpack_from("<Q", buffer, 0)[0]
+    starts, name_ends, num_points2D, end = _scan_images_binary(buffer, 8, num_reg_images)
+    assert end == len(buffer), "unexpected trailing bytes in images file"
+    return _decode_images_binary(buffer, starts, name_ends, num_points2D)
+
+
+def read_images_binary(path_to_model_file):
+    """
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadImagesBinary(const std::string& path)
+        void Reconstruction::WriteImagesBinary(const std::string& path)
+    """
+    return images_arrays_to_dict(read_images_binary_arrays(path_to_model_file))
+
+
+def _images_text_header(num_images, mean_observations):
+    return (
+        "# Image list with two lines of data per image:\n"
+        + "#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME\n"
+        + "#   POINTS2D[] as (X, Y, POINT3D_ID)\n"
+        + "# Number of images: {}, mean observations per image: {}\n".format(num_images, mean_observations)
+    )
 
 
 def write_images_text(images, path):
@@ -259,49 +962,76 @@ def write_images_text(images, path):
         void Reconstruction::ReadImagesText(const std::string& path)
         void Reconstruction::WriteImagesText(const std::string& path)
     """
-    if len(images) == 0:
+    if not isinstance(images, ImagesArrays):
+        images = images_dict_to_arrays(images)
+    num_images = len(images.ids)
+    if num_images == 0:
         mean_observations = 0
     else:
-        mean_observations = sum((len(img.point3D_ids) for _, img in images.items())) / len(images)
-    HEADER = (
-        "# Image list with two lines of data per image:\n"
-        + "#   IMAGE_ID, QW, QX, QY, QZ, TX, TY, TZ, CAMERA_ID, NAME\n"
-        + "#   POINTS2D[] as (X, Y, POINT3D_ID)\n"
-        + "# Number of images: {}, mean observations per image: {}\n".format(len(images), mean_observations)
-    )
+        mean_observations = int(images.point2D_offsets[-1]) / num_images
 
     with open(path, "w") as fid:
-        fid.write(HEADER)
-        for _, img in images.items():
-            image_header = [img.id, *img.qvec, *img.tvec, img.camera_id, img.name]
-            first_line = " ".join(map(str, image_header))
-            fid.write(first_line + "\n")
+        fid.write(_images_text_header(num_images, mean_observations))
+        for begin in range(0, num_images, IMAGES_BATCH_SIZE):
+            end = min(begin + IMAGES_BATCH_SIZE, num_images)
+            fid.write(_format_images_text(slice_images_arrays(images, begin, end)))
+
 
-            points_strings = []
-            for xy, point3D_id in zip(img.xys, img.point3D_ids):
-                points_strings.append(" ".join(map(str, [*xy, point3D_id])))
-            fid.write(" ".join(points_strings) + "\n")
+def _serialize_images_binary(images, offset=0):
+    """serialize the records of `ImagesArrays` into a new buffer, after `offset` reserved bytes."""
+    names = [name.encode("utf-8") for name in images.names.tolist()]
+    num_points2D = np.diff(images.point2D_offsets)
+    record_sizes = 64 + np.array([len(name) for name in names], np.int64) + 9 + 24 * num_points2D
+    record_offsets = np.zeros(len(names) + 1, np.int64)
+    np.cumsum(record_sizes, out=record_offsets[1:])
+    starts = offset + record_offsets[:-1]
+
+    buffer = bytearray(offset + int(record_offsets[-1]))
+    _scatter_values(buffer, starts, images.ids, np.int32)
+    for k in range(4):
+        _scatter_values(buffer, starts + 4 + 8 * k, images.qvecs[:, k], np.float64)
+    for k in range(3):
+        _scatter_values(buffer, starts + 36 + 8 * k, images.tvecs[:, k], np.float64)
+    _scatter_values(buffer, starts + 60, images.camera_ids, np.int32)
+    name_ends = starts + 64 + [len(name) for name in names]
+    _scatter_values(buffer, name_ends + 1, num_points2D, np.uint64)
+    point2D_offsets = images.point2D_offsets
+    for name, start, name_end, begin, end in zip(
+        names, starts.tolist(), name_ends.tolist(), point2D_offsets[:-1].tolist(), point2D_offsets[1:].tolist()
+    ):
+        buffer[start + 64 : name_end] = name
+        points2D = np.frombuffer(buffer, POINT2D_DTYPE, count=end - begin, offset=name_end + 9)
+        points2D["xy"] = images.xys[begin:end]
+        points2D["point3D_id"] = images.point3D_ids[begin:end]
+    return buffer
 
 
 def write_images_binary(images, path_to_model_file):
     """
+    serialize a dict of `Image` or `ImagesArrays` into one preallocated buffer
+    and write it with a single call.
+
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
+    if not isinstance(images, ImagesArrays):
+        images = images_dict_to_arrays(images)
+    buffer = _serialize_images_binary(images, offset=8)
+    struct.pack_into("<Q", buffer, 0, len(images.ids))
     with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(images), "Q")
-        for _, img in images.items():
-            write_next_bytes(fid, img.id, "i")
-            write_next_bytes(fid, img.qvec.tolist(), "dddd")
-            write_next_bytes(fid, img.tvec.tolist(), "ddd")
-            write_next_bytes(fid, img.camera_id, "i")
-            for char in img.name:
-                write_next_bytes(fid, char.encode("utf-8"), "c")
-            write_next_bytes(fid, b"\x00", "c")
-            write_next_bytes(fid, len(img.point3D_ids), "Q")
-            for xy, p3d_id in zip(img.xys, img.point3D_ids):
-                write_next_bytes(fid, [*xy, p3d_id], "ddq")
+        fid.write(buffer)
+
+
+def read_points3D_text_arrays(path, batch_size=POINTS3D_BATCH_SIZE):
+    """
+    read points3D.txt into columnar `Points3DArrays`, parsing `batch_size` points at a time.
+
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadPoints3DText(const std::string& path)
+        void Reconstruction::WritePoints3DText(const std::string& path)
+    """
+    return concatenate_points3D_arrays(list(iter_points3D(path, batch_size)) or [points3D_dict_to_arrays({})])
 
 
 def read_points3D_text(path):
@@ -310,50 +1040,41 @@ def read_points3D_text(path):
         void Reconstruction::ReadPoints3DText(const std::string& path)
         void Reconstruction::WritePoints3DText(const std::string& path)
     """
-    points3D = {}
-    with open(path, "r") as fid:
-        while True:
-            line = fid.readline()
-            if not line:
-                break
-            line = line.strip()
-            if len(line) > 0 and line[0] != "#":
-                elems = line.split()
-                point3D_id = int(elems[0])
-                xyz = np.array(tuple(map(float, elems[1:4])))
-                rgb = np.array(tuple(map(int, elems[4:7])))
-                error = float(elems[7])
-                image_ids = np.array(tuple(map(int, elems[8::2])))
-                point2D_idxs = np.array(tuple(map(int, elems[9::2])))
-                points3D[point3D_id] = Point3D(
-                    id=point3D_id, xyz=xyz, rgb=rgb, error=error, image_ids=image_ids, point2D_idxs=point2D_idxs
-                )
-    return points3D
+    return points3D_arrays_to_dict(read_points3D_text_arrays(path))
 
 
-def read_points3D_binary(path_to_model_file):
+def read_points3D_binary_arrays(path_to_model_file):
     """
+    read points3D.bin into columnar `Points3DArrays`, the track of point `i` being
+    `track_image_ids[track_offsets[i]:track_offsets[i + 1]]`.
+
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
-    points3D = {}
     with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_points):
-            binary_point_line_properties = read_next_bytes(fid, num_bytes=43, format_char_sequence="QdddBBBd")
-            point3D_id = binary_point_line_properties[0]
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(fid, num_bytes=8, format_char_sequence="Q")[0]
-            track_elems = read_next_bytes(fid, num_bytes=8 * track_length, format_char_sequence="ii" * track_length)
-            image_ids = np.array(tuple(map(int, track_elems[0::2])))
-            point2D_idxs = np.array(tuple(map(int, track_elems[1::2])))
-            points3D[point3D_id] = Point3D(
-                id=point3D_id, xyz=xyz, rgb=rgb, error=error, image_ids=image_ids, point2D_idxs=point2D_idxs
-            )
-    return points3D
+        buffer = fid.read()
+    num_points = struct.unpack_from("<Q", buffer, 0)[0]
+    starts, track_lengths, end = _scan_points3D_binary(buffer, 8, num_points)
+    assert end == len(buffer), "unexpected trailing bytes in points3D file"
+    return _decode_points3D_binary(buffer, starts, track_lengths)
+
+
+def read_points3D_binary(path_to_model_file):
+    """
+    see: src/base/reconstruction.cc
+        void Reconstruction::ReadPoints3DBinary(const std::string& path)
+        void Reconstruction::WritePoints3DBinary(const std::string& path)
+    """
+    return points3D_arrays_to_dict(read_points3D_binary_arrays(path_to_model_file))
+
+
+def _points3D_text_header(num_points, mean_track_length):
+    return (
+        "# 3D point list with one line of data per point:\n"
+        + "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
+        + "# Number of points: {}, mean track length: {}\n".format(num_points, mean_track_length)
+    )
 
 
 def write_points3D_text(points3D, path):
@@ -362,44 +1083,143 @@ def write_points3D_text(points3D, path):
         void Reconstruction::ReadPoints3DText(const std::string& path)
         void Reconstruction::WritePoints3DText(const std::string& path)
     """
-    if len(points3D) == 0:
+    if not isinstance(points3D, Points3DArrays):
+        points3D = points3D_dict_to_arrays(points3D)
+    num_points = len(points3D.ids)
+    if num_points == 0:
         mean_track_length = 0
     else:
-        mean_track_length = sum((len(pt.image_ids) for _, pt in points3D.items())) / len(points3D)
-    HEADER = (
-        "# 3D point list with one line of data per point:\n"
-        + "#   POINT3D_ID, X, Y, Z, R, G, B, ERROR, TRACK[] as (IMAGE_ID, POINT2D_IDX)\n"
-        + "# Number of points: {}, mean track length: {}\n".format(len(points3D), mean_track_length)
-    )
+        mean_track_length = int(points3D.track_offsets[-1]) / num_points
 
     with open(path, "w") as fid:
-        fid.write(HEADER)
-        for _, pt in points3D.items():
-            point_header = [pt.id, *pt.xyz, *pt.rgb, pt.error]
-            fid.write(" ".join(map(str, point_header)) + " ")
-            track_strings = []
-            for image_id, point2D in zip(pt.image_ids, pt.point2D_idxs):
-                track_strings.append(" ".join(map(str, [image_id, point2D])))
-            fid.write(" ".join(track_strings) + "\n")
+        fid.write(_points3D_text_header(num_points, mean_track_length))
+        for begin in range(0, num_points, POINTS3D_BATCH_SIZE):
+            end = min(begin + POINTS3D_BATCH_SIZE, num_points)
+            fid.write(_format_points3D_text(slice_points3D_arrays(points3D, begin, end)))
+
+
+def _serialize_points3D_binary(points3D, offset=0):
+    """serialize the records of `Points3DArrays` into a new buffer, after `offset` reserved bytes."""
+    num_points = len(points3D.ids)
+    track_offsets = points3D.track_offsets
+    track_lengths = np.diff(track_offsets)
+    starts = offset + 51 * np.arange(num_points, dtype=np.int64) + 8 * track_offsets[:-1]
+
+    buffer = bytearray(offset + 51 * num_points + 8 * int(track_offsets[-1]))
+    _scatter_values(buffer, starts, points3D.ids, np.uint64)
+    for k in range(3):
+        _scatter_values(buffer, starts + 8 + 8 * k, points3D.xyz[:, k], np.float64)
+        _scatter_values(buffer, starts + 32 + k, points3D.rgb[:, k], np.uint8)
+    _scatter_values(buffer, starts + 35, points3D.error, np.float64)
+    _scatter_values(buffer, starts + 43, track_lengths, np.uint64)
+    track_positions = np.repeat(starts + 51 - 8 * track_offsets[:-1], track_lengths)
+    track_positions += 8 * np.arange(track_offsets[-1], dtype=np.int64)
+    _scatter_values(buffer, track_positions, points3D.track_image_ids, np.int32)
+    _scatter_values(buffer, track_positions + 4, points3D.track_point2D_idxs, np.int32)
+    return buffer
 
 
 def write_points3D_binary(points3D, path_to_model_file):
     """
+    serialize a dict of `Point3D` or `Points3DArrays` into one preallocated buffer
+    and write it with a single call.
+
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
+    if not isinstance(points3D, Points3DArrays):
+        points3D = points3D_dict_to_arrays(points3D)
+    buffer = _serialize_points3D_binary(points3D, offset=8)
+    struct.pack_into("<Q", buffer, 0, len(points3D.ids))
     with open(path_to_model_file, "wb") as fid:
-        write_next_bytes(fid, len(points3D), "Q")
-        for _, pt in points3D.items():
-            write_next_bytes(fid, pt.id, "Q")
-            write_next_bytes(fid, pt.xyz.tolist(), "ddd")
-            write_next_bytes(fid, pt.rgb.tolist(), "BBB")
-            write_next_bytes(fid, pt.error, "d")
-            track_length = pt.image_ids.shape[0]
-            write_next_bytes(fid, track_length, "Q")
-            for image_id, point2D_id in zip(pt.image_ids, pt.point2D_idxs):
-                write_next_bytes(fid, [image_id, point2D_id], "ii")
+        fid.write(buffer)
+
+
+def _iter_binary_records(path, batch_size, scan, decode):
+    """decode a binary model file `batch_size` records at a time from a memory map."""
+    with open(path, "rb") as fid, mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        num_records = struct.unpack_from("<Q", buffer, 0)[0]
+        offset = 8
+        for begin in range(0, num_records, batch_size):
+            *index, offset = scan(buffer, offset, min(batch_size, num_records - begin))
+            yield decode(buffer, *index)
+
+
+def iter_images(path, batch_size=IMAGES_BATCH_SIZE):
+    """yield `ImagesArrays` batches of at most `batch_size` images from images.bin or images.txt."""
+    if os.path.splitext(path)[1] == ".txt":
+        for block in _iter_text_chunks(path, 2 * batch_size):
+            yield _parse_images_text_block(block)
+    else:
+        yield from _iter_binary_records(path, batch_size, _scan_images_binary, _decode_images_binary)
+
+
+def iter_points3D(path, batch_size=POINTS3D_BATCH_SIZE):
+    """yield `Points3DArrays` batches of at most `batch_size` points from points3D.bin or points3D.txt."""
+    if os.path.splitext(path)[1] == ".txt":
+        for block in _iter_text_chunks(path, batch_size):
+            yield _parse_points3D_text_block(block)
+    else:
+        yield from _iter_binary_records(path, batch_size, _scan_points3D_binary, _decode_points3D_binary)
+
+
+def _pad_text_header(header, width=128):
+    """pad the last header line (the one holding the counts) so it can be rewritten in place."""
+    head, counts_line = header[:-1].rsplit("\n", 1)
+    return (head + "\n" + counts_line.ljust(width) + "\n").encode("utf-8")
+
+
+def _write_stream(batches, path, count, serialize, format_text, text_header):
+    """write record batches to a binary or text model file, patching the header counts at the end.
+
+    :return: number of records and total number of 2D points or track elements.
+    """
+    num_records, num_elements = 0, 0
+    binary = os.path.splitext(path)[1] != ".txt"
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", 0) if binary else _pad_text_header(text_header(0, 0)))
+        for batch in batches:
+            fid.write(serialize(batch) if binary else format_text(batch).encode("utf-8"))
+            num_records += len(batch.ids)
+            num_elements += count(batch)
+        fid.seek(0)
+        if binary:
+            fid.write(struct.pack("<Q", num_records))
+        else:
+            mean = num_elements / num_records if num_records else 0
+            fid.write(_pad_text_header(text_header(num_records, mean)))
+    return num_records, num_elements
+
+
+def write_images_stream(batches, path):
+    """write `ImagesArrays` batches, e.g. from `iter_images`, to images.bin or images.txt.
+
+    :return: number of images and of 2D points written.
+    """
+    return _write_stream(
+        batches,
+        path,
+        count=lambda batch: int(batch.point2D_offsets[-1]),
+        serialize=_serialize_images_binary,
+        format_text=_format_images_text,
+        text_header=_images_text_header,
+    )
+
+
+def write_points3D_stream(batches, path):
+    """write `Points3DArrays` batches, e.g. from `iter_points3D`, to points3D.bin or points3D.txt.
+
+    :return: number of points and of track elements written.
+    """
+    return _write_stream(
+        batches,
+        path,
+        count=lambda batch: int(batch.track_offsets[-1]),
+        serialize=_serialize_points3D_binary,
+        format_text=_format_points3D_text,
+        text_header=_points3D_text_header,
+    )
 
 
 def detect_model_format(path, ext):
@@ -413,7 +1233,93 @@ def detect_model_format(path, ext):
     return False
 
 
-def read_model(path, ext=""):
+def _plan_binary_chunks(path, num_chunks):
+    """split images.bin or points3D.bin into about `num_chunks` (offset, count) record ranges.
+
+    only the length prefixes are read to locate the records.
+    """
+    scan = _scan_images_binary if os.path.basename(path).startswith("images") else _scan_points3D_binary
+    with open(path, "rb") as fid, mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        num_records = struct.unpack_from("<Q", buffer, 0)[0]
+        starts = scan(buffer, 8, num_records)[0].tolist()
+    chunk_size = max(-(-num_records // num_chunks), 1)
+    return [(starts[index], min(chunk_size, num_records - index)) for index in range(0, num_records, chunk_size)]
+
+
+def _plan_text_chunks(path, num_chunks):
+    """split images.txt or points3D.txt into about `num_chunks` (begin, end) byte ranges of whole records."""
+    even_lines = os.path.basename(path).startswith("images")
+    with open(path, "rb") as fid:
+        line = fid.readline()
+        while line.startswith(b"#"):
+            line = fid.readline()
+        data_begin = fid.tell() - len(line)
+        if os.path.getsize(path) == data_begin:
+            return []
+        with mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            size = len(buffer)
+            boundaries = [data_begin]
+            while boundaries[-1] < size:
+                boundary = buffer.find(b"\n", boundaries[-1] + (size - data_begin) // num_chunks)
+                boundary = size if boundary < 0 else boundary + 1
+                # images take two lines each, do not split between them
+                if even_lines and buffer[boundaries[-1] : boundary].count(b"\n") % 2 and boundary < size:
+                    boundary = buffer.find(b"\n", boundary)
+                    boundary = size if boundary < 0 else boundary + 1
+                boundaries.append(boundary)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _read_binary_chunk(path, offset, count):
+    """decode `count` records of images.bin or points3D.bin starting at byte `offset`."""
+    if os.path.basename(path).startswith("images"):
+        scan, decode = _scan_images_binary, _decode_images_binary
+    else:
+        scan, decode = _scan_points3D_binary, _decode_points3D_binary
+    with open(path, "rb") as fid, mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        *index, _ = scan(buffer, offset, count)
+        return decode(buffer, *index)
+
+
+def _read_text_chunk(path, begin, end):
+    """parse the whole records stored in the byte range [begin, end) of images.txt or points3D.txt."""
+    with open(path, "rb") as fid:
+        fid.seek(begin)
+        block = fid.read(end - begin)
+    if os.path.basename(path).startswith("images"):
+        return _parse_images_text_block(block)
+    return _parse_points3D_text_block(block)
+
+
+def _read_model_arrays_parallel(path, ext, num_workers):
+    """decode the three model files concurrently, splitting images and points3D into chunks for a process pool."""
+    num_chunks = 2 * num_workers
+    if ext == ".txt":
+        read_cameras, plan_chunks, read_chunk = read_cameras_text, _plan_text_chunks, _read_text_chunk
+    else:
+        read_cameras, plan_chunks, read_chunk = read_cameras_binary, _plan_binary_chunks, _read_binary_chunk
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        cameras = executor.submit(read_cameras, os.path.join(path, "cameras" + ext))
+        images_path = os.path.join(path, "images" + ext)
+        images = [executor.submit(read_chunk, images_path, *chunk) for chunk in plan_chunks(images_path, num_chunks)]
+        points3D_path = os.path.join(path, "points3D" + ext)
+        points3D = [
+            executor.submit(read_chunk, points3D_path, *chunk) for chunk in plan_chunks(points3D_path, num_chunks)
+        ]
+        return (
+            cameras.result(),
+            concatenate_images_arrays([future.result() for future in images]),
+            concatenate_points3D_arrays([future.result() for future in points3D]),
+        )
+
+
+def read_model_arrays(path, ext="", num_workers=None, cache=None):
+    """read a model as a dict of `Camera`, `ImagesArrays` and `Points3DArrays`.
+
+    :param num_workers: decode the files concurrently with this many processes.
+    :param cache: optional `ModelCache` serving repeated loads of unchanged models.
+    """
     # try to detect the extension automatically
     if ext == "":
         if detect_model_format(path, ".bin"):
@@ -422,23 +1328,39 @@ def read_model(path, ext=""):
             ext = ".txt"
         else:
             try:
-                cameras, images, points3D = read_model(os.path.join(path, "model/"))
+                cameras, images, points3D = read_model_arrays(os.path.join(path, "model/"), ext, num_workers, cache)
                 logger.warning("This SfM file structure was deprecated in hloc v1.1")
                 return cameras, images, points3D
             except FileNotFoundError:
                 raise FileNotFoundError(f"Could not find binary or text COLMAP model at {path}")
 
+    if cache is not None:
+        key = cache.key(path, ext)
+        model = cache.load(key)
+        if model is None:
+            model = read_model_arrays(path, ext, num_workers)
+            cache.store(key, *model)
+        return model
+
+    if num_workers is not None and num_workers > 1:
+        return _read_model_arrays_parallel(path, ext, num_workers)
+
     if ext == ".txt":
         cameras = read_cameras_text(os.path.join(path, "cameras" + ext))
-        images = read_images_text(os.path.join(path, "images" + ext))
-        points3D = read_points3D_text(os.path.join(path, "points3D") + ext)
+        images = read_images_text_arrays(os.path.join(path, "images" + ext))
+        points3D = read_points3D_text_arrays(os.path.join(path, "points3D") + ext)
     else:
         cameras = read_cameras_binary(os.path.join(path, "cameras" + ext))
-        images = read_images_binary(os.path.join(path, "images" + ext))
-        points3D = read_points3D_binary(os.path.join(path, "points3D") + ext)
+        images = read_images_binary_arrays(os.path.join(path, "images" + ext))
+        points3D = read_points3D_binary_arrays(os.path.join(path, "points3D") + ext)
     return cameras, images, points3D
 
 
+def read_model(path, ext="", num_workers=None, cache=None):
+    cameras, images, points3D = read_model_arrays(path, ext, num_workers, cache)
+    return cameras, images_arrays_to_dict(images), points3D_arrays_to_dict(points3D)
+
+
 def write_model(cameras, images, points3D, path, ext=".bin"):
     logger.info("writing Colmap model...")
 
@@ -453,46 +1375,154 @@ def write_model(cameras, images, points3D, path, ext=".bin"):
     return cameras, images, points3D
 
 
+def qvecs2rotmats(qvecs):
+    """rotation matrices (..., 3, 3) of quaternions (..., 4) in (w, x, y, z) order."""
+    qvecs = np.asarray(qvecs, np.float64)
+    w, x, y, z = np.moveaxis(qvecs, -1, 0)
+    R = np.empty(qvecs.shape[:-1] + (3, 3))
+    R[..., 0, 0] = 1 - 2 * y**2 - 2 * z**2
+    R[..., 0, 1] = 2 * x * y - 2 * w * z
+    R[..., 0, 2] = 2 * z * x + 2 * w * y
+    R[..., 1, 0] = 2 * x * y + 2 * w * z
+    R[..., 1, 1] = 1 - 2 * x**2 - 2 * z**2
+    R[..., 1, 2] = 2 * y * z - 2 * w * x
+    R[..., 2, 0] = 2 * z * x - 2 * w * y
+    R[..., 2, 1] = 2 * y * z + 2 * w * x
+    R[..., 2, 2] = 1 - 2 * x**2 - 2 * y**2
+    return R
+
+
+def rotmats2qvecs(R):
+    """quaternions (..., 4) with non-negative w of rotation matrices (..., 3, 3)."""
+    R = np.asarray(R, np.float64)
+    Rxx, Ryx, Rzx = R[..., 0, 0], R[..., 0, 1], R[..., 0, 2]
+    Rxy, Ryy, Rzy = R[..., 1, 0], R[..., 1, 1], R[..., 1, 2]
+    Rxz, Ryz, Rzz = R[..., 2, 0], R[..., 2, 1], R[..., 2, 2]
+    # lower triangle of the symmetric matrix whose dominant eigenvector is the quaternion
+    K = np.zeros(R.shape[:-2] + (4, 4))
+    K[..., 0, 0] = Rxx - Ryy - Rzz
+    K[..., 1, 0] = Ryx + Rxy
+    K[..., 1, 1] = Ryy - Rxx - Rzz
+    K[..., 2, 0] = Rzx + Rxz
+    K[..., 2, 1] = Rzy + Ryz
+    K[..., 2, 2] = Rzz - Rxx - Ryy
+    K[..., 3, 0] = Ryz - Rzy
+    K[..., 3, 1] = Rzx - Rxz
+    K[..., 3, 2] = Rxy - Ryx
+    K[..., 3, 3] = Rxx + Ryy + Rzz
+    eigvals, eigvecs = np.linalg.eigh(K / 3.0)
+    # eigh sorts the eigenvalues in ascending order
+    qvecs = eigvecs[..., [3, 0, 1, 2], -1]
+    return np.where(qvecs[..., :1] < 0, -qvecs, qvecs)
+
+
+def camera_centers(qvecs, tvecs):
+    """world positions (..., 3) of the cameras with world-to-camera poses (qvecs, tvecs)."""
+    return -np.einsum("...ji,...j->...i", qvecs2rotmats(qvecs), np.asarray(tvecs, np.float64))
+
+
+def invert_poses(qvecs, tvecs):
+    """inverse (qvecs, tvecs) of the poses, e.g. camera-to-world from world-to-camera."""
+    qvecs = np.asarray(qvecs, np.float64)
+    return qvecs * np.array([1.0, -1.0, -1.0, -1.0]), camera_centers(qvecs, tvecs)
+
+
+def pose_matrices(qvecs, tvecs):
+    """homogeneous transformation matrices (..., 4, 4) of the poses (qvecs, tvecs)."""
+    tvecs = np.asarray(tvecs, np.float64)
+    T = np.zeros(tvecs.shape[:-1] + (4, 4))
+    T[..., :3, :3] = qvecs2rotmats(qvecs)
+    T[..., :3, 3] = tvecs
+    T[..., 3, 3] = 1.0
+    return T
+
+
 def qvec2rotmat(qvec):
-    return np.array(
-        [
-            [
-                1 - 2 * qvec[2] ** 2 - 2 * qvec[3] ** 2,
-                2 * qvec[1] * qvec[2] - 2 * qvec[0] * qvec[3],
-                2 * qvec[3] * qvec[1] + 2 * qvec[0] * qvec[2],
-            ],
-            [
-                2 * qvec[1] * qvec[2] + 2 * qvec[0] * qvec[3],
-                1 - 2 * qvec[1] ** 2 - 2 * qvec[3] ** 2,
-                2 * qvec[2] * qvec[3] - 2 * qvec[0] * qvec[1],
-            ],
-            [
-                2 * qvec[3] * qvec[1] - 2 * qvec[0] * qvec[2],
-                2 * qvec[2] * qvec[3] + 2 * qvec[0] * qvec[1],
-                1 - 2 * qvec[1] ** 2 - 2 * qvec[2] ** 2,
-            ],
-        ]
-    )
+    return qvecs2rotmats(qvec)
 
 
 def rotmat2qvec(R):
-    Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
-    K = (
-        np.array(
-            [
-                [Rxx - Ryy - Rzz, 0, 0, 0],
-                [Ryx + Rxy, Ryy - Rxx - Rzz, 0, 0],
-                [Rzx + Rxz, Rzy + Ryz, Rzz - Rxx - Ryy, 0],
-                [Ryz - Rzy, Rzx - Rxz, Rxy - Ryx, Rxx + Ryy + Rzz],
-            ]
-        )
-        / 3.0
+    return rotmats2qvecs(R)
+
+
+def convert_model(input_path, output_path, input_ext="", output_ext=".txt", batch_size=POINTS3D_BATCH_SIZE):
+    """convert a model between binary and text by streaming batches, in constant memory."""
+    if input_ext == "":
+        input_ext = ".bin" if detect_model_format(input_path, ".bin") else ".txt"
+    read_cameras = read_cameras_text if input_ext == ".txt" else read_cameras_binary
+    write_cameras = write_cameras_text if output_ext == ".txt" else write_cameras_binary
+    cameras = read_cameras(os.path.join(input_path, "cameras" + input_ext))
+    write_cameras(cameras, os.path.join(output_path, "cameras" + output_ext))
+    num_images, _ = write_images_stream(
+        iter_images(os.path.join(input_path, "images" + input_ext)),
+        os.path.join(output_path, "images" + output_ext),
+    )
+    num_points3D, _ = write_points3D_stream(
+        iter_points3D(os.path.join(input_path, "points3D" + input_ext), batch_size),
+        os.path.join(output_path, "points3D" + output_ext),
+    )
+    return len(cameras), num_images, num_points3D
+
+
+def _read_points3D_text_lines(path):
+    """reference reader parsing points3D.txt line by line with `float` and `int`, for benchmarks."""
+    points3D = {}
+    with open(path, "r") as fid:
+        for line in fid:
+            line = line.strip()
+            if len(line) > 0 and line[0] != "#":
+                elems = line.split()
+                point3D_id = int(elems[0])
+                points3D[point3D_id] = Point3D(
+                    id=point3D_id,
+                    xyz=np.array(tuple(map(float, elems[1:4]))),
+                    rgb=np.array(tuple(map(int, elems[4:7]))),
+                    error=float(elems[7]),
+                    image_ids=np.array(tuple(map(int, elems[8::2]))),
+                    point2D_idxs=np.array(tuple(map(int, elems[9::2]))),
+                )
+    return points3D
+
+
+def benchmark_points3D_text(model_dir, num_points=1000000, num_workers=(2, 4)):
+    """seconds to read a synthetic points3D.txt line by line, in bulk and in bulk with worker processes.
+
+    the bulk parser alone is about 10x faster than the line by line reader on one core, worker
+    processes add to that when more cores are available.
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+    track_lengths = rng.integers(2, 12, num_points)
+    track_offsets = np.zeros(num_points + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    points3D = Points3DArrays(
+        ids=np.arange(1, num_points + 1, dtype=np.int64),
+        xyz=rng.normal(size=(num_points, 3)) * 10,
+        rgb=rng.integers(0, 256, (num_points, 3)).astype(np.uint8),
+        error=rng.random(num_points),
+        track_offsets=track_offsets,
+        track_image_ids=rng.integers(1, 5000, track_offsets[-1]).astype(np.int32),
+        track_point2D_idxs=rng.integers(0, 20000, track_offsets[-1]).astype(np.int32),
     )
-    eigvals, eigvecs = np.linalg.eigh(K)
-    qvec = eigvecs[[3, 0, 1, 2], np.argmax(eigvals)]
-    if qvec[0] < 0:
-        qvec *= -1
-    return qvec
+    os.makedirs(model_dir, exist_ok=True)
+    write_model({}, {}, points3D, model_dir, ".txt")
+    points3D_path = os.path.join(model_dir, "points3D.txt")
+
+    def best_time(read, *args, repeats=3, **kwargs):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            read(*args, **kwargs)
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    # the bulk readers first, freeing the objects of the line by line reader slows down what follows
+    results = {"bulk": best_time(read_points3D_text_arrays, points3D_path)}
+    for workers in num_workers:
+        results[f"bulk_{workers}_workers"] = best_time(read_model_arrays, model_dir, ".txt", num_workers=workers)
+    results["per_line"] = best_time(_read_points3D_text_lines, points3D_path, repeats=1)
+    return results
 
 
 def main():
@@ -501,16 +1531,27 @@ def main():
     parser.add_argument("--input_format", choices=[".bin", ".txt"], help="input model format", default="")
     parser.add_argument("--output_model", help="path to output model folder")
     parser.add_argument("--output_format", choices=[".bin", ".txt"], help="outut model format", default=".txt")
+    parser.add_argument("--batch_size", type=int, default=POINTS3D_BATCH_SIZE, help="points per streamed batch")
+    parser.add_argument("--benchmark", help="benchmark reading a synthetic points3D.txt written to this folder")
     args = parser.parse_args()
 
-    cameras, images, points3D = read_model(path=args.input_model, ext=args.input_format)
-
-    print("num_cameras:", len(cameras))
-    print("num_images:", len(images))
-    print("num_points3D:", len(points3D))
+    if args.benchmark is not None:
+        results = benchmark_points3D_text(args.benchmark)
+        for mode, seconds in results.items():
+            print(f"{mode}: {seconds:.2f}s, {results['per_line'] / seconds:.1f}x")
+        return
 
     if args.output_model is not None:
-        write_model(cameras, images, points3D, path=args.output_model, ext=args.output_format)
+        num_cameras, num_images, num_points3D = convert_model(
+            args.input_model, args.output_model, args.input_format, args.output_format, args.batch_size
+        )
+    else:
+        cameras, images, points3D = read_model(path=args.input_model, ext=args.input_format)
+        num_cameras, num_images, num_points3D = len(cameras), len(images), len(points3D)
+
+    print("num_cameras:", num_cameras)
+    print("num_images:", num_images)
+    print("num_points3D:", num_points3D)
 
 
 if __name__ == "__main__":
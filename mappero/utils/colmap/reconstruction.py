@@ -0,0 +1,143 @@
+import numpy as np
+
+from .read_write_model import (
+    images_arrays_to_dict,
+    images_dict_to_arrays,
+    points3D_arrays_to_dict,
+    points3D_dict_to_arrays,
+    read_model_arrays,
+    take_images_arrays,
+    take_points3D_arrays,
+    write_model,
+)
+
+_EMPTY = np.iinfo(np.int64).min
+_GOLDEN_RATIO = np.uint64(0x9E3779B97F4A7C15)
+
+
+class IdIndex:
+    """open-addressing hash table from ids to row numbers, built and queried with numpy."""
+
+    def __init__(self, ids):
+        ids = np.asarray(ids, np.int64)
+        # keep the load factor at or below 0.5
+        self._bits = max(int(2 * len(ids) - 1).bit_length(), 1)
+        self._mask = (1 << self._bits) - 1
+        self._keys = np.full(1 << self._bits, _EMPTY, np.int64)
+        self._rows = np.full(1 << self._bits, -1, np.int64)
+
+        rows = np.arange(len(ids), dtype=np.int64)
+        slots = self._hash(ids)
+        while rows.size:
+            free = np.flatnonzero(self._keys[slots] == _EMPTY)
+            # among the rows probing the same free slot, the first one takes it
+            _, first = np.unique(slots[free], return_index=True)
+            winners = free[first]
+            self._keys[slots[winners]] = ids[rows[winners]]
+            self._rows[slots[winners]] = rows[winners]
+            pending = np.ones(rows.size, bool)
+            pending[winners] = False
+            rows, slots = rows[pending], (slots[pending] + 1) & self._mask
+
+    def __len__(self):
+        return int(np.count_nonzero(self._rows >= 0))
+
+    def _hash(self, ids):
+        """fibonacci hashing of the ids onto the table slots."""
+        with np.errstate(over="ignore"):
+            hashed = ids.astype(np.uint64) * _GOLDEN_RATIO
+        return (hashed >> np.uint64(64 - self._bits)).astype(np.int64)
+
+    def lookup(self, ids):
+        """row of each id, -1 for unknown ids."""
+        ids = np.atleast_1d(np.asarray(ids, np.int64))
+        rows = np.full(len(ids), -1, np.int64)
+        pending = np.arange(len(ids), dtype=np.int64)
+        slots = self._hash(ids)
+        while pending.size:
+            keys = self._keys[slots]
+            hit = keys == ids[pending]
+            rows[pending[hit]] = self._rows[slots[hit]]
+            probe = ~hit & (keys != _EMPTY)
+            pending, slots = pending[probe], (slots[probe] + 1) & self._mask
+        return rows
+
+    def rows(self, ids):
+        """row of each id, raises KeyError for unknown ids."""
+        rows = self.lookup(ids)
+        if np.any(rows < 0):
+            raise KeyError(np.atleast_1d(ids)[rows < 0].tolist())
+        return rows
+
+
+class Reconstruction:
+    """colmap model stored as contiguous columnar arrays with id to row hash indexes."""
+
+    def __init__(self, cameras, images, points3D):
+        self.cameras = cameras
+        self.images = images
+        self.points3D = points3D
+        self.image_index = IdIndex(images.ids)
+        self.point3D_index = IdIndex(points3D.ids)
+
+    @classmethod
+    def read(cls, path, ext="", num_workers=None, cache=None):
+        """read a binary or text colmap model, see `read_model_arrays`."""
+        return cls(*read_model_arrays(path, ext, num_workers, cache))
+
+    @classmethod
+    def from_dicts(cls, cameras, images, points3D):
+        """build from the dicts returned by `read_model`."""
+        return cls(cameras, images_dict_to_arrays(images), points3D_dict_to_arrays(points3D))
+
+    def to_dicts(self):
+        """convert to the dicts returned by `read_model`."""
+        return self.cameras, images_arrays_to_dict(self.images), points3D_arrays_to_dict(self.points3D)
+
+    def write(self, path, ext=".bin") -> None:
+        """write a binary or text colmap model."""
+        write_model(self.cameras, self.images, self.points3D, path, ext)
+
+    @property
+    def num_cameras(self) -> int:
+        return len(self.cameras)
+
+    @property
+    def num_images(self) -> int:
+        return len(self.images.ids)
+
+    @property
+    def num_points3D(self) -> int:
+        return len(self.points3D.ids)
+
+    @property
+    def track_lengths(self) -> np.ndarray:
+        return np.diff(self.points3D.track_offsets)
+
+    @property
+    def num_points2D(self) -> np.ndarray:
+        return np.diff(self.images.point2D_offsets)
+
+    def image(self, image_id):
+        """`Image` of an image id."""
+        return images_arrays_to_dict(self.select_images(self.image_index.rows(image_id)))[image_id]
+
+    def point3D(self, point3D_id):
+        """`Point3D` of a point3D id."""
+        return points3D_arrays_to_dict(self.select_points3D(self.point3D_index.rows(point3D_id)))[point3D_id]
+
+    def iter_images(self):
+        """iterate over the images as `Image` records."""
+        return iter(images_arrays_to_dict(self.images).values())
+
+    def iter_points3D(self):
+        """iterate over the points as `Point3D` records."""
+        return iter(points3D_arrays_to_dict(self.points3D).values())
+
+    def select_images(self, selection):
+        """`ImagesArrays` of the images at integer rows or where a boolean mask is set."""
+        return take_images_arrays(self.images, selection)
+
+    def select_points3D(self, selection):
+        """`Points3DArrays` of the points at integer rows or where a boolean mask is set."""
+        return take_points3D_arrays(self.points3D, selection)
@@ -0,0 +1,145 @@
+import argparse
+
+import numpy as np
+from loguru import logger
+
+from .database import COLMAPDatabase, pair_ids_to_image_ids
+
+
+class ViewGraph:
+    """undirected image graph in CSR form, weighted by the number of verified inlier matches."""
+
+    def __init__(self, image_ids1, image_ids2, weights, image_ids=None):
+        """
+        :param image_ids1, image_ids2: image ids at both ends of each edge.
+        :param weights: weight of each edge.
+        :param image_ids: ids of all images, to keep images without edges as isolated nodes.
+        """
+        image_ids1 = np.asarray(image_ids1, np.int64)
+        image_ids2 = np.asarray(image_ids2, np.int64)
+        weights = np.asarray(weights)
+        nodes = np.concatenate([image_ids1, image_ids2])
+        if image_ids is not None:
+            nodes = np.concatenate([nodes, np.asarray(image_ids, np.int64)])
+        self.image_ids = np.unique(nodes)
+        self.edges = np.stack(
+            [np.searchsorted(self.image_ids, image_ids1), np.searchsorted(self.image_ids, image_ids2)], axis=1
+        )
+        self.edge_weights = weights
+
+        # both directions of every edge, grouped by source node
+        sources = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        targets = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        order = np.argsort(sources, kind="stable")
+        self.indptr = np.zeros(self.num_nodes + 1, np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.num_nodes), out=self.indptr[1:])
+        self.indices = targets[order]
+        self.weights = np.concatenate([weights, weights])[order]
+
+    @classmethod
+    def from_database(cls, database_path, min_num_inliers: int = 1):
+        """graph of the two-view geometries with at least `min_num_inliers` inliers."""
+        db = COLMAPDatabase.connect(database_path)
+        try:
+            rows = db.execute("SELECT pair_id, rows FROM two_view_geometries WHERE rows >= ?", (min_num_inliers,))
+            pairs = np.array(rows.fetchall(), np.int64).reshape(-1, 2)
+            image_ids = np.array(db.execute("SELECT image_id FROM images").fetchall(), np.int64).reshape(-1)
+        finally:
+            db.close()
+        return cls(*pair_ids_to_image_ids(pairs[:, 0]), pairs[:, 1], image_ids)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.image_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edges)
+
+    @property
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    @property
+    def weighted_degrees(self) -> np.ndarray:
+        return np.bincount(
+            np.repeat(np.arange(self.num_nodes), self.degrees), weights=self.weights, minlength=self.num_nodes
+        )
+
+    def neighbors(self, image_id):
+        """ids and edge weights of the images connected to `image_id`."""
+        node = np.searchsorted(self.image_ids, image_id)
+        if node == self.num_nodes or self.image_ids[node] != image_id:
+            raise KeyError(image_id)
+        span = slice(self.indptr[node], self.indptr[node + 1])
+        return self.image_ids[self.indices[span]], self.weights[span]
+
+    def connected_components(self) -> np.ndarray:
+        """component label of each node, components numbered by decreasing size."""
+        labels = np.arange(self.num_nodes)
+        u, v = self.edges[:, 0], self.edges[:, 1]
+        while True:
+            # hook every node to the smallest label across its edges, then compress paths
+            previous = labels.copy()
+            lowest = np.minimum(labels[u], labels[v])
+            np.minimum.at(labels, u, lowest)
+            np.minimum.at(labels, v, lowest)
+            np.minimum.at(labels, previous, labels)
+            while True:
+                parents = labels[labels]
+                if np.array_equal(parents, labels):
+                    break
+                labels = parents
+            if np.array_equal(labels, previous):
+                break
+        _, components, sizes = np.unique(labels, return_inverse=True, return_counts=True)
+        ranks = np.empty_like(sizes)
+        ranks[np.argsort(-sizes, kind="stable")] = np.arange(len(sizes))
+        return ranks[components]
+
+    def degree_stats(self) -> dict:
+        """summary statistics of the node degrees."""
+        degrees = self.degrees
+        if self.num_nodes == 0:
+            return {"min": 0, "max": 0, "mean": 0.0, "median": 0.0, "isolated": 0}
+        return {
+            "min": int(degrees.min()),
+            "max": int(degrees.max()),
+            "mean": float(degrees.mean()),
+            "median": float(np.median(degrees)),
+            "isolated": int(np.count_nonzero(degrees == 0)),
+        }
+
+    def to_scipy(self):
+        """adjacency as a `scipy.sparse.csr_matrix` indexed by node, see `image_ids`."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.weights, self.indices, self.indptr), shape=(self.num_nodes, self.num_nodes))
+
+    def write_edges(self, path) -> None:
+        """write one `image_id1 image_id2 weight` line per edge."""
+        edges = np.column_stack([self.image_ids[self.edges], self.edge_weights])
+        np.savetxt(path, edges, fmt="%d", header="image_id1 image_id2 num_inliers")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the view graph of a COLMAP database")
+    parser.add_argument("--database_path", required=True, help="path to database.db")
+    parser.add_argument("--min_num_inliers", type=int, default=15, help="minimum number of inliers of an edge")
+    parser.add_argument("--output", help="optional path to write the edge list to")
+    args = parser.parse_args()
+
+    graph = ViewGraph.from_database(args.database_path, args.min_num_inliers)
+    logger.info(f"num_images: {graph.num_nodes}, num_edges: {graph.num_edges}")
+    logger.info(f"degrees: {graph.degree_stats()}")
+
+    components = graph.connected_components()
+    sizes = np.bincount(components)
+    logger.info(f"num_components: {len(sizes)}, largest: {sizes[:10].tolist()}")
+
+    if args.output:
+        graph.write_edges(args.output)
+
+
+if __name__ == "__main__":
+    main()
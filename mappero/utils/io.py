@@ -1,3 +1,5 @@
+import hashlib
+import os
 from pathlib import Path
 
 
@@ -14,3 +16,18 @@ def find_images(image_path: Path, output_file: Path):
             relative_path = image_file.relative_to(image_path)
             f.write(f"{relative_path}\n")
     return image_files
+
+
+def hash_file(path: Path, sample_size: int = None) -> str:
+    """hash the content of a file, or only `sample_size` bytes at its start, middle and end."""
+    hasher = hashlib.sha256()
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if sample_size is None or size <= 3 * sample_size:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                hasher.update(block)
+        else:
+            for offset in (0, (size - sample_size) // 2, size - sample_size):
+                f.seek(offset)
+                hasher.update(f.read(sample_size))
+    return hasher.hexdigest()
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+# scalar metrics of a stage, besides its time series
+STAGE_FIELDS = (
+    "returncode",
+    "wall_time",
+    "user_time",
+    "system_time",
+    "max_rss",
+    "read_bytes",
+    "write_bytes",
+    "throughput",
+)
+
+# recorders receiving the results of finished commands
+_active_recorders = []
+_lock = threading.Lock()
+
+
+def record_command(stage: str, result) -> None:
+    """add the `CommandResult` of a finished command to the active recorders."""
+    with _lock:
+        recorders = list(_active_recorders)
+    for recorder in recorders:
+        recorder.add(stage, result)
+
+
+def _columns(rows) -> dict:
+    """namedtuple rows as one list per field."""
+    return {field: list(values) for field, values in zip(rows[0]._fields, zip(*rows))}
+
+
+class MetricsRecorder:
+    """collect the resource usage of the commands run within a `with` block.
+
+    example:
+    with MetricsRecorder("colmap sfm") as metrics:
+        run_sfm(...)
+    metrics.save(workspace_path / "metrics.json")
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start_time = time.time()
+        self.end_time = None
+        self.stages = []
+
+    def __enter__(self):
+        with _lock:
+            _active_recorders.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end_time = time.time()
+        with _lock:
+            _active_recorders.remove(self)
+
+    def add(self, stage: str, result) -> None:
+        """record the `CommandResult` of a stage."""
+        with _lock:
+            self.stages.append(
+                {
+                    "stage": stage,
+                    "returncode": result.returncode,
+                    "start_time": result.start_time,
+                    "wall_time": result.wall_time,
+                    "user_time": result.user_time,
+                    "system_time": result.system_time,
+                    "max_rss": result.max_rss,
+                    "read_bytes": result.read_bytes,
+                    "write_bytes": result.write_bytes,
+                }
+            )
+            # one list per field of `ResourceSample` and `ProgressEvent`
+            if result.samples:
+                self.stages[-1]["samples"] = _columns(result.samples)
+            if result.progress:
+                self.stages[-1]["progress"] = _columns(result.progress)
+                # rate of each kind of progress over its last pass
+                self.stages[-1]["throughput"] = {
+                    event.kind: event.rate for event in result.progress if event.rate is not None
+                }
+
+    def to_dict(self) -> dict:
+        end_time = self.end_time or time.time()
+        return {
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start_time).isoformat(timespec="seconds"),
+            "wall_time": end_time - self.start_time,
+            "stages": sorted(self.stages, key=lambda stage: stage["start_time"]),
+        }
+
+    def log_summary(self) -> None:
+        """log one line per stage."""
+        for stage in sorted(self.stages, key=lambda stage: stage["start_time"]):
+            logger.info(
+                f"{stage['stage']}: wall {stage['wall_time']:.1f}s, "
+                f"cpu {stage['user_time'] + stage['system_time']:.1f}s, "
+                f"peak rss {stage['max_rss'] / 1024**2:.0f} MiB"
+                + "".join(f", {rate:.2f} {kind}/s" for kind, rate in stage.get("throughput", {}).items())
+            )
+
+    def save(self, path) -> None:
+        """append this run to a metrics json file, keeping the runs already recorded there."""
+        path = Path(path)
+        runs = []
+        if path.exists():
+            try:
+                with open(path) as f:
+                    runs = json.load(f)["runs"]
+            except (OSError, ValueError, KeyError):
+                logger.warning(f"overwriting unreadable metrics file {path}")
+        runs.append(self.to_dict())
+        with open(path, "w") as f:
+            json.dump({"runs": runs}, f, indent=4)
+        logger.info(f"metrics saved to {path}")
+
+    def _counter(self, name: str, timestamp: float, counters: dict) -> dict:
+        """chrome trace counter event."""
+        ts = (timestamp - self.start_time) * 1e6
+        return {"name": name, "ph": "C", "pid": os.getpid(), "ts": ts, "args": counters}
+
+    def write_chrome_trace(self, path) -> None:
+        """write the stages as a chrome trace, to open in chrome://tracing or ui.perfetto.dev."""
+        events = [{"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": self.name}}]
+        # concurrent stages go to separate lanes
+        lane_ends = []
+        for stage in sorted(self.stages, key=lambda stage: stage["start_time"]):
+            end_time = stage["start_time"] + stage["wall_time"]
+            lane = next((i for i, lane_end in enumerate(lane_ends) if lane_end <= stage["start_time"]), len(lane_ends))
+            if lane == len(lane_ends):
+                lane_ends.append(end_time)
+            lane_ends[lane] = end_time
+            events.append(
+                {
+                    "name": stage["stage"],
+                    "ph": "X",
+                    "pid": os.getpid(),
+                    "tid": lane,
+                    "ts": (stage["start_time"] - self.start_time) * 1e6,
+                    "dur": stage["wall_time"] * 1e6,
+                    "args": {key: value for key, value in stage.items() if key in STAGE_FIELDS},
+                }
+            )
+            # sampled resource usage and progress rates as counter tracks
+            samples = stage.get("samples")
+            for i in range(len(samples["time"]) if samples else 0):
+                counters = {
+                    "cpu_percent": samples["cpu_percent"][i],
+                    "rss_mib": samples["rss"][i] / 1024**2,
+                    "num_threads": samples["num_threads"][i],
+                }
+                events.append(self._counter(f"{stage['stage']} resources", samples["time"][i], counters))
+            progress = stage.get("progress")
+            for i in range(len(progress["time"]) if progress else 0):
+                counters = {f"{progress['kind'][i]}_per_s": progress["rate"][i] or 0.0}
+                events.append(self._counter(f"{stage['stage']} progress", progress["time"][i], counters))
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"chrome trace saved to {path}")
+
+
+def save_metrics(metrics: MetricsRecorder, workspace_path: Path, trace: bool = False) -> None:
+    """save the metrics of a run to metrics.json, and optionally trace.json, in the workspace."""
+    metrics.log_summary()
+    metrics.save(workspace_path / "metrics.json")
+    if trace:
+        metrics.write_chrome_trace(workspace_path / "trace.json")
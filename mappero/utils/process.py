@@ -1,17 +1,314 @@
+import asyncio
+import collections
+import os
+import signal
 import subprocess
+import sys
+import threading
+import time
 
 from loguru import logger
 
+from mappero.utils.metrics import record_command
+from mappero.utils.progress import ProgressParser, block_size_option
+from mappero.utils.sampler import ResourceSampler
 
-def run_command(cmd: list, params: dict):
-    """run a colmap command with parameters."""
+# seconds given to a terminated command before it is killed
+TERMINATE_TIMEOUT = 10.0
+
+# defaults of the resource sampler, sizes such as 48G are accepted for the memory limits
+SAMPLE_INTERVAL = os.environ.get("MAPPERO_SAMPLE_INTERVAL")
+SOFT_MEMORY_LIMIT = os.environ.get("MAPPERO_SOFT_MEMORY_LIMIT")
+HARD_MEMORY_LIMIT = os.environ.get("MAPPERO_HARD_MEMORY_LIMIT")
+
+CommandResult = collections.namedtuple(
+    "CommandResult",
+    [
+        "cmd",
+        "returncode",
+        "start_time",
+        "wall_time",
+        "user_time",
+        "system_time",
+        "max_rss",
+        "read_bytes",
+        "write_bytes",
+        "samples",
+        "progress",
+    ],
+)
+
+
+def build_command(cmd: list, params: dict) -> list:
+    """append `--key value` arguments to a command."""
+    cmd = list(cmd)
     for key, value in params.items():
         cmd.append(f"--{key}")
         if value is not None:
             cmd.append(str(value))
+    return cmd
+
+
+def _read_proc_io(pid: int) -> dict:
+    """io counters of a process from /proc/<pid>/io, empty where unavailable."""
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def _wait(pid: int):
+    """block until a child exits, returns its exit code, resource usage and io counters."""
+    io = {}
+    if hasattr(os, "waitid"):
+        # wait without reaping, the io counters of a zombie are still readable
+        os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+        io = _read_proc_io(pid)
+    _, status, rusage = os.wait4(pid, 0)
+    # negative signal number for a killed child, as subprocess does
+    returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return returncode, rusage, io
+
+
+def _signal_group(pid: int, sig) -> None:
+    """send a signal to the process group led by a child."""
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def _log_stream(pipe, name: str, level: str, on_line=None) -> None:
+    """forward the lines of a child pipe to loguru as they arrive, and to `on_line` if given."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=1 << 20)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
     try:
-        logger.info(f"running command: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"command failed: {' '.join(cmd)}\nerror: {e}")
-        raise
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            text = line.decode("utf-8", errors="replace").rstrip()
+            if text:
+                logger.log(level, f"[{name}] {text}")
+                if on_line is not None:
+                    on_line(text)
+    finally:
+        transport.close()
+
+
+class CommandRunner:
+    """run external commands concurrently within a process count and cpu thread budget.
+
+    child output is streamed line by line into loguru and parsed for progress messages, and each
+    run returns a `CommandResult` with the wall time, cpu times and peak resident memory of the
+    child. with a sample interval or a memory limit, a `ResourceSampler` also records the usage of
+    each command over time. commands of programs without a thread count option can be pinned to
+    cpus that no other pinned command uses, so that they stay within their share of the budget.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        num_threads: int = None,
+        memory_budget: int = None,
+        sample_interval: float = SAMPLE_INTERVAL,
+        soft_memory_limit=SOFT_MEMORY_LIMIT,
+        hard_memory_limit=HARD_MEMORY_LIMIT,
+    ):
+        """
+        :param max_concurrency: maximum number of commands running at once, one per cpu by default.
+        :param num_threads: cpu threads shared by the running commands, the number of cpus by default.
+        :param memory_budget: bytes of memory shared by the running commands, unlimited by default.
+        :param sample_interval: seconds between resource samples, 1 if only memory limits are set.
+        :param soft_memory_limit: resident memory of a command above which a warning is logged.
+        :param hard_memory_limit: resident memory of a command above which it is terminated.
+        """
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.num_threads = num_threads or os.cpu_count() or 1
+        self.memory_budget = memory_budget
+        self.soft_memory_limit = soft_memory_limit
+        self.hard_memory_limit = hard_memory_limit
+        self.sample_interval = float(sample_interval) if sample_interval else None
+        if self.sample_interval is None and (soft_memory_limit or hard_memory_limit):
+            self.sample_interval = 1.0
+        self._available_threads = self.num_threads
+        self._available_memory = memory_budget or 0
+        self._cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else []
+        self._pinned_cpus = set()
+        self._slots = None
+        self._budget = None
+
+    def _primitives(self):
+        # created on first use so they belong to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._budget = asyncio.Condition()
+        return self._slots, self._budget
+
+    async def run(
+        self,
+        cmd: list,
+        params: dict = None,
+        threads: int = 1,
+        memory: int = 0,
+        timeout: float = None,
+        check: bool = True,
+        name: str = None,
+        env: dict = None,
+        pin: bool = False,
+    ) -> CommandResult:
+        """run a command once a slot, `threads` cpu threads and `memory` bytes of the budget are free.
+
+        waiting commands start in the order they were submitted among those that fit in the budget.
+
+        :param timeout: seconds after which the command is terminated, then killed.
+        :param check: raise `subprocess.CalledProcessError` on a non-zero exit code.
+        :param name: label of the command in the logs and metrics, the program and its first argument by default.
+        :param env: variables added to the environment of the command.
+        :param pin: bind the command and its children to `threads` cpus, unless fewer are free.
+        """
+        cmd = build_command(cmd, params or {})
+        threads = max(1, min(threads, self.num_threads))
+        memory = min(memory, self.memory_budget) if self.memory_budget else 0
+        slots, budget = self._primitives()
+        async with slots:
+            async with budget:
+                await budget.wait_for(lambda: self._available_threads >= threads and self._available_memory >= memory)
+                self._available_threads -= threads
+                self._available_memory -= memory
+                cpus = self._pin_cpus(threads) if pin else None
+            try:
+                result = await self._run(cmd, timeout, name, env, cpus)
+            finally:
+                async with budget:
+                    self._available_threads += threads
+                    self._available_memory += memory
+                    self._pinned_cpus.difference_update(cpus or ())
+                    budget.notify_all()
+
+        if check and result.returncode != 0:
+            logger.error(f"command failed: {' '.join(cmd)}\nexit code: {result.returncode}")
+            raise subprocess.CalledProcessError(result.returncode, cmd)
+        return result
+
+    def _pin_cpus(self, threads: int):
+        """reserve `threads` cpus not pinned by another command, None if there are not enough."""
+        cpus = [cpu for cpu in self._cpus if cpu not in self._pinned_cpus][:threads]
+        if len(cpus) < threads:
+            logger.warning(f"{threads} cpus are not free, the command is not pinned")
+            return None
+        self._pinned_cpus.update(cpus)
+        return cpus
+
+    async def _run(
+        self, cmd: list, timeout: float, name: str = None, env: dict = None, cpus: list = None
+    ) -> CommandResult:
+        loop = asyncio.get_running_loop()
+        if name is None:
+            name = os.path.basename(cmd[0]) if len(cmd) < 2 else f"{os.path.basename(cmd[0])} {cmd[1]}"
+        logger.info(f"running command: {' '.join(cmd)}" + (f" on cpus {cpus}" if cpus else ""))
+
+        start_time = time.time()
+        start = time.perf_counter()
+        # own process group, so that terminating the command also stops the processes it spawned
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            env={**os.environ, **env} if env else None,
+            # set in the child before exec, the threads it starts inherit the affinity
+            preexec_fn=(lambda: os.sched_setaffinity(0, cpus)) if cpus else None,
+        )
+        progress = ProgressParser(name, block_size=block_size_option(cmd))
+        streams = asyncio.gather(
+            _log_stream(process.stdout, name, "INFO", progress.feed),
+            _log_stream(process.stderr, name, "INFO", progress.feed),
+        )
+        # reaping with wait4 in a worker thread gives the resource usage of this child only
+        waiter = loop.run_in_executor(None, _wait, process.pid)
+        sampler = sampling = None
+        if self.sample_interval is not None:
+            sampler = ResourceSampler(process.pid, self.sample_interval, self.soft_memory_limit, self.hard_memory_limit)
+            sampling = asyncio.ensure_future(sampler.run(lambda: self._terminate(process, waiter)))
+        try:
+            returncode, rusage, io = await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else "cancelled"
+            logger.warning(f"{name} {reason}, terminating")
+            returncode, rusage, io = await self._terminate(process, waiter)
+            process.returncode = returncode
+            await self._stop_sampling(sampling)
+            await streams
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            logger.error(f"command timed out: {' '.join(cmd)}")
+            raise subprocess.TimeoutExpired(cmd, timeout) from None
+        process.returncode = returncode
+        await self._stop_sampling(sampling)
+        await streams
+
+        result = CommandResult(
+            cmd=cmd,
+            returncode=returncode,
+            start_time=start_time,
+            wall_time=time.perf_counter() - start,
+            user_time=rusage.ru_utime,
+            system_time=rusage.ru_stime,
+            # ru_maxrss is in kilobytes on linux and in bytes on macos, and it is at least the size of
+            # this process, which the child was forked from
+            max_rss=rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024,
+            read_bytes=io.get("read_bytes"),
+            write_bytes=io.get("write_bytes"),
+            samples=sampler.samples if sampler is not None else None,
+            progress=progress.finish(),
+        )
+        record_command(name, result)
+        return result
+
+    @staticmethod
+    async def _stop_sampling(sampling) -> None:
+        if sampling is not None:
+            sampling.cancel()
+            try:
+                await sampling
+            except asyncio.CancelledError:
+                pass
+
+    async def _terminate(self, process, waiter):
+        """terminate a child, kill it if it does not exit in time, and reap it."""
+        _signal_group(process.pid, signal.SIGTERM)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            _signal_group(process.pid, signal.SIGKILL)
+            return await waiter
+        finally:
+            # leftover processes of the group would keep the output pipes open
+            _signal_group(process.pid, signal.SIGKILL)
+
+    async def run_all(self, commands, **kwargs) -> list:
+        """run (cmd, params) commands concurrently, returns their results in order."""
+        return await asyncio.gather(*(self.run(cmd, params, **kwargs) for cmd, params in commands))
+
+
+async def run_until_terminated(coroutine):
+    """await a coroutine, cancelling it when this process receives SIGTERM."""
+    if threading.current_thread() is threading.main_thread():
+        # the commands run in their own process group, stop them when a parent terminates this one
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    return await coroutine
+
+
+def run_command(
+    cmd: list, params: dict, timeout: float = None, pin_threads: int = None, **runner_options
+) -> CommandResult:
+    """run a colmap command with parameters, see `CommandRunner` for the options.
+
+    :param pin_threads: number of cpus the command is bound to, for programs without a thread count option.
+    """
+    runner = CommandRunner(max_concurrency=1, **runner_options)
+    run = runner.run(cmd, params, timeout=timeout, threads=pin_threads or 1, pin=pin_threads is not None)
+    return asyncio.run(run_until_terminated(run))
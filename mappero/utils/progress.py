@@ -0,0 +1,162 @@
+import collections
+import re
+import time
+
+from loguru import logger
+
+# seconds between progress log messages and between recorded events of a command
+LOG_INTERVAL = 30.0
+RECORD_INTERVAL = 1.0
+
+# default block sizes of the colmap exhaustive matcher, in images, and matches importer, in pairs
+EXHAUSTIVE_BLOCK_SIZE = 50
+IMPORTED_BLOCK_SIZE = 1225
+
+ProgressEvent = collections.namedtuple("ProgressEvent", ["time", "kind", "current", "total", "rate", "eta"])
+
+
+def _exhaustive_pairs(match, block_size=EXHAUSTIVE_BLOCK_SIZE):
+    """pairs up to a [i/n, j/m] block of `block_size` images, and in all blocks, assuming full blocks.
+
+    a block below the diagonal holds b(b + 1)/2 pairs, the others b(b - 1)/2.
+    """
+    i, n, j, m = map(int, match.groups())
+    below, other = block_size * (block_size + 1) // 2, block_size * (block_size - 1) // 2
+
+    def pairs(i, j):
+        # full rows before row i, each row r having r - 1 blocks below the diagonal, then row i up to column j
+        num_below = (i - 1) * (i - 2) // 2 + min(j, i - 1)
+        return num_below * below + ((i - 1) * m + j - num_below) * other
+
+    return pairs(i, j), pairs(n, m)
+
+
+def _imported_pairs(match, block_size=IMPORTED_BLOCK_SIZE):
+    """pairs up to an [i/n] block of `block_size` pairs, and in all blocks."""
+    i, n = int(match.group(1)), int(match.group(2))
+    return i * block_size, n * block_size
+
+
+def _index(match):
+    return int(match.group(1)), int(match.group(2))
+
+
+def _count(match):
+    return int(match.group(1)), None
+
+
+# (kind, pattern, parse) of the progress messages of colmap and glomap, the first match wins
+PROGRESS_PATTERNS = [
+    # feature_extractor, image_registrator
+    ("images", re.compile(r"Processed file \[(\d+)/(\d+)\]"), _index),
+    # exhaustive_matcher, blocks of images counted in pairs
+    ("pairs", re.compile(r"Matching block \[(\d+)/(\d+), (\d+)/(\d+)\]"), _exhaustive_pairs),
+    # matches_importer, blocks of pairs
+    ("pairs", re.compile(r"Matching block \[(\d+)/(\d+)\]"), _imported_pairs),
+    # sequential, vocab_tree and spatial matchers
+    ("images", re.compile(r"Matching image \[(\d+)/(\d+)\]"), _index),
+    # mapper, the number of registered images in parentheses
+    ("registered_images", re.compile(r"Registering image #\d+ \((\d+)\)"), _count),
+    # bundle adjustment reports, with or without a log prefix, counted cumulatively
+    ("ba_iterations", re.compile(r"(?:^|\] )\s*Iterations\s*:\s*(\d+)\s*$"), _count),
+    # patch_match_stereo
+    ("views", re.compile(r"Processing view (\d+) / (\d+)"), _index),
+    # stereo_fusion
+    ("images", re.compile(r"Fusing image \[(\d+)/(\d+)\]"), _index),
+]
+
+
+def _format_eta(seconds) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ProgressParser:
+    """turn the progress messages in the output of a command into `ProgressEvent`s.
+
+    the rate of each kind of progress is measured since its first message, or since the counter
+    last went backwards, as when a matcher starts another pass.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        log_interval: float = LOG_INTERVAL,
+        record_interval: float = RECORD_INTERVAL,
+        block_size: int = None,
+    ):
+        """
+        :param stage: name of the command, used in the log messages.
+        :param log_interval: seconds between progress log messages.
+        :param record_interval: seconds between events kept in `events`, the last event is always kept.
+        :param block_size: block size of a matcher, to count its blocks in pairs, the colmap default otherwise.
+        """
+        self.stage = stage
+        self.block_size = block_size
+        self.log_interval = log_interval
+        self.record_interval = record_interval
+        self.events = []
+        self._baselines = {}
+        self._totals = collections.Counter()
+        self._last = None
+        self._last_log_time = None
+
+    def parse(self, line: str, now: float = None):
+        """`ProgressEvent` of an output line, None if it reports no progress."""
+        for kind, pattern, parse in PROGRESS_PATTERNS:
+            match = pattern.search(line)
+            if match is not None:
+                break
+        else:
+            return None
+        now = time.time() if now is None else now
+        current, total = parse(match, self.block_size) if kind == "pairs" and self.block_size else parse(match)
+        if kind == "ba_iterations":
+            self._totals[kind] += current
+            current = self._totals[kind]
+
+        baseline = self._baselines.get(kind)
+        if baseline is None or current < baseline[1]:
+            baseline = self._baselines[kind] = (now, current)
+        elapsed = now - baseline[0]
+        rate = (current - baseline[1]) / elapsed if elapsed > 0 else None
+        eta = (total - current) / rate if total is not None and rate else None
+        return ProgressEvent(now, kind, current, total, rate, eta)
+
+    def feed(self, line: str):
+        """parse a line, and log and record its event at the configured intervals."""
+        event = self.parse(line)
+        if event is None:
+            return None
+        if self._last_log_time is None or event.time - self._last_log_time >= self.log_interval:
+            self._last_log_time = event.time
+            self.log(event)
+        if not self.events or event.time - self.events[-1].time >= self.record_interval:
+            self.events.append(event)
+            self._last = None
+        else:
+            self._last = event
+        return event
+
+    def finish(self) -> list:
+        """recorded events, including the last one seen."""
+        if self._last is not None:
+            self.events.append(self._last)
+            self._last = None
+        return self.events
+
+    def log(self, event: ProgressEvent) -> None:
+        total = f"/{event.total}" if event.total is not None else ""
+        rate = f"{event.rate:.2f} {event.kind}/s" if event.rate is not None else "unknown rate"
+        logger.info(f"[{self.stage}] {event.kind} {event.current}{total}, {rate}, eta {_format_eta(event.eta)}")
+
+
+def block_size_option(cmd: list):
+    """value of the `--*.block_size` option of a command, None if it has none."""
+    for key, value in zip(cmd, cmd[1:]):
+        if key.startswith("--") and key.endswith(".block_size"):
+            return int(value)
+    return None
@@ -0,0 +1,128 @@
+import asyncio
+import collections
+import os
+import re
+import time
+
+from loguru import logger
+
+ResourceSample = collections.namedtuple(
+    "ResourceSample", ["time", "cpu_percent", "rss", "num_threads", "read_rate", "write_rate"]
+)
+
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3, "t": 1024**4}
+
+
+def parse_size(size) -> int:
+    """bytes of a size such as 512M or 16G, None stays None."""
+    if size is None or isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*([0-9.]+)\s*([kmgt]?)i?b?\s*", str(size).lower())
+    if match is None:
+        raise ValueError(f"invalid size: {size}")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+def _read_stat(pid: str):
+    """process group, cpu ticks, threads and resident pages from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat", "rb") as f:
+        data = f.read()
+    # the command name may contain spaces and parentheses
+    fields = data[data.rindex(b")") + 2 :].split()
+    return int(fields[2]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21])
+
+
+def _read_io(pid: str):
+    """bytes read from and written to storage by a process."""
+    read_bytes = write_bytes = 0
+    with open(f"/proc/{pid}/io", "rb") as f:
+        for line in f:
+            if line.startswith(b"read_bytes"):
+                read_bytes = int(line.split()[1])
+            elif line.startswith(b"write_bytes"):
+                write_bytes = int(line.split()[1])
+    return read_bytes, write_bytes
+
+
+class ResourceSampler:
+    """poll the resource usage of a child process group from /proc, and enforce memory ceilings.
+
+    the group is the child started by `CommandRunner` in its own session and every process it
+    spawned, the same processes a terminated command is stopped with.
+    """
+
+    def __init__(self, pgid: int, interval: float = 1.0, soft_memory_limit=None, hard_memory_limit=None):
+        """
+        :param pgid: process group id, the pid of the child.
+        :param interval: seconds between samples.
+        :param soft_memory_limit: resident memory of the group above which a warning is logged.
+        :param hard_memory_limit: resident memory of the group above which the command is terminated.
+        """
+        self.pgid = pgid
+        self.interval = interval
+        self.soft_memory_limit = parse_size(soft_memory_limit)
+        self.hard_memory_limit = parse_size(hard_memory_limit)
+        self.samples = []
+        self.exceeded_hard_limit = False
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._warned = False
+        self._previous = None
+
+    def _read_group(self):
+        """total cpu seconds, resident bytes, threads and io bytes of the group."""
+        cpu_ticks = pages = num_threads = read_bytes = write_bytes = 0
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue
+            try:
+                pgrp, ticks, threads, rss_pages = _read_stat(pid)
+                if pgrp != self.pgid:
+                    continue
+                io = _read_io(pid)
+            except (OSError, ValueError, IndexError):
+                # the process exited meanwhile
+                continue
+            cpu_ticks += ticks
+            num_threads += threads
+            pages += rss_pages
+            read_bytes += io[0]
+            write_bytes += io[1]
+        return cpu_ticks / self._clock_ticks, pages * self._page_size, num_threads, read_bytes, write_bytes
+
+    def sample(self) -> ResourceSample:
+        """record one sample, rates are averaged since the previous one."""
+        now = time.perf_counter()
+        cpu_time, rss, num_threads, read_bytes, write_bytes = self._read_group()
+        cpu_percent = read_rate = write_rate = 0.0
+        if self._previous is not None:
+            last_time, last_cpu_time, last_read_bytes, last_write_bytes = self._previous
+            elapsed = max(now - last_time, 1e-6)
+            # counters of processes that exited since the previous sample are gone, clamp at zero
+            cpu_percent = max(cpu_time - last_cpu_time, 0.0) / elapsed * 100
+            read_rate = max(read_bytes - last_read_bytes, 0) / elapsed
+            write_rate = max(write_bytes - last_write_bytes, 0) / elapsed
+        self._previous = (now, cpu_time, read_bytes, write_bytes)
+        sample = ResourceSample(time.time(), cpu_percent, rss, num_threads, read_rate, write_rate)
+        self.samples.append(sample)
+        return sample
+
+    async def run(self, terminate) -> None:
+        """sample until cancelled, awaits `terminate()` once the hard memory limit is exceeded."""
+        while True:
+            sample = self.sample()
+            if self.hard_memory_limit is not None and sample.rss > self.hard_memory_limit:
+                logger.error(
+                    f"process group {self.pgid} uses {sample.rss / 1024**2:.0f} MiB, above the hard limit of "
+                    f"{self.hard_memory_limit / 1024**2:.0f} MiB, terminating"
+                )
+                self.exceeded_hard_limit = True
+                await terminate()
+                return
+            if self.soft_memory_limit is not None and sample.rss > self.soft_memory_limit and not self._warned:
+                logger.warning(
+                    f"process group {self.pgid} uses {sample.rss / 1024**2:.0f} MiB, above the soft limit of "
+                    f"{self.soft_memory_limit / 1024**2:.0f} MiB"
+                )
+                self._warned = True
+            await asyncio.sleep(self.interval)
@@ -4,14 +4,21 @@ import click
 import numpy as np
 import open3d as o3d
 from loguru import logger
-from mappero.utils.colmap.read_write_model import qvec2rotmat, read_model
+from mappero.utils.colmap.filter import filter_mask
+from mappero.utils.colmap.model_cache import ModelCache
+from mappero.utils.colmap.read_write_model import (
+    images_dict_to_arrays,
+    invert_poses,
+    points3D_dict_to_arrays,
+    pose_matrices,
+)
+from mappero.utils.colmap.reconstruction import Reconstruction
 
 
 class Vis3DGUI:
     def __init__(self):
-        self.cameras = {}
-        self.images = {}
-        self.points3D = {}
+        self.reconstruction = None
+        self._dicts = None
 
         # open3d gui visualizer
         self.gui = o3d.visualization.gui.Application.instance
@@ -19,28 +26,75 @@ class Vis3DGUI:
         self.__vis_gui = o3d.visualization.O3DVisualizer("colmap model visualization", width=2048, height=1024)
         # self.__vis_gui.show_settings = True  # show settings panel
 
-    def read_model(self, mode_path: str, ext: str = "") -> None:
+    def read_model(self, mode_path: str, ext: str = "", num_workers: int = None, cache: ModelCache = None) -> None:
         """read colmap model from path."""
-        self.cameras, self.images, self.points3D = read_model(mode_path, ext)
-
-        logger.info(f"num_cameras: {len(self.cameras)}")
-        logger.info(f"num_images: {len(self.images)}")
-        logger.info(f"num_points3D: {len(self.points3D)}")
+        self.set_model(Reconstruction.read(mode_path, ext, num_workers, cache))
+
+    def set_model(self, reconstruction: Reconstruction) -> None:
+        """set the colmap model to visualize."""
+        self.reconstruction = reconstruction
+
+        logger.info(f"num_cameras: {reconstruction.num_cameras}")
+        logger.info(f"num_images: {reconstruction.num_images}")
+        logger.info(f"num_points3D: {reconstruction.num_points3D}")
+
+    def _model_dicts(self):
+        # dicts of the current reconstruction, converted once per model
+        if self.reconstruction is None:
+            return {}, {}, {}
+        if self._dicts is None or self._dicts[0] is not self.reconstruction:
+            self._dicts = (self.reconstruction, self.reconstruction.to_dicts())
+        return self._dicts[1]
+
+    def _replace_model(self, cameras=None, images=None, points3D=None) -> None:
+        # rebuild the model with the given dicts, keeping the arrays of the other parts
+        model = self.reconstruction or Reconstruction.from_dicts({}, {}, {})
+        self.set_model(
+            Reconstruction(
+                model.cameras if cameras is None else cameras,
+                model.images if images is None else images_dict_to_arrays(images),
+                model.points3D if points3D is None else points3D_dict_to_arrays(points3D),
+            )
+        )
+
+    @property
+    def cameras(self) -> dict:
+        """cameras of the model by id, assigning a dict replaces them."""
+        return self._model_dicts()[0]
+
+    @cameras.setter
+    def cameras(self, cameras: dict) -> None:
+        self._replace_model(cameras=cameras)
+
+    @property
+    def images(self) -> dict:
+        """`Image` records of the model by id, assigning a dict replaces them."""
+        return self._model_dicts()[1]
+
+    @images.setter
+    def images(self, images: dict) -> None:
+        self._replace_model(images=images)
+
+    @property
+    def points3D(self) -> dict:
+        """`Point3D` records of the model by id, assigning a dict replaces them."""
+        return self._model_dicts()[2]
+
+    @points3D.setter
+    def points3D(self, points3D: dict) -> None:
+        self._replace_model(points3D=points3D)
 
     def add_points(self, min_track_len: int = 3, remove_statistical_outlier: bool = True) -> None:
         """adds and filters 3d points."""
         pcd = o3d.geometry.PointCloud()
-        xyz, rgb = [], []
 
         # filter points
-        for point3D in self.points3D.values():
-            track_len = len(point3D.point2D_idxs)
-            if track_len >= min_track_len:
-                xyz.append(point3D.xyz)
-                rgb.append(point3D.rgb / 255)
+        keep = filter_mask(self.reconstruction, min_track_len=min_track_len)
+        xyz = self.reconstruction.points3D.xyz[keep]
+        rgb = self.reconstruction.points3D.rgb[keep] / 255
 
-        pcd.points = o3d.utility.Vector3dVector(np.stack(xyz))
-        pcd.colors = o3d.utility.Vector3dVector(np.stack(rgb))
+        pcd.points = o3d.utility.Vector3dVector(xyz)
+        pcd.colors = o3d.utility.Vector3dVector(rgb)
 
         # remove statistical outliers
         if remove_statistical_outlier:
@@ -51,19 +105,26 @@ class Vis3DGUI:
 
     def add_cameras(self, scale: float = 0.25) -> None:
         """adds cameras to the open3d gui visualization."""
-        for img in self.images.values():
+        images = self.reconstruction.images
+        # camera-to-world transformations of all images at once, the image records are never decoded
+        extrinsics = self.get_extrinsics(images.qvecs, images.tvecs)
+        for name, camera_id, T in zip(images.names.tolist(), images.camera_ids.tolist(), extrinsics):
             # create camera visualization
-            cam_vis = self.create_camera(img, scale)
+            cam_vis = self.camera_visualization(self.reconstruction.cameras[camera_id], scale, T)
             # add camera to gui visualizer
-            self.__vis_gui.add_geometry(f"camera_{img.name}", cam_vis)
+            self.__vis_gui.add_geometry(f"camera_{name}", cam_vis)
 
-    def create_camera(self, img, scale: float):
+    def create_camera(self, img, scale: float, T=None):
         """creates a camera visualization for the given image data."""
         # extrinsics
-        T = self.get_extrinsics(img.qvec, img.tvec)
+        if T is None:
+            T = self.get_extrinsics(img.qvec, img.tvec)
+
+        return self.camera_visualization(self.reconstruction.cameras[img.camera_id], scale, T)
 
+    def camera_visualization(self, cam, scale: float, T):
+        """creates a camera visualization from its intrinsics and camera-to-world transformation."""
         # camera intrinsics
-        cam = self.cameras[img.camera_id]
         K, width, height = self.get_intrinsics(cam, scale)
 
         # create camera visualization
@@ -73,17 +134,8 @@ class Vis3DGUI:
         return cam_vis
 
     def get_extrinsics(self, qvec, tvec):
-        """converts quaternion (qvec) and translation (tvec) to a transformation matrix."""
-        R = qvec2rotmat(qvec)
-        t = tvec
-
-        # invert
-        t = -R.T @ t
-        R = R.T
-
-        T = np.column_stack((R, t))
-        T = np.vstack((T, (0, 0, 0, 1)))
-        return T
+        """converts quaternions (qvec) and translations (tvec) to camera-to-world transformation matrices."""
+        return pose_matrices(*invert_poses(qvec, tvec))
 
     def get_intrinsics(self, cam, scale: float = 1.0):
         """returns scaled camera intrinsics for the given camera data."""
@@ -125,10 +177,21 @@ class Vis3DGUI:
 @click.option(
     "--remove_statistical_outlier", is_flag=True, default=True, help="whether to remove statistical outliers."
 )
-def run_gui(model: str, format: str, scale: float, min_track_len: int, remove_statistical_outlier: bool) -> None:
+@click.option("--num_workers", type=int, default=None, help="number of processes used to read the model.")
+@click.option("--cache_dir", type=click.Path(), default=None, help="directory caching decoded models for fast reloads.")
+def run_gui(
+    model: str,
+    format: str,
+    scale: float,
+    min_track_len: int,
+    remove_statistical_outlier: bool,
+    num_workers: int,
+    cache_dir: str,
+) -> None:
     """main function to run the colmap visualization using gui."""
     vis3d_gui = Vis3DGUI()
-    vis3d_gui.read_model(model, ext=format)
+    cache = ModelCache(cache_dir) if cache_dir is not None else None
+    vis3d_gui.read_model(model, ext=format, num_workers=num_workers, cache=cache)
 
     vis3d_gui.add_points(min_track_len=min_track_len, remove_statistical_outlier=remove_statistical_outlier)
     vis3d_gui.add_cameras(scale=scale)
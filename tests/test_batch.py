@@ -0,0 +1,103 @@
+import json
+import subprocess
+import sys
+import types
+
+from click.testing import CliRunner
+
+from mappero.modules import batch
+from mappero.modules.batch import Job, find_workspaces, order_jobs, previous_peak_memory, run_batch, summarize
+
+
+def _workspace(path, num_images, peak_memory=None):
+    (path / "images" / "sub").mkdir(parents=True)
+    for i in range(num_images):
+        (path / "images" / "sub" / f"{i}.JPG").write_bytes(b"")
+    (path / "images" / "notes.txt").write_text("")
+    if peak_memory is not None:
+        stage = {"stage": "mapper", "max_rss": peak_memory // 2, "samples": {"rss": [peak_memory]}}
+        (path / "metrics.json").write_text(json.dumps({"runs": [{"stages": [stage]}]}))
+    return path
+
+
+def _result(returncode=0, start_time=0.0, wall_time=1.0):
+    return types.SimpleNamespace(
+        returncode=returncode, start_time=start_time, wall_time=wall_time, user_time=2.0, system_time=1.0, max_rss=0
+    )
+
+
+def test_find_workspaces(tmp_path):
+    for name in ("a", "b", "c"):
+        (tmp_path / name).mkdir()
+    (tmp_path / "file").write_text("")
+    (tmp_path / "list.txt").write_text(f"# sites\n{tmp_path / 'c'}\n\n{tmp_path / 'a'}\n")
+    workspaces = find_workspaces([str(tmp_path / "[ab]"), str(tmp_path / "file")], tmp_path / "list.txt")
+    assert workspaces == [tmp_path / "a", tmp_path / "b", tmp_path / "c"]
+
+
+def test_previous_peak_memory(tmp_path):
+    assert previous_peak_memory(_workspace(tmp_path / "a", 1, peak_memory=1000)) == 1000
+    assert previous_peak_memory(_workspace(tmp_path / "b", 1)) is None
+    (tmp_path / "b" / "metrics.json").write_text("{")
+    assert previous_peak_memory(tmp_path / "b") is None
+
+
+def test_order_jobs():
+    jobs = [Job(name, num_images, 0) for name, num_images in (("a", 2), ("b", 3), ("c", 1))]
+    assert [job.workspace for job in order_jobs(jobs, "largest_first")] == ["b", "a", "c"]
+    assert [job.workspace for job in order_jobs(jobs, "smallest_first")] == ["c", "a", "b"]
+    assert [job.workspace for job in order_jobs(jobs, "fifo")] == ["a", "b", "c"]
+
+
+def test_summarize():
+    jobs = [Job(name, 1, 0) for name in "abcd"]
+    outcomes = [_result(), _result(2, 5.0), subprocess.TimeoutExpired(["colmap"], 1.0), OSError("no such file")]
+    summary = summarize(jobs, outcomes)
+    assert [entry["status"] for entry in summary["jobs"]] == ["ok", "failed (2)", "timeout", "error: no such file"]
+    assert summary["num_failed"] == 3
+    assert summary["wall_time"] == 6.0 and summary["cpu_time"] == 6.0
+
+
+def test_run_batch(tmp_path, monkeypatch):
+    _workspace(tmp_path / "small", 1)
+    _workspace(tmp_path / "large", 3, peak_memory=1000)
+    submitted = {}
+
+    async def run_jobs(jobs, commands, runner, threads_per_job, timeout=None):
+        submitted.update(jobs=jobs, commands=commands, runner=runner, threads_per_job=threads_per_job)
+        return [_result() for _ in jobs]
+
+    monkeypatch.setattr(batch, "run_jobs", run_jobs)
+    result = CliRunner().invoke(
+        run_batch,
+        [
+            str(tmp_path / "*"),
+            "--pipeline",
+            "glomap",
+            "--num_threads",
+            "8",
+            "--memory_budget",
+            "4G",
+            "--max_jobs",
+            "2",
+            "--summary_path",
+            str(tmp_path / "summary.json"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    # the largest workspace first, sized by its previous run, the other by its share of the budget
+    assert submitted["jobs"] == [Job(tmp_path / "large", 3, 1200), Job(tmp_path / "small", 1, 2 * 1024**3)]
+    assert submitted["threads_per_job"] == 4
+    assert submitted["commands"][0] == [
+        sys.executable,
+        "-m",
+        "mappero.modules.glomap",
+        str(tmp_path / "large"),
+        "--task",
+        "sfm",
+        "--num_threads",
+        "4",
+    ]
+    assert submitted["runner"].num_threads == 8 and submitted["runner"].max_concurrency == 2
+    assert json.loads((tmp_path / "summary.json").read_text())["num_failed"] == 0
@@ -0,0 +1,84 @@
+import numpy as np
+
+from mappero.utils.colmap.colmap_nvm import read_nvm_model, recover_database_images_and_ids, write_nvm_model
+from mappero.utils.colmap.database import COLMAPDatabase
+from mappero.utils.colmap.read_write_model import CAMERA_MODEL_NAMES, Camera, Image, Point3D, rotmat2qvec, write_model
+
+
+def _shared_camera_model(num_images=3, num_points=20, seed=0):
+    """model whose images all share one camera, as with single_camera."""
+    rng = np.random.default_rng(seed)
+    cameras = {1: Camera(id=1, model="SIMPLE_RADIAL", width=640, height=480, params=np.array([500.0, 320, 240, 0.01]))}
+    xyz = rng.normal(size=(num_points, 3)) + [0, 0, 5]
+    observations = {image_id: [] for image_id in range(1, num_images + 1)}
+    points3D = {}
+    for point3D_id in range(1, num_points + 1):
+        track = rng.choice(np.arange(1, num_images + 1), size=2, replace=False)
+        point2D_idxs = []
+        for image_id in track:
+            point2D_idxs.append(len(observations[image_id]))
+            observations[image_id].append(point3D_id)
+        points3D[point3D_id] = Point3D(
+            id=point3D_id,
+            xyz=xyz[point3D_id - 1],
+            rgb=rng.integers(0, 255, 3),
+            error=0.5,
+            image_ids=np.array(track),
+            point2D_idxs=np.array(point2D_idxs),
+        )
+    images = {}
+    for image_id, point3D_ids in observations.items():
+        angle = 0.1 * image_id
+        R = np.array([[np.cos(angle), 0, np.sin(angle)], [0, 1, 0], [-np.sin(angle), 0, np.cos(angle)]])
+        images[image_id] = Image(
+            id=image_id,
+            qvec=rotmat2qvec(R),
+            tvec=np.array([0.1 * image_id, 0, 0]),
+            camera_id=1,
+            name=f"image_{image_id}.jpg",
+            xys=rng.uniform(0, 480, size=(len(point3D_ids), 2)),
+            point3D_ids=np.array(point3D_ids),
+        )
+    return cameras, images, points3D
+
+
+def test_nvm_round_trip_with_shared_camera(tmp_path):
+    cameras, images, points3D = _shared_camera_model()
+    model_path = tmp_path / "model"
+    model_path.mkdir()
+    write_model(cameras, images, points3D, str(model_path), ".bin")
+
+    database_path = tmp_path / "database.db"
+    db = COLMAPDatabase.connect(database_path)
+    db.create_tables()
+    camera = cameras[1]
+    db.add_camera(CAMERA_MODEL_NAMES[camera.model].model_id, camera.width, camera.height, camera.params, camera_id=1)
+    for image in images.values():
+        db.add_image(image.name, 1, image_id=image.id)
+    db.commit()
+    db.close()
+
+    nvm_path, intrinsics_path = tmp_path / "model.nvm", tmp_path / "intrinsics.txt"
+    assert write_nvm_model(str(model_path), nvm_path, intrinsics_path=intrinsics_path) == (3, 20)
+
+    image_ids, camera_ids = recover_database_images_and_ids(database_path)
+    cameras_nvm, images_nvm, points3D_nvm = read_nvm_model(nvm_path, intrinsics_path, image_ids, camera_ids)
+
+    assert list(cameras_nvm) == [1]
+    np.testing.assert_allclose(cameras_nvm[1].params, camera.params)
+    order = np.argsort(images_nvm.ids)
+    np.testing.assert_array_equal(images_nvm.ids[order], [1, 2, 3])
+    np.testing.assert_array_equal(images_nvm.camera_ids, 1)
+    for row, image_id in zip(order, [1, 2, 3]):
+        qvec = images[image_id].qvec
+        # q and -q are the same rotation
+        assert np.allclose(images_nvm.qvecs[row], qvec) or np.allclose(images_nvm.qvecs[row], -qvec)
+        np.testing.assert_allclose(images_nvm.tvecs[row], images[image_id].tvec, atol=1e-9)
+    np.testing.assert_allclose(points3D_nvm.xyz, np.array([p.xyz for p in points3D.values()]))
+    np.testing.assert_array_equal(
+        points3D_nvm.track_image_ids, np.concatenate([p.image_ids for p in points3D.values()])
+    )
+    for row, image_id in zip(order, [1, 2, 3]):
+        start, end = images_nvm.point2D_offsets[row : row + 2]
+        np.testing.assert_allclose(images_nvm.xys[start:end], images[image_id].xys)
+        np.testing.assert_array_equal(images_nvm.point3D_ids[start:end], images[image_id].point3D_ids - 1)
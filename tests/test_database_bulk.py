@@ -0,0 +1,82 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from mappero.utils.colmap.database import COLMAPDatabase
+
+
+def _new_database(path, num_images=4, fast=False):
+    db = COLMAPDatabase.connect(path, fast=fast)
+    db.create_tables()
+    camera_id = db.add_camera(0, 640, 480, [500, 320, 240])
+    for image_id in range(1, num_images + 1):
+        db.add_image(f"{image_id}.jpg", camera_id, image_id=image_id)
+    db.commit()
+    return db
+
+
+def _items(num_images=4, seed=0):
+    rng = np.random.default_rng(seed)
+    keypoints = [(image_id, rng.random((5 + image_id, 2), np.float32)) for image_id in range(1, num_images + 1)]
+    descriptors = [
+        (image_id, rng.integers(0, 256, (5 + image_id, 128)).astype(np.uint8)) for image_id in range(1, num_images + 1)
+    ]
+    # pairs given in both orders, the matches of reversed pairs are swapped
+    matches = [(3, 1, rng.integers(0, 5, (3, 2))), (1, 2, rng.integers(0, 5, (4, 2))), (4, 2, np.zeros((0, 2)))]
+    return keypoints, descriptors, matches
+
+
+def _dump(db):
+    return {
+        table: db.execute(f"SELECT * FROM {table} ORDER BY 1").fetchall()
+        for table in ("keypoints", "descriptors", "matches", "two_view_geometries")
+    }
+
+
+def test_bulk_insert_matches_row_by_row(tmp_path):
+    keypoints, descriptors, matches = _items()
+
+    single = _new_database(tmp_path / "single.db")
+    for item in keypoints:
+        single.add_keypoints(*item)
+    for item in descriptors:
+        single.add_descriptors(*item)
+    for item in matches:
+        single.add_matches(*item)
+        single.add_two_view_geometry(*item, config=3)
+    single.commit()
+
+    bulk = _new_database(tmp_path / "bulk.db", fast=True)
+    bulk.add_keypoints_many(keypoints)
+    bulk.add_descriptors_many(descriptors)
+    bulk.add_matches_many(matches)
+    bulk.add_two_view_geometries_many(
+        (*item, np.eye(3), np.eye(3), np.eye(3), [1, 0, 0, 0], np.zeros(3), 3) for item in matches
+    )
+
+    assert _dump(bulk) == _dump(single)
+    single.close()
+    bulk.close()
+
+
+def test_bulk_insert_is_one_transaction(tmp_path):
+    keypoints, _, _ = _items()
+    db = _new_database(tmp_path / "database.db")
+    # the duplicate image id fails the insert, nothing of the call is kept
+    with pytest.raises(sqlite3.IntegrityError):
+        db.add_keypoints_many(keypoints + keypoints[:1])
+    assert db.execute("SELECT COUNT(*) FROM keypoints").fetchone()[0] == 0
+
+    # without commit, the rows join the open transaction of the caller
+    db.add_keypoints_many(keypoints, commit=False)
+    db.rollback()
+    assert db.execute("SELECT COUNT(*) FROM keypoints").fetchone()[0] == 0
+    db.close()
+
+
+def test_fast_mode_pragmas(tmp_path):
+    db = _new_database(tmp_path / "database.db", fast=True)
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 0
+    db.close()
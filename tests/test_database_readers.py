@@ -0,0 +1,72 @@
+import numpy as np
+
+from mappero.utils.colmap.database import COLMAPDatabase, image_ids_to_pair_id
+
+
+def _database(path, num_images=5, seed=0):
+    """database with keypoints of varying counts, one image without any, and a few pairs."""
+    rng = np.random.default_rng(seed)
+    db = COLMAPDatabase.connect(path)
+    db.create_tables()
+    camera_id = db.add_camera(0, 640, 480, [500, 320, 240])
+    keypoints = {}
+    for image_id in range(1, num_images + 1):
+        db.add_image(f"{image_id}.jpg", camera_id, image_id=image_id)
+        keypoints[image_id] = rng.random((0 if image_id == 3 else 2 * image_id, 4), np.float32)
+        db.add_keypoints(image_id, keypoints[image_id])
+    matches = {(1, 2): rng.integers(0, 4, (3, 2)), (2, 5): rng.integers(0, 4, (5, 2)), (1, 4): np.zeros((0, 2))}
+    for (image_id1, image_id2), pair_matches in matches.items():
+        db.add_matches(image_id1, image_id2, pair_matches)
+        db.add_two_view_geometry(image_id1, image_id2, pair_matches, qvec=[0, 1, 0, 0], tvec=[image_id1, 0, 0])
+    db.commit()
+    return db, keypoints, matches
+
+
+def test_read_keypoints_csr(tmp_path):
+    db, keypoints, _ = _database(tmp_path / "database.db")
+    read = db.read_keypoints()
+    np.testing.assert_array_equal(read.image_ids, [1, 2, 3, 4, 5])
+    for row, image_id in enumerate(read.image_ids.tolist()):
+        np.testing.assert_array_equal(read.data[read.offsets[row] : read.offsets[row + 1]], keypoints[image_id])
+
+    subset = db.read_keypoints([5, 2, 2])
+    np.testing.assert_array_equal(subset.image_ids, [2, 5])
+    np.testing.assert_array_equal(subset.data, np.concatenate([keypoints[2], keypoints[5]]))
+    db.close()
+
+
+def test_read_matches_and_geometries(tmp_path):
+    db, _, matches = _database(tmp_path / "database.db")
+    read = db.read_matches()
+    pairs = sorted(matches, key=lambda pair: image_ids_to_pair_id(*pair))
+    np.testing.assert_array_equal(read.image_ids1, [pair[0] for pair in pairs])
+    np.testing.assert_array_equal(read.image_ids2, [pair[1] for pair in pairs])
+    for row, pair in enumerate(pairs):
+        np.testing.assert_array_equal(read.matches[read.offsets[row] : read.offsets[row + 1]], matches[pair])
+
+    geometries = db.read_two_view_geometries([image_ids_to_pair_id(2, 5)])
+    np.testing.assert_array_equal(geometries.offsets, [0, 5])
+    np.testing.assert_array_equal(geometries.qvecs, [[0, 1, 0, 0]])
+    np.testing.assert_array_equal(geometries.tvecs, [[2, 0, 0]])
+    db.close()
+
+
+def test_iter_batches_match_full_read(tmp_path):
+    db, _, _ = _database(tmp_path / "database.db")
+    full = db.read_keypoints()
+    batches = list(db.iter_keypoints(batch_size=2))
+    assert [len(batch.image_ids) for batch in batches] == [2, 2, 1]
+    np.testing.assert_array_equal(np.concatenate([batch.image_ids for batch in batches]), full.image_ids)
+    np.testing.assert_array_equal(np.concatenate([batch.data for batch in batches]), full.data)
+    assert sum(len(batch.pair_ids) for batch in db.iter_two_view_geometries(batch_size=2)) == 3
+    db.close()
+
+
+def test_read_empty_tables(tmp_path):
+    db = COLMAPDatabase.connect(tmp_path / "database.db")
+    db.create_tables()
+    keypoints = db.read_keypoints()
+    assert keypoints.data.shape == (0, 2) and keypoints.offsets.tolist() == [0]
+    geometries = db.read_two_view_geometries()
+    assert geometries.F.shape == (0, 3, 3) and geometries.matches.shape == (0, 2)
+    db.close()
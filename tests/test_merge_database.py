@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from mappero.tools.merge_database import run_merge
+from mappero.utils.colmap.database import COLMAPDatabase, image_ids_to_pair_id
+
+
+def _session(path, names, camera_params=(500, 320, 240), seed=0):
+    """database of one capture session, all images matched and verified with one camera."""
+    rng = np.random.default_rng(seed)
+    db = COLMAPDatabase.connect(path)
+    db.create_tables()
+    camera_id = db.add_camera(0, 640, 480, camera_params)
+    image_ids = [db.add_image(name, camera_id) for name in names]
+    for image_id in image_ids:
+        db.add_keypoints(image_id, rng.random((10, 2), np.float32))
+    for i, image_id1 in enumerate(image_ids):
+        for image_id2 in image_ids[i + 1 :]:
+            matches = rng.integers(0, 10, (4, 2))
+            db.add_matches(image_id1, image_id2, matches)
+            db.add_two_view_geometry(image_id1, image_id2, matches)
+    db.commit()
+    return db
+
+
+def _names(db):
+    return dict(db.execute("SELECT image_id, name FROM images"))
+
+
+def test_merge_remaps_ids(tmp_path):
+    db = _session(tmp_path / "site.db", ["a.jpg", "b.jpg"])
+    _session(tmp_path / "session.db", ["b.jpg", "c.jpg", "d.jpg"], seed=1).close()
+
+    image_ids = db.merge_database(tmp_path / "session.db", share_cameras=True, name_prefix="s1/")
+    assert sorted(image_ids) == [1, 2, 3] and sorted(image_ids.values()) == [3, 4, 5]
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 1
+
+    # the pairs of the session are appended with the new ids, with their matches unchanged
+    names = _names(db)
+    pairs = db.read_matches(image_ids_to_pair_id(image_ids[2], image_ids[3]))
+    assert (names[pairs.image_ids1[0]], names[pairs.image_ids2[0]]) == ("s1/c.jpg", "s1/d.jpg")
+    source = COLMAPDatabase.connect(tmp_path / "session.db")
+    np.testing.assert_array_equal(pairs.matches, source.read_matches(image_ids_to_pair_id(2, 3)).matches)
+    source.close()
+    assert db.execute("SELECT COUNT(*) FROM two_view_geometries").fetchone()[0] == 1 + 3
+    db.close()
+
+
+def test_merge_duplicates(tmp_path):
+    db = _session(tmp_path / "site.db", ["a.jpg", "b.jpg"])
+    _session(tmp_path / "session.db", ["b.jpg", "c.jpg"], camera_params=(600, 320, 240)).close()
+
+    with pytest.raises(ValueError, match="already in the database"):
+        db.merge_database(tmp_path / "session.db", on_duplicate="error")
+    assert sorted(_names(db).values()) == ["a.jpg", "b.jpg"]
+
+    # b.jpg and its pair are skipped, a different camera is appended even when shared
+    image_ids = db.merge_database(tmp_path / "session.db", share_cameras=True)
+    assert list(image_ids) == [2]
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 2
+    assert db.execute("SELECT COUNT(*) FROM matches").fetchone()[0] == 1
+    db.close()
+
+
+def test_incremental_pairs_skip_matched_and_verified_pairs(tmp_path):
+    db = _session(tmp_path / "site.db", ["a.jpg", "b.jpg", "c.jpg"])
+    camera_id = db.execute("SELECT MIN(camera_id) FROM cameras").fetchone()[0]
+    new_ids = [db.add_image(name, camera_id) for name in ("d.jpg", "e.jpg")]
+    db.add_matches(1, new_ids[0], np.zeros((1, 2)))
+    # a pair whose matches were deleted as unverified, it stays in two_view_geometries
+    db.add_two_view_geometry(2, new_ids[0], np.zeros((0, 2)))
+
+    pairs = {
+        (int(a), int(b))
+        for image_ids1, image_ids2 in db.incremental_pairs(new_ids)
+        for a, b in zip(image_ids1, image_ids2)
+    }
+    d, e = new_ids
+    assert pairs == {(d, 3), (d, e), (e, 1), (e, 2), (e, 3)}
+    db.close()
+
+
+def test_run_merge_writes_pairs(tmp_path):
+    _session(tmp_path / "site.db", ["a.jpg", "b.jpg"]).close()
+    _session(tmp_path / "session.db", ["c.jpg"]).close()
+    result = CliRunner().invoke(run_merge, [str(tmp_path / "site.db"), str(tmp_path / "session.db")])
+    assert result.exit_code == 0, result.output
+    lines = (tmp_path / "incremental_pairs.txt").read_text().splitlines()
+    assert sorted(lines) == ["c.jpg a.jpg", "c.jpg b.jpg"]
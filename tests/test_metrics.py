@@ -0,0 +1,76 @@
+import json
+import sys
+
+import pytest
+
+from mappero.utils.metrics import MetricsRecorder, record_command, save_metrics
+from mappero.utils.process import CommandResult, run_command
+from mappero.utils.progress import ProgressEvent
+from mappero.utils.sampler import ResourceSample
+
+
+def _result(start_time, wall_time, samples=None, progress=None):
+    return CommandResult(
+        cmd=["colmap"],
+        returncode=0,
+        start_time=start_time,
+        wall_time=wall_time,
+        user_time=1.0,
+        system_time=0.5,
+        max_rss=1024**2,
+        read_bytes=10,
+        write_bytes=20,
+        samples=samples,
+        progress=progress,
+    )
+
+
+def test_recorder_collects_commands_within_its_block():
+    record_command("before", _result(0.0, 1.0))
+    with MetricsRecorder("run") as metrics:
+        run_command([sys.executable, "-c", "pass"], {})
+        progress = [ProgressEvent(1.0, "images", 5, 10, 2.0, 2.5), ProgressEvent(2.0, "images", 10, 10, 2.5, 0.0)]
+        record_command("extract", _result(metrics.start_time + 1, 2.0, progress=progress))
+    record_command("after", _result(0.0, 1.0))
+
+    stages = metrics.to_dict()["stages"]
+    assert [stage["stage"] for stage in stages] == ["python -c", "extract"]
+    assert stages[0]["returncode"] == 0 and stages[0]["wall_time"] > 0
+    # progress is stored by column, with the last rate of each kind as the throughput
+    assert stages[1]["progress"]["current"] == [5, 10]
+    assert stages[1]["throughput"] == {"images": 2.5}
+
+
+def test_save_appends_runs(tmp_path):
+    for name in ("first", "second"):
+        with MetricsRecorder(name) as metrics:
+            record_command("match", _result(metrics.start_time, 1.0))
+        save_metrics(metrics, tmp_path)
+    runs = json.loads((tmp_path / "metrics.json").read_text())["runs"]
+    assert [run["name"] for run in runs] == ["first", "second"]
+
+    # an unreadable file is overwritten
+    (tmp_path / "metrics.json").write_text("{")
+    save_metrics(metrics, tmp_path)
+    assert len(json.loads((tmp_path / "metrics.json").read_text())["runs"]) == 1
+    assert not (tmp_path / "trace.json").exists()
+
+
+def test_chrome_trace_lanes_and_counters(tmp_path):
+    with MetricsRecorder("run") as metrics:
+        start = metrics.start_time
+        samples = [ResourceSample(start + 0.5, 100.0, 2 * 1024**2, 4, 0.0, 0.0)]
+        record_command("a", _result(start, 2.0, samples=samples))
+        # overlaps a, then starts after it ended
+        record_command("b", _result(start + 1, 2.0))
+        record_command("c", _result(start + 2, 1.0))
+    save_metrics(metrics, tmp_path, trace=True)
+
+    events = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+    lanes = {event["name"]: event["tid"] for event in events if event["ph"] == "X"}
+    assert lanes == {"a": 0, "b": 1, "c": 0}
+    counters = [event for event in events if event["ph"] == "C"]
+    assert [(event["name"], event["args"]) for event in counters] == [
+        ("a resources", {"cpu_percent": 100.0, "rss_mib": 2.0, "num_threads": 4})
+    ]
+    assert counters[0]["ts"] == pytest.approx(0.5e6)
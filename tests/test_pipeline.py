@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+from omegaconf import OmegaConf
+
+from mappero.modules import colmap
+from mappero.pipeline.pipeline import Pipeline
+from mappero.utils.colmap.database import COLMAPDatabase
+
+
+def _fake_feature_extraction(config, image_path, database_path, image_list_path=None, num_threads=None):
+    # like colmap, images already in the database are skipped
+    db = COLMAPDatabase.connect(database_path)
+    db.create_tables()
+    existing = {name for (name,) in db.execute("SELECT name FROM images")}
+    camera_id = db.add_camera(0, 640, 480, [500, 320, 240])
+    for path in sorted(image_path.iterdir()):
+        if path.name not in existing:
+            image_id = db.add_image(path.name, camera_id)
+            db.add_keypoints(image_id, np.zeros((config.feature_extraction.max_num_features, 2), np.float32))
+    db.commit()
+    db.close()
+
+
+def _fake_matcher(config, database_path, num_threads=None):
+    # like colmap, pairs already in the database are skipped
+    db = COLMAPDatabase.connect(database_path)
+    image_ids = [image_id for (image_id,) in db.execute("SELECT image_id FROM images")]
+    for image_ids1, image_ids2 in db.incremental_pairs(image_ids):
+        for image_id1, image_id2 in zip(image_ids1.tolist(), image_ids2.tolist()):
+            db.add_matches(image_id1, image_id2, np.zeros((1, 2), np.uint32))
+    db.commit()
+    db.close()
+
+
+def _fake_mapper(database_path, image_path, output_path, num_threads=None):
+    db = COLMAPDatabase.connect(database_path)
+    num_matches = db.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+    db.close()
+    (output_path / "0").mkdir(parents=True, exist_ok=True)
+    (output_path / "0" / "num_matches.txt").write_text(str(num_matches))
+
+
+def _run_sfm(workspace_path, max_num_features, **kwargs):
+    config = OmegaConf.create({"feature_extraction": {"single_camera": True, "max_num_features": max_num_features}})
+    return colmap.run_sfm(
+        config, workspace_path / "images", workspace_path / "database.db", workspace_path / "sparse", **kwargs
+    )
+
+
+def _keypoints_rows(database_path):
+    db = COLMAPDatabase.connect(database_path)
+    rows = [rows for (rows,) in db.execute("SELECT rows FROM keypoints")]
+    db.close()
+    return rows
+
+
+def _workspace(tmp_path, monkeypatch, num_images=3):
+    monkeypatch.setattr(colmap, "feature_extraction", _fake_feature_extraction)
+    monkeypatch.setattr(colmap, "matcher", _fake_matcher)
+    monkeypatch.setattr(colmap, "mapper", _fake_mapper)
+    (tmp_path / "images").mkdir()
+    for i in range(num_images):
+        (tmp_path / "images" / f"{i}.jpg").write_bytes(bytes([i]))
+    (tmp_path / "sparse").mkdir()
+    return tmp_path
+
+
+def test_config_change_reruns_with_new_outputs(tmp_path, monkeypatch):
+    workspace_path = _workspace(tmp_path, monkeypatch)
+    assert set(_run_sfm(workspace_path, 10).values()) == {"ran"}
+    assert _keypoints_rows(workspace_path / "database.db") == [10, 10, 10]
+
+    # the database is cleared, the extractor would otherwise keep the features of the previous config
+    assert set(_run_sfm(workspace_path, 20).values()) == {"ran"}
+    assert _keypoints_rows(workspace_path / "database.db") == [20, 20, 20]
+    assert (workspace_path / "sparse" / "0" / "num_matches.txt").read_text() == "3"
+
+
+def test_forced_stages_clear_their_outputs(tmp_path, monkeypatch):
+    workspace_path = _workspace(tmp_path, monkeypatch)
+    _run_sfm(workspace_path, 10)
+    (workspace_path / "sparse" / "stale.txt").write_text("")
+
+    statuses = _run_sfm(workspace_path, 10, force=["matcher"])
+    assert statuses == {"feature_extraction": "skipped", "matcher": "ran", "mapper": "ran"}
+    assert (workspace_path / "sparse" / "0" / "num_matches.txt").read_text() == "3"
+    assert not (workspace_path / "sparse" / "stale.txt").exists()
+
+
+def test_edited_database_reruns_the_matcher(tmp_path, monkeypatch):
+    workspace_path = _workspace(tmp_path, monkeypatch)
+    _run_sfm(workspace_path, 10)
+    assert set(_run_sfm(workspace_path, 10).values()) == {"skipped"}
+
+    # as mappero-prune-db does, outside of the pipeline
+    db = COLMAPDatabase.connect(workspace_path / "database.db")
+    db.execute("DELETE FROM matches WHERE pair_id = (SELECT MIN(pair_id) FROM matches)")
+    db.commit()
+    db.close()
+    statuses = _run_sfm(workspace_path, 10)
+    assert statuses == {"feature_extraction": "skipped", "matcher": "ran", "mapper": "ran"}
+    assert (workspace_path / "sparse" / "0" / "num_matches.txt").read_text() == "3"
+
+
+def _pipeline(tmp_path, calls, fail=None):
+    """a -> b -> c, each stage appending its input to its output file, `fail` raising midway."""
+
+    def stage(name, input_path, output_path):
+        def run():
+            calls.append(name)
+            output_path.write_text(input_path.read_text() + name)
+            if name == fail:
+                raise KeyboardInterrupt
+
+        def clear():
+            calls.append(f"clear {name}")
+            output_path.unlink(missing_ok=True)
+
+        pipeline.add(name, run, inputs=[input_path], outputs=[output_path], config={"stage": name}, clear=clear)
+
+    pipeline = Pipeline(tmp_path / "pipeline_state.json")
+    paths = [tmp_path / f"{name}.txt" for name in ("input", "a", "b", "c")]
+    for name, input_path, output_path in zip("abc", paths, paths[1:]):
+        stage(name, input_path, output_path)
+    return pipeline
+
+
+def test_pipeline_skips_up_to_date_stages(tmp_path):
+    (tmp_path / "input.txt").write_text("0")
+    calls = []
+    assert _pipeline(tmp_path, calls).run() == {"a": "ran", "b": "ran", "c": "ran"}
+    assert _pipeline(tmp_path, calls).dependencies() == {"a": [], "b": ["a"], "c": ["b"]}
+    assert _pipeline(tmp_path, calls).run() == {"a": "skipped", "b": "skipped", "c": "skipped"}
+    assert calls == ["a", "b", "c"]
+
+    # a changed input runs the stage and its dependents, after clearing their outputs
+    (tmp_path / "input.txt").write_text("1")
+    calls.clear()
+    assert _pipeline(tmp_path, calls).run() == {"a": "ran", "b": "ran", "c": "ran"}
+    assert calls == ["clear a", "a", "clear b", "b", "clear c", "c"]
+    assert (tmp_path / "c.txt").read_text() == "1abc"
+
+    # a missing output runs its stage again
+    (tmp_path / "c.txt").unlink()
+    calls.clear()
+    assert _pipeline(tmp_path, calls).run()["c"] == "ran"
+    assert calls == ["clear c", "c"]
+
+
+def test_pipeline_resumes_interrupted_stage(tmp_path):
+    (tmp_path / "input.txt").write_text("0")
+    calls = []
+    with pytest.raises(KeyboardInterrupt):
+        _pipeline(tmp_path, calls, fail="b").run()
+    assert calls == ["a", "b"]
+
+    # the partial outputs of the interrupted stage are kept for it to resume from
+    calls.clear()
+    assert _pipeline(tmp_path, calls).run() == {"a": "skipped", "b": "ran", "c": "ran"}
+    assert calls == ["b", "c"]
+
+
+def test_pipeline_force(tmp_path):
+    (tmp_path / "input.txt").write_text("0")
+    calls = []
+    _pipeline(tmp_path, calls).run()
+    calls.clear()
+    assert _pipeline(tmp_path, calls).run(force=["b"]) == {"a": "skipped", "b": "ran", "c": "ran"}
+    assert calls == ["clear b", "b", "clear c", "c"]
+    assert set(_pipeline(tmp_path, calls).run(force=True).values()) == {"ran"}
+
+    with pytest.raises(ValueError, match="unknown stages"):
+        _pipeline(tmp_path, calls).run(force=["d"])
+    with pytest.raises(ValueError, match="duplicate stage name"):
+        _pipeline(tmp_path, calls).add("a", print)
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from mappero.utils.process import CommandRunner, run_command
+
+
+def _python(code, *args):
+    return [sys.executable, "-c", code, *map(str, args)]
+
+
+def test_timeout_terminates_the_command(tmp_path):
+    # the child of the command is in its group and is stopped with it
+    code = (
+        "import subprocess, sys, time; "
+        "open(sys.argv[1], 'w').write(str(subprocess.Popen(['sleep', '30']).pid)); time.sleep(30)"
+    )
+    start = time.perf_counter()
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(CommandRunner().run(_python(code, tmp_path / "started"), timeout=1.0))
+    assert time.perf_counter() - start < 10
+    pid = (tmp_path / "started").read_text()
+    # the orphaned child is killed, at most left as a zombie
+    stat_path = Path(f"/proc/{pid}/stat")
+    assert not stat_path.exists() or stat_path.read_text().split()[2] == "Z"
+
+
+def test_failed_command():
+    runner = CommandRunner()
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(runner.run(_python("raise SystemExit(3)")))
+    result = asyncio.run(runner.run(_python("raise SystemExit(3)"), check=False))
+    assert result.returncode == 3 and result.wall_time > 0
+
+
+def test_thread_budget_serializes_commands():
+    runner = CommandRunner(max_concurrency=3, num_threads=2)
+    commands = [(_python("import time; time.sleep(0.3)"), None)] * 3
+    results = asyncio.run(runner.run_all(commands, threads=2))
+    intervals = sorted((result.start_time, result.start_time + result.wall_time) for result in results)
+    # each command takes the whole budget, none of them overlap
+    assert all(end <= next_start + 0.05 for (_, end), (next_start, _) in zip(intervals, intervals[1:]))
+
+
+def test_run_command_pins_cpus(tmp_path):
+    code = "import os, sys; open(sys.argv[1], 'w').write(str(sorted(os.sched_getaffinity(0))))"
+    cpus = sorted(os.sched_getaffinity(0))
+    run_command(_python(code, tmp_path / "pinned"), {}, pin_threads=1)
+    assert (tmp_path / "pinned").read_text() == str(cpus[:1])
+
+    # more cpus than there are, the command runs unpinned
+    run_command(_python(code, tmp_path / "unpinned"), {}, pin_threads=len(cpus) + 1)
+    assert (tmp_path / "unpinned").read_text() == str(cpus)
@@ -0,0 +1,56 @@
+import pytest
+
+from mappero.utils.progress import ProgressParser, block_size_option
+
+
+def test_rate_and_eta():
+    parser = ProgressParser("feature_extractor")
+    first = parser.parse("I1017 12:00:00 Processed file [1/11]", now=100.0)
+    assert (first.kind, first.current, first.total, first.rate, first.eta) == ("images", 1, 11, None, None)
+    event = parser.parse("Processed file [6/11]", now=110.0)
+    assert event.rate == 0.5 and event.eta == 10.0
+    assert parser.parse("Elapsed time: 1.2 [minutes]", now=111.0) is None
+
+
+def test_rate_restarts_when_the_counter_goes_back():
+    parser = ProgressParser("sequential_matcher")
+    parser.parse("Matching image [5/10]", now=0.0)
+    parser.parse("Matching image [10/10]", now=5.0)
+    # a second pass of the matcher
+    assert parser.parse("Matching image [1/10]", now=6.0).rate is None
+    assert parser.parse("Matching image [3/10]", now=7.0).rate == 2.0
+
+
+@pytest.mark.parametrize("block_size", [None, 25, 10])
+def test_exhaustive_blocks_counted_in_pairs(block_size):
+    # 100 images in full blocks, the last block reports all pairs
+    size = block_size or 50
+    num_blocks = 100 // size
+    parser = ProgressParser("exhaustive_matcher", block_size=block_size)
+    event = parser.parse(f"Matching block [{num_blocks}/{num_blocks}, {num_blocks}/{num_blocks}]", now=0.0)
+    assert (event.kind, event.current, event.total) == ("pairs", 4950, 4950)
+    # the first block, below the diagonal, has the pairs within itself
+    event = parser.parse(f"Matching block [1/{num_blocks}, 1/{num_blocks}]", now=1.0)
+    assert event.current == size * (size - 1) // 2
+
+
+def test_bundle_adjustment_iterations_accumulate():
+    parser = ProgressParser("mapper")
+    parser.parse("Iterations : 12", now=0.0)
+    event = parser.parse("I1017 12:00:00.0 bundle_adjustment.cc:42]   Iterations : 8", now=1.0)
+    assert (event.kind, event.current, event.total) == ("ba_iterations", 20, None)
+    assert parser.parse("Registering image #31 (4)", now=2.0).current == 4
+
+
+def test_feed_records_at_the_interval():
+    parser = ProgressParser("fusion", log_interval=0.0, record_interval=3600.0)
+    lines = [f"Fusing image [{i}/5]" for i in range(1, 6)]
+    for line in lines:
+        parser.feed(line)
+    # the first event and the last one seen
+    assert [event.current for event in parser.finish()] == [1, 5]
+
+
+def test_block_size_option():
+    assert block_size_option(["colmap", "exhaustive_matcher", "--ExhaustiveMatching.block_size", "20"]) == 20
+    assert block_size_option(["colmap", "exhaustive_matcher", "--block_size_hint", "20"]) is None
@@ -0,0 +1,70 @@
+import numpy as np
+from click.testing import CliRunner
+
+from mappero.tools.prune_database import database_size, run_prune
+from mappero.utils.colmap.database import COLMAPDatabase, image_ids_to_pair_id
+
+
+def _database(path, num_images=4):
+    """images sharing a camera but the last one, all pairs matched, pairs with image 1 verified."""
+    rng = np.random.default_rng(0)
+    db = COLMAPDatabase.connect(path)
+    db.create_tables()
+    shared_camera_id = db.add_camera(0, 640, 480, [500, 320, 240])
+    own_camera_id = db.add_camera(0, 320, 240, [250, 160, 120])
+    for image_id in range(1, num_images + 1):
+        db.add_image(
+            f"{image_id}.jpg", own_camera_id if image_id == num_images else shared_camera_id, image_id=image_id
+        )
+        db.add_keypoints(image_id, rng.random((1000, 2), np.float32))
+        db.add_descriptors(image_id, rng.integers(0, 256, (1000, 128)).astype(np.uint8))
+    for image_id1 in range(1, num_images + 1):
+        for image_id2 in range(image_id1 + 1, num_images + 1):
+            db.add_matches(image_id1, image_id2, rng.integers(0, 1000, (100, 2)))
+            if image_id1 == 1:
+                db.add_two_view_geometry(image_id1, image_id2, rng.integers(0, 1000, (50, 2)))
+    db.commit()
+    return db
+
+
+def _count(db, table):
+    return db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_delete_unverified_matches(tmp_path):
+    db = _database(tmp_path / "database.db")
+    # a verified pair without inliers counts as unverified
+    db.add_two_view_geometry(2, 3, np.zeros((0, 2)))
+    assert db.delete_unverified_matches() == 3
+    kept = [pair_id for (pair_id,) in db.execute("SELECT pair_id FROM matches ORDER BY pair_id")]
+    assert kept == [image_ids_to_pair_id(1, image_id) for image_id in (2, 3, 4)]
+    db.close()
+
+
+def test_delete_images_not_in(tmp_path):
+    db = _database(tmp_path / "database.db")
+    assert db.delete_images_not_in(["1.jpg", "2.jpg", "3.jpg"]) == 1
+    assert sorted(name for (name,) in db.execute("SELECT name FROM images")) == ["1.jpg", "2.jpg", "3.jpg"]
+    assert _count(db, "keypoints") == _count(db, "descriptors") == 3
+    assert _count(db, "matches") == 3 and _count(db, "two_view_geometries") == 2
+    # the camera used only by the deleted image is deleted with it
+    assert _count(db, "cameras") == 1
+    db.close()
+
+
+def test_run_prune_reclaims_space(tmp_path):
+    database_path = tmp_path / "database.db"
+    _database(database_path).close()
+    (tmp_path / "images.txt").write_text("1.jpg\n2.jpg\n\n")
+    size_before = database_size(database_path)
+
+    result = CliRunner().invoke(
+        run_prune, [str(database_path), "--drop_descriptors", "--image_list", str(tmp_path / "images.txt")]
+    )
+    assert result.exit_code == 0, result.output
+    assert database_size(database_path) < size_before / 2
+
+    db = COLMAPDatabase.connect(database_path)
+    assert _count(db, "images") == 2 and _count(db, "descriptors") == 0
+    assert [pair_id for (pair_id,) in db.execute("SELECT pair_id FROM matches")] == [image_ids_to_pair_id(1, 2)]
+    db.close()
@@ -0,0 +1,84 @@
+import numpy as np
+
+from mappero.utils.colmap.read_write_model import (
+    ImagesArrays,
+    Points3DArrays,
+    _scan_points3D_binary,
+    read_images_binary_arrays,
+    read_model,
+    write_images_binary,
+    write_points3D_binary,
+)
+
+
+def _points3D_arrays(track_lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    num_points = len(track_lengths)
+    track_offsets = np.zeros(num_points + 1, np.int64)
+    np.cumsum(track_lengths, out=track_offsets[1:])
+    return Points3DArrays(
+        ids=np.arange(1, num_points + 1),
+        xyz=rng.normal(size=(num_points, 3)),
+        rgb=rng.integers(0, 256, (num_points, 3)).astype(np.uint8),
+        error=rng.random(num_points),
+        track_offsets=track_offsets,
+        track_image_ids=rng.integers(1, 4, track_offsets[-1]).astype(np.int32),
+        track_point2D_idxs=rng.integers(0, 100, track_offsets[-1]).astype(np.int32),
+    )
+
+
+def _images_arrays(names, seed=0):
+    rng = np.random.default_rng(seed)
+    num_images = len(names)
+    point2D_offsets = np.zeros(num_images + 1, np.int64)
+    np.cumsum(rng.integers(0, 20, num_images), out=point2D_offsets[1:])
+    return ImagesArrays(
+        ids=np.arange(1, num_images + 1, dtype=np.int32),
+        qvecs=rng.normal(size=(num_images, 4)),
+        tvecs=rng.normal(size=(num_images, 3)),
+        camera_ids=np.ones(num_images, np.int32),
+        names=np.array(names, dtype=str),
+        point2D_offsets=point2D_offsets,
+        xys=rng.uniform(0, 640, (point2D_offsets[-1], 2)),
+        point3D_ids=rng.integers(-1, 10, point2D_offsets[-1]),
+    )
+
+
+def test_scan_points3D_binary_across_windows(tmp_path):
+    # empty tracks, and tracks longer than a window
+    track_lengths = np.tile([0, 1, 3, 40, 2], 20)
+    points3D = _points3D_arrays(track_lengths)
+    path = tmp_path / "points3D.bin"
+    write_points3D_binary(points3D, path)
+    buffer = path.read_bytes()
+
+    expected_starts = 8 + np.concatenate([[0], np.cumsum(51 + 8 * track_lengths)[:-1]])
+    for window_size in (64, 200, 1 << 20):
+        starts, lengths, end = _scan_points3D_binary(buffer, 8, len(track_lengths), window_size)
+        np.testing.assert_array_equal(starts, expected_starts)
+        np.testing.assert_array_equal(lengths, track_lengths)
+        assert end == len(buffer)
+
+
+def test_read_images_binary_arrays_names(tmp_path):
+    images = _images_arrays(["a.jpg", "séquence/ü_0001.jpg", "b"])
+    path = tmp_path / "images.bin"
+    write_images_binary(images, path)
+    read = read_images_binary_arrays(path)
+    for field, expected in zip(ImagesArrays._fields, images):
+        np.testing.assert_array_equal(getattr(read, field), expected)
+
+
+def test_read_model_record_types(tmp_path):
+    write_points3D_binary(_points3D_arrays([2, 3]), tmp_path / "points3D.bin")
+    write_images_binary(_images_arrays(["a.jpg", "b.jpg"]), tmp_path / "images.bin")
+    (tmp_path / "cameras.bin").write_bytes(np.zeros(1, np.uint64).tobytes())
+    _, images, points3D = read_model(str(tmp_path), ".bin")
+
+    point3D = points3D[1]
+    assert isinstance(point3D.id, int) and isinstance(point3D.error, float)
+    assert point3D.rgb.dtype == np.int64
+    assert point3D.image_ids.dtype == np.int64 and point3D.point2D_idxs.dtype == np.int64
+    image = images[1]
+    assert isinstance(image.id, int) and isinstance(image.camera_id, int) and isinstance(image.name, str)
+    assert image.xys.dtype == np.float64 and image.xys.shape[1] == 2 and image.point3D_ids.dtype == np.int64
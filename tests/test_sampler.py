@@ -0,0 +1,70 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+
+import pytest
+from loguru import logger
+
+from mappero.utils.process import CommandRunner
+from mappero.utils.sampler import ResourceSampler, parse_size
+
+# allocates about 200 MiB, then waits
+_ALLOCATE = "import time; data = bytearray(200 * 1024**2); time.sleep(30)"
+
+
+@pytest.mark.parametrize(
+    "size, expected",
+    [
+        (None, None),
+        (1000, 1000),
+        ("512", 512),
+        ("512M", 512 * 1024**2),
+        ("1.5 GiB", 3 * 1024**3 // 2),
+        ("16g", 16 << 30),
+    ],
+)
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
+
+
+def test_parse_invalid_size():
+    with pytest.raises(ValueError, match="invalid size"):
+        parse_size("16 gigabytes")
+
+
+def test_sampler_reads_the_process_group():
+    process = subprocess.Popen([sys.executable, "-c", _ALLOCATE], start_new_session=True)
+    try:
+        sampler = ResourceSampler(process.pid)
+        # wait for the allocation
+        while sampler.sample().rss < 200 * 1024**2:
+            assert process.poll() is None
+        sample = sampler.sample()
+        assert sample.num_threads >= 1 and sample.cpu_percent >= 0
+        assert len(sampler.samples) >= 2
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+
+def test_hard_memory_limit_terminates_the_command():
+    runner = CommandRunner(sample_interval=0.1, hard_memory_limit="100M")
+    result = asyncio.run(runner.run([sys.executable, "-c", _ALLOCATE], check=False))
+    assert result.returncode == -signal.SIGTERM
+    assert result.wall_time < 10
+    assert max(sample.rss for sample in result.samples) > 100 * 1024**2
+
+
+def test_soft_memory_limit_warns_once():
+    warnings = []
+    sink = logger.add(warnings.append, level="WARNING", filter=lambda record: "soft limit" in record["message"])
+    try:
+        code = "import time; data = bytearray(200 * 1024**2); time.sleep(1)"
+        runner = CommandRunner(sample_interval=0.1, soft_memory_limit="100M")
+        result = asyncio.run(runner.run([sys.executable, "-c", code]))
+    finally:
+        logger.remove(sink)
+    assert result.returncode == 0
+    assert len(warnings) == 1
@@ -0,0 +1,79 @@
+import types
+
+import numpy as np
+import pytest
+from omegaconf import OmegaConf
+
+from mappero.modules import colmap
+from mappero.utils.colmap.database import COLMAPDatabase
+
+
+def _extract_shard(params):
+    # like colmap, each shard estimates its own camera
+    db = COLMAPDatabase.connect(params["database_path"])
+    db.create_tables()
+    camera_id = db.add_camera(2, 640, 480, [500, 320, 240, 0.01])
+    with open(params["image_list_path"]) as f:
+        for name in f.read().split():
+            image_id = db.add_image(name, camera_id)
+            db.add_keypoints(image_id, np.full((3, 2), image_id, np.float32))
+    db.commit()
+    db.close()
+
+
+class _FakeRunner:
+    def __init__(self, max_concurrency=None, num_threads=None):
+        self.num_threads = num_threads
+
+    async def run_all(self, commands, threads=1):
+        assert threads * len(commands) <= self.num_threads
+        for _, params in commands:
+            _extract_shard(params)
+        return [types.SimpleNamespace(wall_time=0.0) for _ in commands]
+
+
+def _extract(tmp_path, monkeypatch, names, single_camera, num_shards=3):
+    monkeypatch.setattr(colmap, "CommandRunner", _FakeRunner)
+    config = OmegaConf.create(
+        {"feature_extraction": {"single_camera": single_camera, "max_image_size": 100, "max_num_features": 10}}
+    )
+    image_list_path = tmp_path / "images.txt"
+    image_list_path.write_text("\n".join(names) + "\n")
+    database_path = tmp_path / "database.db"
+    colmap.sharded_feature_extraction(
+        config, tmp_path, database_path, image_list_path, num_shards=num_shards, num_threads=6
+    )
+    return COLMAPDatabase.connect(database_path)
+
+
+@pytest.mark.parametrize("single_camera", [True, False])
+def test_sharded_extraction_merges_shards(tmp_path, monkeypatch, single_camera):
+    names = [f"{i}.jpg" for i in range(7)]
+    db = _extract(tmp_path, monkeypatch, names, single_camera)
+    assert sorted(name for (name,) in db.execute("SELECT name FROM images")) == names
+    # a single camera is shared by the images of all shards, otherwise each shard keeps its own
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == (1 if single_camera else 3)
+    assert db.execute("SELECT COUNT(DISTINCT camera_id) FROM images").fetchone()[0] == (1 if single_camera else 3)
+    assert db.execute("SELECT COUNT(*) FROM keypoints").fetchone()[0] == 7
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    db.close()
+
+
+def test_sharded_extraction_skips_existing_images(tmp_path, monkeypatch):
+    _extract(tmp_path, monkeypatch, ["a.jpg", "b.jpg"], True, num_shards=2).close()
+    db = _extract(tmp_path, monkeypatch, ["a.jpg", "b.jpg", "c.jpg", "d.jpg"], True, num_shards=2)
+    assert sorted(name for (name,) in db.execute("SELECT name FROM images")) == ["a.jpg", "b.jpg", "c.jpg", "d.jpg"]
+    assert db.execute("SELECT COUNT(*) FROM cameras").fetchone()[0] == 1
+    db.close()
+
+
+def test_merge_database_into_unknown_camera(tmp_path):
+    shard_path = tmp_path / "shard.db"
+    (tmp_path / "shard.txt").write_text("a.jpg\n")
+    _extract_shard({"database_path": str(shard_path), "image_list_path": str(tmp_path / "shard.txt")})
+    db = COLMAPDatabase.connect(tmp_path / "database.db")
+    db.create_tables()
+    with pytest.raises(ValueError, match="unknown camera id"):
+        db.merge_database(shard_path, camera_id=1)
+    assert db.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 0
+    db.close()
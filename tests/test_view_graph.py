@@ -0,0 +1,61 @@
+import numpy as np
+
+from mappero.utils.colmap.database import (
+    MAX_IMAGE_ID,
+    COLMAPDatabase,
+    image_ids_to_pair_id,
+    image_ids_to_pair_ids,
+    pair_id_to_image_ids,
+    pair_ids_to_image_ids,
+)
+from mappero.utils.colmap.view_graph import ViewGraph
+
+
+def test_pair_ids_match_scalar_encoding():
+    rng = np.random.default_rng(0)
+    image_ids1 = np.concatenate([rng.integers(1, MAX_IMAGE_ID, 100), [1, MAX_IMAGE_ID - 1]])
+    image_ids2 = np.concatenate([rng.integers(1, MAX_IMAGE_ID, 100), [MAX_IMAGE_ID - 1, 1]])
+    pair_ids = image_ids_to_pair_ids(image_ids1, image_ids2)
+    assert pair_ids.tolist() == [image_ids_to_pair_id(int(a), int(b)) for a, b in zip(image_ids1, image_ids2)]
+
+    # decoded in ascending order, whatever the order of the pair
+    decoded1, decoded2 = pair_ids_to_image_ids(pair_ids)
+    np.testing.assert_array_equal(decoded1, np.minimum(image_ids1, image_ids2))
+    np.testing.assert_array_equal(decoded2, np.maximum(image_ids1, image_ids2))
+    assert [pair_id_to_image_ids(int(pair_id)) for pair_id in pair_ids[:5]] == list(
+        zip(decoded1[:5].tolist(), decoded2[:5].tolist())
+    )
+
+
+def test_view_graph_components_and_degrees():
+    # two triangles, a pair and an isolated image
+    graph = ViewGraph([1, 2, 1, 10, 11, 10, 20], [2, 3, 3, 11, 12, 12, 21], [5, 6, 7, 1, 1, 1, 9], image_ids=[30])
+    np.testing.assert_array_equal(graph.image_ids, [1, 2, 3, 10, 11, 12, 20, 21, 30])
+    assert graph.num_edges == 7
+    np.testing.assert_array_equal(graph.degrees, [2, 2, 2, 2, 2, 2, 1, 1, 0])
+    np.testing.assert_array_equal(graph.weighted_degrees[:3], [12, 11, 13])
+
+    components = graph.connected_components()
+    # numbered by decreasing size, ties in order of appearance
+    np.testing.assert_array_equal(components, [0, 0, 0, 1, 1, 1, 2, 2, 3])
+
+    neighbors, weights = graph.neighbors(3)
+    assert sorted(zip(neighbors.tolist(), weights.tolist())) == [(1, 7), (2, 6)]
+    assert graph.degree_stats()["isolated"] == 1
+
+
+def test_view_graph_from_database(tmp_path):
+    db = COLMAPDatabase.connect(tmp_path / "database.db")
+    db.create_tables()
+    camera_id = db.add_camera(0, 640, 480, [500, 320, 240])
+    for image_id in range(1, 5):
+        db.add_image(f"{image_id}.jpg", camera_id, image_id=image_id)
+    db.add_two_view_geometry(2, 1, np.zeros((20, 2)))
+    db.add_two_view_geometry(2, 3, np.zeros((5, 2)))
+    db.commit()
+    db.close()
+
+    graph = ViewGraph.from_database(tmp_path / "database.db", min_num_inliers=10)
+    np.testing.assert_array_equal(graph.image_ids, [1, 2, 3, 4])
+    np.testing.assert_array_equal(graph.image_ids[graph.edges], [[1, 2]])
+    np.testing.assert_array_equal(graph.edge_weights, [20])